@@ -0,0 +1,181 @@
+# analysis_cache.py
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+import config
+
+# 获取logger
+logger = logging.getLogger(__name__)
+
+# 保护写入和淘汰过程
+_lock = threading.Lock()
+
+# 媒体文件哈希缓存：{路径: (大小, 修改时间, sha256)}，避免重复读取大视频
+_file_hash_memo = {}
+
+def file_sha256(file_path):
+    """
+    计算文件的sha256，文件大小和修改时间不变时直接返回上次的结果
+
+    Returns:
+        str: 十六进制哈希值，文件不存在时返回None
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+
+    memo = _file_hash_memo.get(str(file_path))
+    if memo and memo[0] == stat.st_size and memo[1] == stat.st_mtime:
+        return memo[2]
+
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    sha = digest.hexdigest()
+    _file_hash_memo[str(file_path)] = (stat.st_size, stat.st_mtime, sha)
+    return sha
+
+def text_sha256(text):
+    """计算文本的sha256"""
+    return hashlib.sha256((text or "").encode('utf-8')).hexdigest()
+
+def make_cache_key(post, system_prompt_text, model_name, generation_params=None, prompt_hash=None):
+    """
+    根据帖子内容、媒体文件内容、提示词、模型和生成参数计算缓存键
+
+    不包含contentID：内容完全相同的帖子（例如转发）共用同一份分析结果。
+
+    Args:
+        post (dict): 帖子数据（text, url, images, videos）
+        system_prompt_text (str): 系统提示词
+        model_name (str): 模型名称
+        generation_params (dict, optional): 影响输出的生成参数
+        prompt_hash (str, optional): 提示词内容的sha256（提示词注册表已计算好时传入，避免重复计算）
+
+    Returns:
+        str: 缓存键
+    """
+    images = post.get('images') if isinstance(post.get('images'), list) else []
+    video = post.get('videos') if isinstance(post.get('videos'), str) else None
+
+    key_material = {
+        "text": post.get('text'),
+        "url": post.get('url'),
+        "images": [file_sha256(path) or path for path in images if path],
+        "video": (file_sha256(video) or video) if video else None,
+        "prompt": prompt_hash or text_sha256(system_prompt_text),
+        "model": model_name,
+        "params": generation_params or {},
+    }
+    serialized = json.dumps(key_material, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+def _entry_path(cache_key):
+    return config.ANALYSIS_CACHE_DIR / f"{cache_key}.json"
+
+def get(cache_key):
+    """
+    读取缓存的分析结果
+
+    Returns:
+        dict: 分析结果，未命中或已过期时返回None
+    """
+    path = _entry_path(cache_key)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"读取分析缓存失败，忽略该条目: {path}, 错误: {e}")
+        return None
+
+    ttl_seconds = config.ANALYSIS_CACHE_TTL_HOURS * 3600
+    if ttl_seconds > 0 and time.time() - entry.get('created_at', 0) > ttl_seconds:
+        logger.info(f"分析缓存已过期: {cache_key[:12]}")
+        try:
+            path.unlink()
+        except OSError:
+            pass
+        return None
+
+    # 更新访问时间，淘汰时按最近使用排序
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+    return entry.get('result')
+
+def put(cache_key, result, model_name=None):
+    """写入分析结果并按容量淘汰旧条目"""
+    entry = {
+        "created_at": time.time(),
+        "model": model_name,
+        "result": result,
+    }
+    path = _entry_path(cache_key)
+    tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+    with _lock:
+        try:
+            config.ANALYSIS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"写入分析缓存失败: {e}")
+            return
+        _evict_locked()
+
+def _evict_locked():
+    """删除过期条目，并在总大小超过上限时按最近使用时间淘汰"""
+    ttl_seconds = config.ANALYSIS_CACHE_TTL_HOURS * 3600
+    max_bytes = config.ANALYSIS_CACHE_MAX_MB * 1024 * 1024
+    now = time.time()
+
+    entries = []
+    for path in config.ANALYSIS_CACHE_DIR.glob("*.json"):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total_size = 0
+    alive = []
+    for mtime, size, path in entries:
+        # 最近访问时间不早于创建时间，距今超过TTL的条目必然已过期
+        if ttl_seconds > 0 and now - mtime > ttl_seconds:
+            _remove(path)
+            continue
+        alive.append((mtime, size, path))
+        total_size += size
+
+    if max_bytes <= 0 or total_size <= max_bytes:
+        return
+
+    # 最久未使用的先淘汰
+    alive.sort()
+    for mtime, size, path in alive:
+        if total_size <= max_bytes:
+            break
+        _remove(path)
+        total_size -= size
+    logger.info(f"分析缓存超过 {config.ANALYSIS_CACHE_MAX_MB}MB，已淘汰旧条目")
+
+def _remove(path):
+    try:
+        path.unlink()
+    except OSError:
+        pass
+
+def clear():
+    """清空分析缓存"""
+    with _lock:
+        for path in config.ANALYSIS_CACHE_DIR.glob("*.json"):
+            _remove(path)
@@ -0,0 +1,292 @@
+# benchmark.py
+import re
+import sys
+import copy
+import json
+import time
+import logging
+import argparse
+import itertools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+import config
+import storage
+from models.registry import load_analyzers
+from models.clients import collect_usage
+
+# 获取logger
+logger = logging.getLogger(__name__)
+
+# 变体参数名 -> 分析器属性名
+VARIANT_OPTIONS = {
+    "model": "model_name",
+    "prompt": "prompt_variant",
+}
+
+_SCORE_PATTERN = re.compile(r"([+-]?\d+(?:\.\d+)?)\s*%")
+
+def parse_variant(spec):
+    """
+    解析评测变体，格式为 "分析器名[:参数=值,...]"
+
+    例如 "qwen"、"qwen:video_model=qwen-vl-max"、"gemini:prompt=system_prompt_v2"、
+    "stub:model=stub-2,latency=0.2"。model 对应模型名称，prompt 对应 docs/prompts/ 下的提示词变体，
+    其余参数直接设置到分析器的同名属性上（例如 qwen 的 video_model）。
+
+    Returns:
+        tuple: (变体名称, 分析器副本)
+
+    Raises:
+        ValueError: 分析器不存在或参数无效
+    """
+    name, _, options = spec.partition(":")
+    loaded = load_analyzers([name.strip()])
+    if not loaded:
+        raise ValueError(f"无法加载分析器: {name}")
+    analyzer = copy.copy(loaded[0])
+
+    for option in filter(None, (part.strip() for part in options.split(","))):
+        key, sep, value = option.partition("=")
+        attr = VARIANT_OPTIONS.get(key.strip(), key.strip())
+        if not sep or not hasattr(analyzer, attr):
+            raise ValueError(f"变体 {spec} 的参数无效: {option}")
+        current = getattr(analyzer, attr)
+        value = value.strip()
+        if isinstance(current, bool):
+            value = value.lower() == "true"
+        elif isinstance(current, (int, float)):
+            value = type(current)(value)
+        setattr(analyzer, attr, value)
+    return spec, analyzer
+
+def parse_score(value):
+    """把 "+30%"、"-12.5%" 这样的综合评分转成数字，无法解析时返回None"""
+    match = _SCORE_PATTERN.search(str(value or ""))
+    return float(match.group(1)) if match else None
+
+def classify_result(result):
+    """
+    Returns:
+        str: "ok"（完整JSON）、"partial"（输出被截断后恢复）或 "error"（调用失败或无法解析）
+    """
+    if not isinstance(result, dict) or "error" in result:
+        return "error"
+    if result.get("partial_response"):
+        return "partial"
+    return "ok"
+
+def percentile(values, pct):
+    """线性插值的百分位数，values 为空时返回None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def run_case(label, analyzer, post):
+    """对一个帖子执行一次分析，返回评测记录"""
+    started = time.monotonic()
+    result = None
+    with collect_usage() as usage:
+        try:
+            result = analyzer.analyze(post, use_cache=False)
+        except Exception as e:
+            logger.error(f"{label} 分析帖子 {post.get('contentID')} 出错: {e}")
+    latency = time.monotonic() - started
+
+    result = result if isinstance(result, dict) else None
+    return {
+        "variant": label,
+        "contentID": post.get('contentID'),
+        "status": classify_result(result),
+        "latency": round(latency, 3),
+        "score": parse_score((result or {}).get("综合评分")),
+        "relevance": (result or {}).get("市场相关性"),
+        "prompt_version": ((result or {}).get("prompt_version") or {}).get("version"),
+        "input_tokens": usage.get("input_tokens", 0),
+        "cached_tokens": usage.get("cached_tokens", 0),
+        "output_tokens": usage.get("output_tokens", 0),
+    }
+
+def run_benchmark(variants, posts, concurrency=4):
+    """
+    并发地用每个变体分析每个帖子（不使用分析缓存）
+
+    同一提供商仍受分析器的并发数和 models/resilience.py 的限流约束，
+    对比真实模型时可以临时调高 *_RATE_PER_MINUTE。
+
+    Args:
+        variants (list): [(变体名称, 分析器)]
+        posts (list): 帖子数据
+        concurrency (int): 同时进行的分析数
+
+    Returns:
+        list: 评测记录
+    """
+    cases = [(label, analyzer, post) for post in posts for label, analyzer in variants]
+    records = []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="benchmark") as executor:
+        futures = [executor.submit(run_case, *case) for case in cases]
+        for future in as_completed(futures):
+            record = future.result()
+            records.append(record)
+            logger.info(f"[{len(records)}/{len(cases)}] {record['variant']} 帖子 {record['contentID']}: "
+                        f"{record['status']}，{record['latency']:.1f} 秒")
+    return records
+
+def summarize(records, labels):
+    """
+    按变体汇总延迟、token用量和解析失败率
+
+    Returns:
+        dict: {变体名称: 汇总指标}
+    """
+    summary = {}
+    for label in labels:
+        rows = [r for r in records if r["variant"] == label]
+        if not rows:
+            continue
+        latencies = [r["latency"] for r in rows]
+        calls = len(rows)
+        summary[label] = {
+            "calls": calls,
+            "p50_ms": round(percentile(latencies, 50) * 1000),
+            "p95_ms": round(percentile(latencies, 95) * 1000),
+            "error_rate": round(sum(r["status"] == "error" for r in rows) / calls, 3),
+            "partial_rate": round(sum(r["status"] == "partial" for r in rows) / calls, 3),
+            "avg_input_tokens": round(sum(r["input_tokens"] for r in rows) / calls),
+            "avg_cached_tokens": round(sum(r["cached_tokens"] for r in rows) / calls),
+            "avg_output_tokens": round(sum(r["output_tokens"] for r in rows) / calls),
+            "prompt_versions": sorted({r["prompt_version"] for r in rows if r["prompt_version"]}),
+        }
+    return summary
+
+def score_agreement(records, labels):
+    """
+    两两比较变体在同一批帖子上的结果
+
+    只统计两边都成功给出综合评分的帖子：
+      - mean_abs_diff: 综合评分之差的平均绝对值（百分点）
+      - direction_agreement: 看多/看空/中性（|评分|<20 视为中性）方向一致的比例
+      - relevance_agreement: 市场相关性判断一致的比例
+
+    Returns:
+        list: 每对变体一条记录
+    """
+    by_variant = {label: {} for label in labels}
+    for r in records:
+        if r["status"] != "error" and r["score"] is not None:
+            by_variant[r["variant"]][r["contentID"]] = r
+
+    def direction(score):
+        return 0 if abs(score) < 20 else (1 if score > 0 else -1)
+
+    pairs = []
+    for a, b in itertools.combinations(labels, 2):
+        common = sorted(set(by_variant[a]) & set(by_variant[b]))
+        if not common:
+            pairs.append({"a": a, "b": b, "posts": 0})
+            continue
+        rows = [(by_variant[a][cid], by_variant[b][cid]) for cid in common]
+        pairs.append({
+            "a": a,
+            "b": b,
+            "posts": len(rows),
+            "mean_abs_diff": round(sum(abs(x["score"] - y["score"]) for x, y in rows) / len(rows), 1),
+            "direction_agreement": round(sum(direction(x["score"]) == direction(y["score"]) for x, y in rows) / len(rows), 3),
+            "relevance_agreement": round(sum(x["relevance"] == y["relevance"] for x, y in rows) / len(rows), 3),
+        })
+    return pairs
+
+def format_report(summary, pairs):
+    """生成控制台输出的评测报告"""
+    width = max([len(label) for label in summary] + [16]) + 2
+    lines = [
+        f"{'变体':<{width}}{'次数':>6}{'p50(ms)':>10}{'p95(ms)':>10}{'失败率':>8}{'截断率':>8}"
+        f"{'输入tok':>10}{'缓存tok':>10}{'输出tok':>10}"
+    ]
+    for label, s in summary.items():
+        lines.append(
+            f"{label:<{width}}{s['calls']:>6}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['error_rate']:>8.1%}{s['partial_rate']:>8.1%}"
+            f"{s['avg_input_tokens']:>10}{s['avg_cached_tokens']:>10}{s['avg_output_tokens']:>10}"
+        )
+    if pairs:
+        lines.append("")
+        lines.append("结果一致性（两边都给出评分的帖子）：")
+        for p in pairs:
+            if not p["posts"]:
+                lines.append(f"  {p['a']} vs {p['b']}: 没有可比较的帖子")
+                continue
+            lines.append(
+                f"  {p['a']} vs {p['b']}: {p['posts']} 个帖子，评分平均相差 {p['mean_abs_diff']} 个百分点，"
+                f"方向一致 {p['direction_agreement']:.0%}，相关性一致 {p['relevance_agreement']:.0%}"
+            )
+    return "\n".join(lines)
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description="用帖子库中的历史帖子离线评测AI分析器（延迟、token用量、解析失败率、模型间一致性）",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例：
+  python benchmark.py --variants stub stub:model=stub-2 --posts 20        # 本地模拟，不访问网络
+  python benchmark.py --variants qwen qwen:video_model=qwen-vl-max --posts 10
+  python benchmark.py --variants gemini gemini:prompt=system_prompt_v2   # 对比 docs/prompts/ 下的提示词变体
+  python benchmark.py --variants qwen grok gemini --posts 30 --concurrency 6
+        """
+    )
+    parser.add_argument("--variants", nargs="+", required=True,
+                        help="参与评测的变体，格式为 分析器名[:参数=值,...]，参数可以是 model、prompt 或分析器的属性")
+    parser.add_argument("--posts", type=int, default=20,
+                        help="使用帖子库中最新的N个帖子，默认20")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="同时进行的分析数，默认4")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="评测报告（JSON）的保存路径，默认 data/benchmark/benchmark_时间.json")
+    args = parser.parse_args()
+
+    config.init()
+
+    try:
+        variants = [parse_variant(spec) for spec in args.variants]
+    except ValueError as e:
+        logger.error(str(e))
+        sys.exit(2)
+
+    posts = storage.list_posts(limit=args.posts)
+    if not posts:
+        logger.error("帖子库中没有帖子，无法评测")
+        sys.exit(1)
+
+    labels = [label for label, _ in variants]
+    logger.info(f"评测 {len(variants)} 个变体 × {len(posts)} 个帖子，并发 {args.concurrency}")
+    started = time.monotonic()
+    records = run_benchmark(variants, posts, concurrency=args.concurrency)
+    summary = summarize(records, labels)
+    pairs = score_agreement(records, labels)
+
+    print(format_report(summary, pairs))
+
+    output = args.output or config.DATA_DIR / "benchmark" / f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    report = {
+        "run_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "duration_seconds": round(time.monotonic() - started, 1),
+        "posts": [post.get('contentID') for post in posts],
+        "variants": {label: {"analyzer": analyzer.name, "model_name": analyzer.model_name,
+                             "prompt_variant": analyzer.prompt_variant} for label, analyzer in variants},
+        "summary": summary,
+        "agreement": pairs,
+        "records": records,
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    logger.info(f"评测报告已保存到: {output}")
+
+if __name__ == "__main__":
+    main()
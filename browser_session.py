@@ -0,0 +1,211 @@
+# browser_session.py
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import config
+import tracing
+
+try:
+    import psutil
+except ImportError:  # psutil 可选，缺失时不按内存回收浏览器
+    psutil = None
+
+# 获取logger
+logger = logging.getLogger(__name__)
+
+# 每轮采集的耗时阶段及日志中的名称
+CYCLE_STAGES = {
+    "probe": "探测",
+    "navigation": "导航",
+    "wait": "等待",
+    "screenshot": "截图",
+    "parse": "解析",
+}
+
+def browser_memory_mb():
+    """
+    统计当前进程所有子进程（浏览器、驱动）占用的内存
+
+    Returns:
+        float: 常驻内存（MB），未安装 psutil 时返回None
+    """
+    if psutil is None:
+        return None
+    total = 0
+    for child in psutil.Process().children(recursive=True):
+        try:
+            total += child.memory_info().rss
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+    return total / 1024 / 1024
+
+class CycleTimer:
+    """记录一轮采集中各阶段的耗时"""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name, content_id=None):
+        """记录一个阶段的耗时，同时记为 scrape.{name} 追踪span"""
+        start = time.monotonic()
+        try:
+            with tracing.span(f"scrape.{name}", content_id):
+                yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.monotonic() - start
+
+    @property
+    def total(self):
+        return time.monotonic() - self.started_at
+
+    def summary(self):
+        parts = [
+            f"{CYCLE_STAGES.get(name, name)} {self.stages[name]:.2f}s"
+            for name in list(CYCLE_STAGES) + [n for n in self.stages if n not in CYCLE_STAGES]
+            if name in self.stages
+        ]
+        return f"{self.total:.2f}s（{' / '.join(parts)}）" if parts else f"{self.total:.2f}s"
+
+class BrowserSession:
+    """
+    长期运行的浏览器会话
+
+    每轮采集前做存活检查，浏览器崩溃或无响应时自动重启（失败后指数退避重试）；
+    运行满 BROWSER_RECYCLE_CYCLES 轮或内存超过 BROWSER_MAX_MEMORY_MB 时主动回收，
+    避免持续运行时内存不断增长。
+
+    Args:
+        name (str): 会话名称（用于日志）
+        launch (callable): 启动浏览器，返回页面/驱动对象
+        close (callable): 关闭浏览器并释放资源
+        probe (callable): 接收 launch 的返回值，浏览器不可用时抛出异常或返回False
+    """
+
+    def __init__(self, name, launch, close, probe):
+        self.name = name
+        self._launch = launch
+        self._close = close
+        self._probe = probe
+        self._handle = None
+        self._lock = threading.RLock()
+
+        self.cycles = 0  # 当前浏览器已运行的轮数
+        self.total_cycles = 0
+        self.restarts = 0
+        self.last_cycle = None
+        self._stage_totals = {}
+
+    @property
+    def is_running(self):
+        return self._handle is not None
+
+    def acquire(self):
+        """返回可用的页面/驱动对象，必要时重启浏览器"""
+        with self._lock:
+            if self._handle is not None:
+                if self._is_alive():
+                    return self._handle
+                logger.warning(f"{self.name} 浏览器无响应，准备重启")
+                self._close_quietly()
+                self.restarts += 1
+            return self._launch_with_backoff()
+
+    def close(self):
+        """关闭浏览器"""
+        with self._lock:
+            if self._handle is not None:
+                self._close_quietly()
+
+    @contextmanager
+    def cycle(self):
+        """
+        一轮采集：结束后记录各阶段耗时，并按轮数和内存判断是否回收浏览器
+
+        Yields:
+            CycleTimer: 用 timer.stage(name) 记录各阶段耗时
+        """
+        timer = CycleTimer()
+        try:
+            with tracing.span("scrape.cycle", browser=self.name):
+                yield timer
+        finally:
+            self._finish_cycle(timer)
+
+    def stats(self):
+        """会话统计：轮数、重启次数、内存及各阶段平均耗时"""
+        averages = {
+            name: round(total / self.total_cycles, 3)
+            for name, total in self._stage_totals.items()
+        } if self.total_cycles else {}
+        return {
+            "name": self.name,
+            "running": self.is_running,
+            "cycles": self.cycles,
+            "total_cycles": self.total_cycles,
+            "restarts": self.restarts,
+            "memory_mb": browser_memory_mb(),
+            "last_cycle": self.last_cycle,
+            "average_stage_seconds": averages,
+        }
+
+    def _is_alive(self):
+        try:
+            return self._probe(self._handle) is not False
+        except Exception as e:
+            logger.warning(f"{self.name} 存活检查失败: {e}")
+            return False
+
+    def _launch_with_backoff(self):
+        max_attempts = max(1, config.BROWSER_RESTART_MAX_ATTEMPTS)
+        for attempt in range(1, max_attempts + 1):
+            try:
+                with tracing.span("scrape.launch", browser=self.name, attempt=attempt):
+                    self._handle = self._launch()
+                self.cycles = 0
+                return self._handle
+            except Exception as e:
+                logger.error(f"{self.name} 浏览器启动失败 (第{attempt}/{max_attempts}次): {e}")
+                self._close_quietly()
+                if attempt < max_attempts:
+                    delay = min(config.BROWSER_RESTART_BACKOFF * 2 ** (attempt - 1), 300)
+                    logger.info(f"{delay:g} 秒后重试启动浏览器")
+                    time.sleep(delay)
+        raise RuntimeError(f"{self.name} 浏览器连续启动失败 {max_attempts} 次")
+
+    def _close_quietly(self):
+        try:
+            self._close()
+        except Exception as e:
+            logger.warning(f"{self.name} 关闭浏览器时出错: {e}")
+        self._handle = None
+
+    def _finish_cycle(self, timer):
+        with self._lock:
+            self.cycles += 1
+            self.total_cycles += 1
+            for name, seconds in timer.stages.items():
+                self._stage_totals[name] = self._stage_totals.get(name, 0.0) + seconds
+            self.last_cycle = {
+                "total": round(timer.total, 3),
+                "stages": {name: round(seconds, 3) for name, seconds in timer.stages.items()},
+            }
+
+            memory_mb = browser_memory_mb()
+            memory_note = f", 浏览器内存 {memory_mb:.0f} MB" if memory_mb is not None else ""
+            logger.info(f"{self.name} 第{self.cycles}轮采集耗时 {timer.summary()}{memory_note}")
+
+            if self._handle is None:
+                return
+            if config.BROWSER_RECYCLE_CYCLES > 0 and self.cycles >= config.BROWSER_RECYCLE_CYCLES:
+                logger.info(f"{self.name} 浏览器已运行 {self.cycles} 轮，重启以释放资源")
+            elif config.BROWSER_MAX_MEMORY_MB > 0 and memory_mb is not None and memory_mb > config.BROWSER_MAX_MEMORY_MB:
+                logger.info(f"{self.name} 浏览器内存 {memory_mb:.0f} MB 超过上限 {config.BROWSER_MAX_MEMORY_MB:.0f} MB，重启以释放资源")
+            else:
+                return
+            # 下一轮 acquire() 时重新启动
+            self._close_quietly()
+            self.restarts += 1
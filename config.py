@@ -17,13 +17,21 @@ HEADERS = {
 # 请求超时设置（秒）
 REQUEST_TIMEOUT = 30
 
+# 媒体下载配置
+DOWNLOAD_MAX_WORKERS = int(os.getenv('DOWNLOAD_MAX_WORKERS', '4'))  # 同时下载的文件数
+DOWNLOAD_CHUNK_SIZE = int(os.getenv('DOWNLOAD_CHUNK_SIZE', str(256 * 1024)))  # 写入文件的块大小（字节）
+DOWNLOAD_MAX_RETRIES = int(os.getenv('DOWNLOAD_MAX_RETRIES', '5'))  # 中断后断点续传的最大尝试次数
+DOWNLOAD_PROXY = os.getenv('DOWNLOAD_PROXY')  # 例如 socks5h://127.0.0.1:10808（需要 PySocks），不设置则使用系统代理环境变量
+
 # 文件路径配置
 BASE_DIR = Path(os.path.dirname(os.path.abspath(__file__)))
 PICS_DIR = BASE_DIR / "pics"
 MOVS_DIR = BASE_DIR / "movs"
 DATA_DIR = BASE_DIR / "data"
-HISTORY_FILE = DATA_DIR / "history.json"
+HISTORY_FILE = DATA_DIR / "history.json"  # 旧版历史记录，首次启动时导入数据库
+DATABASE_FILE = DATA_DIR / "trump_social.db"  # SQLite帖子库（WAL模式）
 RESULT_DIR = DATA_DIR / "result" # 新增，用于存放AI分析结果
+ANALYSIS_CACHE_DIR = DATA_DIR / "analysis_cache"  # AI分析结果缓存目录
 SCREENSHOTS_DIR = BASE_DIR / "screenshots"  # 新增：截图目录
 BROWSER_USER_DATA_DIR = BASE_DIR / "browser_data"  # 新增：浏览器用户数据目录
 
@@ -39,6 +47,12 @@ BROWSER_CONFIG = {
 # 可以通过环境变量 USE_UNDETECTED_CHROME=true/false 来控制
 USE_UNDETECTED_CHROME = os.getenv('USE_UNDETECTED_CHROME', 'true').lower() == 'true'
 
+# 浏览器会话管理（持续运行模式）
+BROWSER_RECYCLE_CYCLES = int(os.getenv('BROWSER_RECYCLE_CYCLES', '50'))  # 每采集N轮重启一次浏览器，0表示不按轮数重启
+BROWSER_MAX_MEMORY_MB = float(os.getenv('BROWSER_MAX_MEMORY_MB', '1500'))  # 浏览器进程内存超过后重启（需要 psutil），0表示不限制
+BROWSER_RESTART_MAX_ATTEMPTS = int(os.getenv('BROWSER_RESTART_MAX_ATTEMPTS', '3'))  # 启动失败时的最大尝试次数
+BROWSER_RESTART_BACKOFF = float(os.getenv('BROWSER_RESTART_BACKOFF', '5'))  # 启动失败后的首次等待秒数，之后每次翻倍
+
 # HTML选择器
 SELECTORS = {
     "post": "div[data-testid='status']",  # 帖子选择器
@@ -54,25 +68,146 @@ SELECTORS = {
     "text_embedded_link": "a[href]",
 }
 
+# 页面自身请求的时间线接口（Mastodon风格），返回结构化的帖子JSON
+TIMELINE_API_PATTERN = r"/api/v1/accounts/\d+/statuses"
+# 是否从时间线接口响应中提取帖子（失败时回退到HTML解析）
+CAPTURE_API_RESPONSES = os.getenv('CAPTURE_API_RESPONSES', 'true').lower() == 'true'
+# 批量抓取时间线时最多向下滚动的次数
+TIMELINE_MAX_SCROLLS = int(os.getenv('TIMELINE_MAX_SCROLLS', '10'))
+# 完整采集前先探测最新帖子ID（直接请求时间线接口第一页，或只读取页面上第一个帖子链接），
+# 没有新帖子时跳过滚动、截图和解析
+PROBE_BEFORE_SCRAPE = os.getenv('PROBE_BEFORE_SCRAPE', 'true').lower() == 'true'
+# 每轮最多处理的新帖子数（停机后补抓）
+TIMELINE_BATCH_LIMIT = int(os.getenv('TIMELINE_BATCH_LIMIT', '20'))
+
+# 帖子处理队列（分析 → 生成 → 发布），任务状态保存在数据库中
+PIPELINE_WORKERS = int(os.getenv('PIPELINE_WORKERS', '2'))  # 同时处理的帖子数
+PIPELINE_MAX_ATTEMPTS = int(os.getenv('PIPELINE_MAX_ATTEMPTS', '3'))  # 每个阶段的最大尝试次数
+PIPELINE_RETRY_DELAY = float(os.getenv('PIPELINE_RETRY_DELAY', '60'))  # 阶段失败后的首次重试等待秒数，之后每次翻倍
+
+# 持续运行时的自适应采集间隔（分钟）：按最近的发帖频率和历史上当前时段的发帖频率调整，
+# 发现新帖子后立即缩短到下限；没有任何发帖记录时使用 --interval
+POLL_MIN_INTERVAL_MINUTES = float(os.getenv('POLL_MIN_INTERVAL_MINUTES', '3'))
+POLL_MAX_INTERVAL_MINUTES = float(os.getenv('POLL_MAX_INTERVAL_MINUTES', '60'))
+POLL_ACTIVITY_WINDOW_HOURS = float(os.getenv('POLL_ACTIVITY_WINDOW_HOURS', '3'))  # 统计最近发帖频率的时间窗口
+POLL_HISTORY_DAYS = int(os.getenv('POLL_HISTORY_DAYS', '28'))  # 统计各时段发帖频率时回看的天数
+POLL_JITTER = float(os.getenv('POLL_JITTER', '0.1'))  # 间隔随机浮动的比例，避免固定的访问节奏
+
+# AI分析配置
+# 参与分析的模型，对应 models/{name}_analyzer.py 中注册的分析器
+AI_ANALYZERS = [name.strip() for name in os.getenv('AI_ANALYZERS', 'qwen,grok,gemini').split(',') if name.strip()]
+
+# 各模型并发分析，每个模型有独立的截止时间（秒）
+# 超时的模型只会在结果中标记为 {"error": ...}，不会阻塞文章生成
+AI_ANALYSIS_TIMEOUT = int(os.getenv('AI_ANALYSIS_TIMEOUT', '300'))
+AI_ANALYSIS_TIMEOUTS = {
+    "qwen": int(os.getenv('QWEN_ANALYSIS_TIMEOUT', AI_ANALYSIS_TIMEOUT)),
+    "grok": int(os.getenv('GROK_ANALYSIS_TIMEOUT', AI_ANALYSIS_TIMEOUT)),
+    "gemini": int(os.getenv('GEMINI_ANALYSIS_TIMEOUT', AI_ANALYSIS_TIMEOUT)),
+}
+
+# AI分析缓存：内容、媒体、提示词、模型和生成参数都相同时直接复用之前的结果
+# 可以通过命令行参数 --no-cache 临时关闭
+ANALYSIS_CACHE_ENABLED = os.getenv('ANALYSIS_CACHE_ENABLED', 'true').lower() == 'true'
+ANALYSIS_CACHE_TTL_HOURS = float(os.getenv('ANALYSIS_CACHE_TTL_HOURS', '168'))  # 默认保留7天，0表示不过期
+ANALYSIS_CACHE_MAX_MB = float(os.getenv('ANALYSIS_CACHE_MAX_MB', '50'))  # 超过后按最近使用时间淘汰，0表示不限制
+
+# 模型接口的限流、重试和熔断，按提供商（dashscope / xai / google）分别计算
+# 令牌桶限流：每分钟最多发起的请求数，允许短时间内突发 AI_RATE_BURST 个
+AI_RATE_PER_MINUTE = float(os.getenv('AI_RATE_PER_MINUTE', '20'))
+AI_RATE_LIMITS = {
+    "dashscope": float(os.getenv('DASHSCOPE_RATE_PER_MINUTE', AI_RATE_PER_MINUTE)),
+    "xai": float(os.getenv('XAI_RATE_PER_MINUTE', AI_RATE_PER_MINUTE)),
+    "google": float(os.getenv('GOOGLE_RATE_PER_MINUTE', AI_RATE_PER_MINUTE)),
+    "stub": 0,  # 本地模拟分析器（models/stub_analyzer.py）不限流
+}
+AI_RATE_BURST = int(os.getenv('AI_RATE_BURST', '3'))
+# 429、5xx、超时、连接错误等临时错误的重试次数，等待时间指数增长并带随机抖动
+AI_MAX_RETRIES = int(os.getenv('AI_MAX_RETRIES', '3'))
+AI_RETRY_BACKOFF = float(os.getenv('AI_RETRY_BACKOFF', '2'))  # 首次重试等待秒数
+AI_RETRY_BACKOFF_MAX = float(os.getenv('AI_RETRY_BACKOFF_MAX', '60'))
+# 熔断：连续失败N次（每次都已用完重试）后，在冷却时间内直接跳过该提供商
+AI_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('AI_CIRCUIT_FAILURE_THRESHOLD', '3'))
+AI_CIRCUIT_COOLDOWN = float(os.getenv('AI_CIRCUIT_COOLDOWN', '600'))
+
+# SDK客户端在进程内复用，HTTP连接保持 keep-alive，避免每次分析都重新建立连接和TLS握手
+AI_HTTP_MAX_CONNECTIONS = int(os.getenv('AI_HTTP_MAX_CONNECTIONS', '10'))  # 每个提供商的连接池大小
+AI_HTTP_KEEPALIVE_EXPIRY = float(os.getenv('AI_HTTP_KEEPALIVE_EXPIRY', '300'))  # 空闲连接保留秒数
+AI_HTTP_TIMEOUT = float(os.getenv('AI_HTTP_TIMEOUT', '600'))  # 单次请求超时（秒），流式输出按片段间隔计算
+
+# 提示词：启动时加载一次，文件修改后自动重新加载
+SYSTEM_PROMPT_FILE = BASE_DIR / "docs" / "system_prompt.md"
+PROMPT_VARIANT_DIR = BASE_DIR / "docs" / "prompts"  # 提示词变体 docs/prompts/{变体名}.md
+# 为单个模型指定提示词变体，例如 "gemini:system_prompt_v2,qwen:short"，未指定的模型使用 system_prompt.md
+PROMPT_VARIANTS = dict(
+    item.split(':', 1) for item in
+    (part.strip().replace(' ', '') for part in os.getenv('PROMPT_VARIANTS', '').split(','))
+    if ':' in item
+)
+PROMPT_RELOAD_INTERVAL = float(os.getenv('PROMPT_RELOAD_INTERVAL', '5'))  # 检查提示词文件变化的间隔（秒）
+
+# 提供商侧的提示词缓存：系统提示词（docs/system_prompt.md + 各模型的固定要求）不变时复用，
+# 降低首个token的延迟和输入token费用。GEMINI 使用显式缓存（CachedContent），提示词变化时重新创建；
+# GROK 和通义千问按相同前缀自动缓存，这里只保证固定内容在前、帖子内容在后
+AI_PROMPT_CACHE_ENABLED = os.getenv('AI_PROMPT_CACHE_ENABLED', 'true').lower() == 'true'
+GEMINI_CONTEXT_CACHE_TTL_MINUTES = float(os.getenv('GEMINI_CONTEXT_CACHE_TTL_MINUTES', '60'))
+
+# 微信接口：共享连接池，显式的连接/读取超时；网络错误和系统繁忙（-1）按指数退避重试，
+# token 失效（40001/42001）时刷新 token 后重试一次
+WECHAT_CONNECT_TIMEOUT = float(os.getenv('WECHAT_CONNECT_TIMEOUT', '5'))
+WECHAT_READ_TIMEOUT = float(os.getenv('WECHAT_READ_TIMEOUT', '30'))
+WECHAT_UPLOAD_READ_TIMEOUT = float(os.getenv('WECHAT_UPLOAD_READ_TIMEOUT', '120'))  # 上传图片的读取超时
+WECHAT_API_MAX_RETRIES = int(os.getenv('WECHAT_API_MAX_RETRIES', '3'))
+WECHAT_API_RETRY_BACKOFF = float(os.getenv('WECHAT_API_RETRY_BACKOFF', '1'))  # 首次重试等待秒数，之后每次翻倍
+WECHAT_HTTP_POOL_SIZE = int(os.getenv('WECHAT_HTTP_POOL_SIZE', '4'))
+
+# 微信 access_token：进程内共享并缓存在 data/wechat_token.json（多进程通过文件锁共用同一个 token），
+# 距离过期不足 WECHAT_TOKEN_REFRESH_MARGIN 秒时刷新，后台线程在 2 倍该时间时提前刷新
+WECHAT_TOKEN_REFRESH_MARGIN = float(os.getenv('WECHAT_TOKEN_REFRESH_MARGIN', '300'))
+WECHAT_TOKEN_BACKGROUND_REFRESH = os.getenv('WECHAT_TOKEN_BACKGROUND_REFRESH', 'true').lower() == 'true'
+
+# 微信发布结果确认：提交发布任务后由处理队列在后台查询，间隔从 PUBLISH_POLL_INTERVAL 秒开始翻倍，
+# 不超过 PUBLISH_POLL_MAX_INTERVAL；超过 PUBLISH_CONFIRM_TIMEOUT 秒仍在发布中时该阶段记为失败（重试时继续查询）
+PUBLISH_POLL_INTERVAL = float(os.getenv('PUBLISH_POLL_INTERVAL', '5'))
+PUBLISH_POLL_MAX_INTERVAL = float(os.getenv('PUBLISH_POLL_MAX_INTERVAL', '120'))
+PUBLISH_CONFIRM_TIMEOUT = float(os.getenv('PUBLISH_CONFIRM_TIMEOUT', '1800'))
+
+# 追踪：各阶段和子步骤（导航、等待、截图、解析、每个下载、每次模型调用、每个微信接口）的耗时span，
+# 按帖子ID关联，开启后逐行写入 JSONL 文件（不开启时 /metrics 的耗时直方图仍然可用）
+TRACE_ENABLED = os.getenv('TRACE_ENABLED', 'false').lower() == 'true'
+TRACE_FILE = DATA_DIR / "traces.jsonl"
+TRACE_MAX_MB = float(os.getenv('TRACE_MAX_MB', '50'))  # 超过后轮转为 traces.jsonl.1，0表示不轮转
+# Prometheus 格式的 /metrics 接口（各span的耗时直方图），0表示不启动
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
 # 日志配置
-LOG_LEVEL = logging.INFO
+LOG_LEVEL = getattr(logging, os.getenv('LOG_LEVEL', 'INFO').upper(), logging.INFO)
+LOG_FILE = BASE_DIR / "trump_social.log"
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()  # 日志文件格式：text 或 json（每行一条，带 content_id/stage 字段）
+LOG_ASYNC = os.getenv('LOG_ASYNC', 'true').lower() == 'true'  # 由后台线程写控制台和日志文件，不阻塞处理线程
+LOG_MAX_MB = float(os.getenv('LOG_MAX_MB', '20'))  # 日志文件超过后轮转，0表示不按大小轮转
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))  # 保留的历史日志文件数
+LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', '')  # 按时间轮转，例如 midnight、H；设置后不再按大小轮转
 
 # 确保必要的目录存在
 def ensure_dirs():
     """创建必要的目录结构"""
-    for directory in [PICS_DIR, MOVS_DIR, DATA_DIR, RESULT_DIR, SCREENSHOTS_DIR, BROWSER_USER_DATA_DIR]:
+    for directory in [PICS_DIR, MOVS_DIR, DATA_DIR, RESULT_DIR, ANALYSIS_CACHE_DIR, SCREENSHOTS_DIR, BROWSER_USER_DATA_DIR]:
         directory.mkdir(exist_ok=True)
 
 # 配置日志格式
 def setup_logging():
     """配置日志系统"""
-    logging.basicConfig(
-        level=LOG_LEVEL,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.StreamHandler(),  # 输出到控制台
-            logging.FileHandler(BASE_DIR / "trump_social.log", encoding='utf-8')  # 输出到文件
-        ]
+    from logging_setup import configure_logging
+    configure_logging(
+        LOG_LEVEL,
+        LOG_FILE,
+        log_format=LOG_FORMAT,
+        use_async=LOG_ASYNC,
+        max_mb=LOG_MAX_MB,
+        backup_count=LOG_BACKUP_COUNT,
+        rotate_when=LOG_ROTATE_WHEN or None,
     )
 
 # 初始化函数
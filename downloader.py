@@ -1,16 +1,252 @@
 # downloader.py
 import os
+import re
+import json
+import time
+import hashlib
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 from pathlib import Path
 from urllib.parse import urlparse
 
 # 导入配置
 import config
+import media_index
+import tracing
 
 # 获取logger
 logger = logging.getLogger(__name__)
 
+# 全局HTTP会话：复用连接（keep-alive），所有下载共享同一个连接池
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """获取共享的requests会话（线程安全的懒加载）"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.headers.update(config.HEADERS)
+            pool_size = max(config.DOWNLOAD_MAX_WORKERS, 1) * 2
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            if config.DOWNLOAD_PROXY:
+                session.proxies.update({'http': config.DOWNLOAD_PROXY, 'https': config.DOWNLOAD_PROXY})
+            _session = session
+        return _session
+
+def close_session():
+    """关闭共享会话，释放连接"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+def _build_file_path(url, directory, filename_stem, default_extension):
+    """根据URL的扩展名构建本地保存路径"""
+    parsed_url = urlparse(url)
+    file_extension = os.path.splitext(parsed_url.path)[1]
+    if not file_extension:
+        file_extension = default_extension  # 默认扩展名
+    return directory / f"{filename_stem}{file_extension}"
+
+class IncompleteDownloadError(Exception):
+    """下载的数据与服务器声明的长度或校验值不一致"""
+    def __init__(self, message, restart=False):
+        super().__init__(message)
+        # True 表示已下载部分不可用，需要从头下载
+        self.restart = restart
+
+def _read_part_meta(meta_path):
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def _write_part_meta(meta_path, meta):
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def _md5_of_file(file_path):
+    digest = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _parse_total_size(response, offset):
+    """从响应头解析文件总大小，未知时返回None"""
+    content_range = response.headers.get('Content-Range', '')
+    match = re.match(r'bytes \d+-\d+/(\d+)', content_range)
+    if match:
+        return int(match.group(1))
+    content_length = response.headers.get('Content-Length')
+    if content_length and content_length.isdigit():
+        return int(content_length) + (offset if response.status_code == 206 else 0)
+    return None
+
+def _fetch_once(url, part_path, meta_path):
+    """
+    向 .part 文件追加下载一次，有已下载部分时使用Range请求续传
+
+    Returns:
+        dict: 本次下载后的元信息（url, etag, total）
+    """
+    meta = _read_part_meta(meta_path)
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if offset and meta.get('url') != url:
+        # 残留的 .part 不是这个URL的，重新下载
+        offset = 0
+
+    headers = {}
+    if offset:
+        headers['Range'] = f"bytes={offset}-"
+        # 服务器文件已变化时（ETag不同）返回200完整内容，而不是拼接出错误的文件
+        if meta.get('etag'):
+            headers['If-Range'] = meta['etag']
+
+    with get_session().get(url, headers=headers, timeout=config.REQUEST_TIMEOUT, stream=True) as response:
+        if response.status_code == 416:
+            if offset and meta.get('total') == offset:
+                # 已经下载完整
+                return meta
+            raise IncompleteDownloadError("续传位置无效 (HTTP 416)", restart=True)
+        response.raise_for_status()
+
+        if offset and response.status_code != 206:
+            logger.info(f"服务器不支持续传或文件已变化，重新下载: {url}")
+            offset = 0
+
+        etag = response.headers.get('ETag')
+        meta = {
+            'url': url,
+            # 弱ETag不能用于 If-Range
+            'etag': etag if etag and not etag.startswith('W/') else None,
+            'total': _parse_total_size(response, offset),
+        }
+        _write_part_meta(meta_path, meta)
+
+        with open(part_path, 'ab' if offset else 'wb') as f:
+            for chunk in response.iter_content(chunk_size=config.DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+    return meta
+
+def _verify_part(part_path, meta):
+    """校验 .part 文件的长度，ETag是MD5时同时校验内容"""
+    size = os.path.getsize(part_path)
+    total = meta.get('total')
+    if total is not None and size != total:
+        # 长度不足时保留已下载部分续传；超出说明拼接错误，需要重新下载
+        raise IncompleteDownloadError(f"文件不完整: {size}/{total} 字节", restart=size > total)
+
+    etag = (meta.get('etag') or '').strip('"')
+    if re.fullmatch(r'[0-9a-fA-F]{32}', etag) and _md5_of_file(part_path) != etag.lower():
+        raise IncompleteDownloadError(f"MD5校验失败 (ETag: {etag})", restart=True)
+
+def _fetch_to_file(url, file_path):
+    """
+    使用共享会话下载URL到文件，支持断点续传
+
+    数据先写入 {文件名}.part，中断后用Range请求从断点继续；
+    校验长度（及ETag）通过后才原子地重命名为最终文件名，
+    因此最终文件名下不会出现被截断的文件。
+
+    Returns:
+        tuple: (字节数, 耗时秒数)
+    """
+    start_time = time.monotonic()
+    part_path = f"{file_path}.part"
+    meta_path = f"{file_path}.part.json"
+
+    last_error = None
+    for attempt in range(1, config.DOWNLOAD_MAX_RETRIES + 1):
+        try:
+            meta = _fetch_once(url, part_path, meta_path)
+            _verify_part(part_path, meta)
+            os.replace(part_path, file_path)
+            _remove_quietly(meta_path)
+            return os.path.getsize(file_path), time.monotonic() - start_time
+        except IncompleteDownloadError as e:
+            last_error = e
+            logger.warning(f"下载校验未通过 (第{attempt}次): {url}, {e}")
+            if e.restart:
+                _remove_quietly(part_path)
+                _remove_quietly(meta_path)
+        except requests.exceptions.HTTPError:
+            raise
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError) as e:
+            last_error = e
+            downloaded = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            logger.warning(f"下载中断 (第{attempt}次，已下载 {downloaded / 1024:.1f} KB): {url}, 错误: {e}")
+
+        if attempt < config.DOWNLOAD_MAX_RETRIES:
+            time.sleep(min(2 ** (attempt - 1), 30))
+
+    raise IncompleteDownloadError(f"重试 {config.DOWNLOAD_MAX_RETRIES} 次后仍未完成: {last_error}")
+
+def _log_timing(kind, file_path, size, elapsed):
+    speed = size / elapsed / 1024 if elapsed > 0 else 0
+    logger.info(f"{kind}下载成功: {file_path} ({size / 1024:.1f} KB, {elapsed:.2f} 秒, {speed:.1f} KB/s)")
+
+def _remote_size(url):
+    """用HEAD请求获取服务器上的文件大小，未知时返回None"""
+    try:
+        response = get_session().head(url, timeout=config.REQUEST_TIMEOUT, allow_redirects=True)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"获取文件大小失败: {url}, 错误: {e}")
+        return None
+    content_length = response.headers.get('Content-Length')
+    return int(content_length) if content_length and content_length.isdigit() else None
+
+def _reuse_existing(url, file_path, kind):
+    """
+    查询媒体索引，已下载过且校验通过的文件直接复用，不发起下载
+
+    同一URL被其他帖子下载过时，通过硬链接放到当前帖子的路径下；
+    索引中没有记录但本地已有文件时（索引建立前下载的，可能不完整），
+    只有服务器声明了大小且与本地一致才记入索引并复用，否则重新下载。
+
+    Returns:
+        str: 可直接使用的本地路径，需要下载时返回None
+    """
+    entry = media_index.lookup(url)
+    if entry and media_index.verify(entry):
+        if media_index.materialize(entry, file_path):
+            if Path(entry['path']) != file_path:
+                media_index.record(url, file_path)
+            logger.info(f"{kind}已在媒体索引中，跳过下载: {file_path}")
+            return str(file_path)
+    elif entry:
+        logger.info(f"{kind}索引记录对应的文件已丢失或被修改，重新下载: {url}")
+
+    if file_path.exists():
+        remote_size = _remote_size(url)
+        local_size = file_path.stat().st_size
+        if remote_size == local_size:
+            media_index.record(url, file_path)
+            logger.info(f"{kind}已存在，记入媒体索引并跳过下载: {file_path}")
+            return str(file_path)
+        if remote_size is None:
+            logger.info(f"{kind}本地文件无法与服务器核对大小，重新下载: {file_path}")
+        else:
+            logger.warning(f"{kind}本地文件大小与服务器不一致 ({local_size}/{remote_size} 字节)，重新下载: {file_path}")
+    return None
+
 def download_image(image_url, content_id, image_id=0):
     """
     下载图片并按指定格式保存
@@ -23,33 +259,27 @@ def download_image(image_url, content_id, image_id=0):
     Returns:
         str: 保存的图片本地路径，失败返回None
     """
-    try:
-        # 提取文件扩展名
-        parsed_url = urlparse(image_url)
-        file_extension = os.path.splitext(parsed_url.path)[1]
-        if not file_extension:
-            file_extension = '.jpg'  # 默认扩展名
-        
-        # 构建文件名
-        filename = f"{content_id}_image{image_id}{file_extension}"
-        file_path = config.PICS_DIR / filename
-        
-        # 下载图片
-        logger.info(f"开始下载图片: {image_url}")
-        response = requests.get(image_url, headers=config.HEADERS, timeout=config.REQUEST_TIMEOUT, stream=True)
-        response.raise_for_status()
-        
-        # 保存图片
-        with open(file_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+    with tracing.span("download.image", content_id, url=image_url) as download_span:
+        try:
+            file_path = _build_file_path(image_url, config.PICS_DIR, f"{content_id}_image{image_id}", '.jpg')
+            
+            existing_path = _reuse_existing(image_url, file_path, "图片")
+            if existing_path:
+                download_span.set(reused=True)
+                return existing_path
+            
+            # 下载图片
+            logger.info(f"开始下载图片: {image_url}")
+            size, elapsed = _fetch_to_file(image_url, file_path)
+            download_span.set(bytes=size)
+            _log_timing("图片", file_path, size, elapsed)
+            media_index.record(image_url, file_path)
+            return str(file_path)
         
-        logger.info(f"图片下载成功: {file_path}")
-        return str(file_path)
-    
-    except Exception as e:
-        logger.error(f"下载图片失败: {image_url}, 错误: {str(e)}")
-        return None
+        except Exception as e:
+            logger.error(f"下载图片失败: {image_url}, 错误: {str(e)}")
+            download_span.fail(e)
+            return None
 
 def download_video(video_url, content_id):
     """
@@ -62,37 +292,31 @@ def download_video(video_url, content_id):
     Returns:
         str: 保存的视频本地路径，失败返回None
     """
-    try:
-        # 提取文件扩展名
-        parsed_url = urlparse(video_url)
-        file_extension = os.path.splitext(parsed_url.path)[1]
-        if not file_extension:
-            file_extension = '.mp4'  # 默认扩展名
+    with tracing.span("download.video", content_id, url=video_url) as download_span:
+        try:
+            file_path = _build_file_path(video_url, config.MOVS_DIR, f"{content_id}", '.mp4')
             
-        # 构建文件名
-        filename = f"{content_id}{file_extension}"
-        file_path = config.MOVS_DIR / filename
-        
-        # 下载视频
-        logger.info(f"开始下载视频: {video_url}")
-        response = requests.get(video_url, headers=config.HEADERS, timeout=config.REQUEST_TIMEOUT, stream=True)
-        response.raise_for_status()
+            existing_path = _reuse_existing(video_url, file_path, "视频")
+            if existing_path:
+                download_span.set(reused=True)
+                return existing_path
+            
+            # 下载视频
+            logger.info(f"开始下载视频: {video_url}")
+            size, elapsed = _fetch_to_file(video_url, file_path)
+            download_span.set(bytes=size)
+            _log_timing("视频", file_path, size, elapsed)
+            media_index.record(video_url, file_path)
+            return str(file_path)
         
-        # 保存视频
-        with open(file_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-                
-        logger.info(f"视频下载成功: {file_path}")
-        return str(file_path)
-    
-    except Exception as e:
-        logger.error(f"下载视频失败: {video_url}, 错误: {str(e)}")
-        return None
+        except Exception as e:
+            logger.error(f"下载视频失败: {video_url}, 错误: {str(e)}")
+            download_span.fail(e)
+            return None
 
 def download_media(content_id, image_urls=None, video_url=None):
     """
-    下载与内容关联的所有媒体文件
+    并发下载与内容关联的所有媒体文件
     
     Args:
         content_id (str): 内容ID
@@ -100,22 +324,30 @@ def download_media(content_id, image_urls=None, video_url=None):
         video_url (str, optional): 视频URL
         
     Returns:
-        tuple: (图片路径列表, 视频路径)
+        tuple: (图片路径列表, 视频路径)，图片顺序与 image_urls 一致
     """
-    image_paths = []
-    video_path = None
+    image_urls = image_urls or []
+    task_count = len(image_urls) + (1 if video_url else 0)
+    if task_count == 0:
+        return [], None
     
-    # 下载图片
-    if image_urls:
-        for i, url in enumerate(image_urls):
-            path = download_image(url, content_id, i)
-            if path:
-                image_paths.append(path)
-    
-    # 下载视频
-    if video_url:
-        video_path = download_video(video_url, content_id)
+    start_time = time.monotonic()
+    workers = min(max(config.DOWNLOAD_MAX_WORKERS, 1), task_count)
+    with tracing.span("download.media", content_id, files=task_count), \
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="download") as executor:
+        # 视频最大，最先提交；每个任务绑定当前span，下载span归属到 download.media 下
+        video_future = executor.submit(tracing.bind(download_video), video_url, content_id) if video_url else None
+        image_futures = [
+            executor.submit(tracing.bind(download_image), url, content_id, i)
+            for i, url in enumerate(image_urls)
+        ]
+        
+        image_paths = [path for path in (f.result() for f in image_futures) if path]
+        video_path = video_future.result() if video_future else None
     
+    logger.info(f"媒体下载完成: {len(image_paths)}/{len(image_urls)} 张图片, "
+                f"视频{'成功' if video_path else ('失败' if video_url else '无')}, "
+                f"总耗时 {time.monotonic() - start_time:.2f} 秒")
     return image_paths, video_path
 
 # 简单测试
@@ -0,0 +1,160 @@
+# logging_setup.py
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+class LazyJSON:
+    """
+    日志参数中的大对象，只有日志真正输出时才序列化
+
+    用法:
+        logger.debug("分析结果: %s", LazyJSON(result, indent=2))
+    """
+
+    __slots__ = ("obj", "indent")
+
+    def __init__(self, obj, indent=None):
+        self.obj = obj
+        self.indent = indent
+
+    def __str__(self):
+        try:
+            return json.dumps(self.obj, ensure_ascii=False, indent=self.indent, default=str)
+        except (TypeError, ValueError):
+            return repr(self.obj)
+
+class TraceContextFilter(logging.Filter):
+    """
+    给日志记录加上当前追踪span中的帖子ID和处理阶段（content_id、stage、span 字段）
+
+    在产生日志的线程中执行，异步输出时也能拿到正确的上下文。
+    """
+
+    def filter(self, record):
+        import tracing  # tracing 依赖 config，延迟导入避免循环引用
+
+        current = tracing.current_span()
+        stage = None
+        node = current
+        while node is not None:
+            if node.name.startswith("stage."):
+                stage = node.name[len("stage."):]
+                break
+            node = node.parent
+        record.content_id = current.content_id if current else None
+        record.stage = stage
+        record.span = current.name if current else None
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        for field in ("content_id", "stage", "span"):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class _PreparedQueueHandler(QueueHandler):
+    """
+    放入队列前只合并消息参数、展开异常堆栈，不套用格式
+
+    默认的 QueueHandler.prepare 会把格式化后的整行写进 msg，
+    这里保留原始消息，由输出端的 Formatter（文本或JSON）决定格式。
+    """
+
+    def prepare(self, record):
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        return record
+
+def build_file_handler(log_file, max_mb=0, backup_count=5, rotate_when=None):
+    """
+    创建日志文件处理器：rotate_when 非空时按时间轮转（如 "midnight"、"H"），
+    否则 max_mb 大于0时按大小轮转，都未设置时不轮转
+    """
+    if rotate_when:
+        return TimedRotatingFileHandler(log_file, when=rotate_when, backupCount=backup_count, encoding='utf-8')
+    if max_mb > 0:
+        return RotatingFileHandler(log_file, maxBytes=int(max_mb * 1024 * 1024),
+                                   backupCount=backup_count, encoding='utf-8')
+    return logging.FileHandler(log_file, encoding='utf-8')
+
+_listener = None
+_configured = False
+_lock = threading.Lock()
+
+def configure_logging(level, log_file, log_format="text", use_async=True, max_mb=0, backup_count=5,
+                      rotate_when=None):
+    """
+    配置根logger：控制台输出文本，日志文件输出文本或JSON行
+
+    use_async 为True时，调用方线程只把日志记录放入队列，
+    写控制台和磁盘由后台的 QueueListener 线程完成。重复调用不会重复添加处理器。
+
+    Args:
+        level (int): 日志级别
+        log_file (Path): 日志文件
+        log_format (str): 日志文件格式，"text" 或 "json"
+        use_async (bool): 是否异步输出
+        max_mb (float): 按大小轮转的阈值（MB）
+        backup_count (int): 保留的历史日志文件数
+        rotate_when (str, optional): 按时间轮转的周期
+    """
+    global _listener, _configured
+    with _lock:
+        if _configured:
+            return
+        _configured = True
+
+        console = logging.StreamHandler(sys.stderr)
+        console.setFormatter(logging.Formatter(TEXT_FORMAT))
+        file_handler = build_file_handler(log_file, max_mb, backup_count, rotate_when)
+        file_handler.setFormatter(JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+
+        root = logging.getLogger()
+        root.setLevel(level)
+        context_filter = TraceContextFilter()
+        if use_async:
+            handler = _PreparedQueueHandler(queue.SimpleQueue())
+            handler.addFilter(context_filter)
+            root.addHandler(handler)
+            _listener = QueueListener(handler.queue, console, file_handler, respect_handler_level=True)
+            _listener.start()
+            atexit.register(stop_logging)
+        else:
+            for handler in (console, file_handler):
+                handler.addFilter(context_filter)
+                root.addHandler(handler)
+
+def stop_logging():
+    """输出队列中剩余的日志并停止后台线程"""
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
@@ -4,66 +4,422 @@ import time
 import json
 import logging
 import argparse
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from datetime import datetime
+from pathlib import Path
 
 import config
+import storage
+import tracing
+import post_parser
+from pipeline import Pipeline, StageDeferred, StageFailed, get_job, record_checkpoint, get_checkpoints, clear_checkpoints
+from scheduler import AdaptiveScheduler
 
 # 根据配置选择使用哪个scraper
 USE_UNDETECTED = os.getenv('USE_UNDETECTED_CHROME', 'true').lower() == 'true'
 
 if USE_UNDETECTED:
-    from scraper_undetected import scrape_latest_post, cleanup_browser
+    from scraper_undetected import scrape_latest_post, scrape_timeline, probe_latest_post_id, cleanup_browser, get_browser_stats
     logger = logging.getLogger(__name__)
     logger.info("使用 undetected-chromedriver 模式")
 else:
-    from scraper import scrape_latest_post, cleanup_browser
+    from scraper import scrape_latest_post, scrape_timeline, probe_latest_post_id, cleanup_browser, get_browser_stats
     logger = logging.getLogger(__name__)
     logger.info("使用 playwright 模式")
 
 from article_generator import ArticleGenerator
-from wechat_publisher import WechatPublisher
+from wechat_publisher import WechatPublisher, publish_poll_delay, RESUBMITTABLE_PUBLISH_STATUS
+from wechat_api import get_api_stats, close_session as close_wechat_session
 
 import sys
 current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir) 
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))) 
-from models.qwen_analyzer import analyze_content_with_qwen
-from models.grok_analyzer import analyze_content_with_grok
-from models.gemini_analyzer import analyze_content_with_gemini
+from models.prompts import get_prompt
+from models.registry import load_analyzers
+from models.resilience import get_guard_stats
+from models.clients import get_client_stats, close_clients
 
 def get_last_post_id():
-    """获取上次抓取的帖子ID"""
+    """获取上次抓取的帖子ID（帖子库中发布时间最新的一条）"""
     try:
-        if not config.HISTORY_FILE.exists():
-            return None
-            
-        with open(config.HISTORY_FILE, 'r', encoding='utf-8') as f:
-            history = json.load(f)
-            
-        if not history:
-            return None
-            
-        # 获取最新的记录
-        # 先确保时间字段存在且格式可比较
-        valid_posts = [post for post in history if post.get('time')]
-        if not valid_posts:
-            return None
-        latest_post = max(valid_posts, key=lambda x: x.get('time', ''))
-        return latest_post.get('contentID')
-        
+        return storage.get_last_post_id()
     except Exception as e:
         logger.error(f"获取上次帖子ID失败: {str(e)}")
         return None
 
-def run_scraper(once=False, skip_publish=False, post_index=None):
+def _submit_in_daemon_thread(name, func, *args):
+    """
+    在守护线程中执行func并返回Future
+    
+    不使用ThreadPoolExecutor：卡死的模型调用无法被取消，
+    而线程池的工作线程会在进程退出时被join，导致 --once 模式无法退出。
+    """
+    future = Future()
+    # 在调用方的追踪上下文中执行，模型调用的span归属到当前帖子
+    func = tracing.bind(func)
+    
+    def runner():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func(*args))
+        except BaseException as e:
+            future.set_exception(e)
+    
+    threading.Thread(target=runner, name=name, daemon=True).start()
+    return future
+
+def ai_result_path(content_id, model_key):
+    """单个模型分析结果的保存路径"""
+    return config.RESULT_DIR / f"{content_id}_{model_key}.json"
+
+def save_ai_result(content_id, model_key, label, result):
+    """保存单个模型的分析结果到 RESULT_DIR"""
+    file_path = ai_result_path(content_id, model_key)
+    try:
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        logger.info(f"{label}分析结果已保存到: {file_path}")
+    except Exception as e:
+        logger.error(f"保存{label}分析结果失败: {e}")
+
+def run_ai_analysis(scraped_data, system_prompt_text=None, analyzers=None, use_cache=None):
     """
-    运行完整的业务流程：采集 → 分析 → 生成 → 发布
+    并发执行所有已注册的AI分析器，每个模型有独立的截止时间
+    
+    慢或卡死的模型只会把自己的结果标记为 {"error": ...}，
+    其余模型的结果照常返回，总耗时约等于最慢（或最先超时）的那个模型。
     
     Args:
-        once (bool): 是否单次运行模式
-        skip_publish (bool): 是否跳过发布步骤
+        scraped_data (dict): 帖子数据
+        system_prompt_text (str, optional): 系统提示词，默认每个分析器使用提示词注册表中自己的版本
+        analyzers (list, optional): 参与分析的分析器，默认加载 config.AI_ANALYZERS
+        use_cache (bool, optional): 是否使用分析缓存，默认取 config.ANALYSIS_CACHE_ENABLED
+        
+    Returns:
+        dict: {分析器名称: 分析结果或错误信息}
+    """
+    content_id = scraped_data.get('contentID')
+    analyzers = analyzers if analyzers is not None else load_analyzers()
+    start_time = time.monotonic()
+    
+    futures = {}
+    for analyzer in analyzers:
+        logger.info(f"--- 开始{analyzer.label}分析 ---")
+        futures[analyzer.name] = _submit_in_daemon_thread(
+            f"analyze-{analyzer.name}", analyzer.analyze, scraped_data, system_prompt_text, use_cache
+        )
+    
+    def deadline_of(analyzer):
+        return config.AI_ANALYSIS_TIMEOUTS.get(analyzer.name, config.AI_ANALYSIS_TIMEOUT)
+    
+    results = {}
+    # 按截止时间从早到晚依次等待，每个模型只等到它自己的截止时间
+    for analyzer in sorted(analyzers, key=deadline_of):
+        label = analyzer.label
+        deadline = deadline_of(analyzer)
+        remaining = max(0, deadline - (time.monotonic() - start_time))
+        future = futures[analyzer.name]
+        try:
+            result = future.result(timeout=remaining)
+        except FutureTimeoutError:
+            future.cancel()
+            logger.error(f"{label}分析超时（超过{deadline}秒），跳过该模型")
+            results[analyzer.name] = {"error": f"{label} analysis timed out after {deadline}s"}
+            continue
+        except Exception as e:
+            logger.error(f"{label}分析出错: {e}")
+            results[analyzer.name] = {"error": f"{label} analysis failed: {e}"}
+            continue
+        
+        elapsed = time.monotonic() - start_time
+        if result:
+            logger.info(f"{label}分析完成，耗时 {elapsed:.1f} 秒")
+            results[analyzer.name] = result
+            save_ai_result(content_id, analyzer.name, label, result)
+        else:
+            logger.error(f"{label}分析失败")
+            results[analyzer.name] = {"error": f"{label} analysis failed"}
+    
+    logger.info(f"AI分析总耗时 {time.monotonic() - start_time:.1f} 秒")
+    # 保持分析器的注册顺序
+    return {analyzer.name: results[analyzer.name] for analyzer in analyzers}
+
+def log_post_summary(scraped_data):
+    """输出采集到的帖子摘要"""
+    logger.info(f"发布时间: {scraped_data.get('time')}")
+    
+    # 显示爬取结果摘要
+    text = scraped_data.get('text')
+    if text:
+        preview = text[:50] + "..." if len(text) > 50 else text
+        logger.info(f"文本内容: {preview}")
+
+    # 安全处理图片数量
+    images = scraped_data.get('images')
+    if images is None:
+        logger.info(f"图片数量: 0")
+    elif isinstance(images, list):
+        logger.info(f"图片数量: {len(images)}")
+    else:
+        logger.info(f"图片数量: 0")
+
+    # 安全处理视频
+    videos = scraped_data.get('videos')
+    logger.info(f"视频: {'有' if videos else '无'}")
+
+    # 安全处理截图
+    screenshot = scraped_data.get('screenshot')
+    logger.info(f"截图: {'已保存' if screenshot else '未生成'}")
+
+def load_checkpointed_result(content_id, analyzer, checkpoints):
+    """读取上次已完成的模型分析结果，没有记录或文件丢失时返回None"""
+    checkpoint = checkpoints.get(f"analyzed:{analyzer.name}")
+    if not checkpoint:
+        return None
+    try:
+        with open(checkpoint['file'], 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"读取{analyzer.label}已保存的分析结果失败，将重新分析: {e}")
+        return None
+
+def analyze_post(content_id, use_cache=True):
+    """
+    分析阶段：并发执行所有AI分析，并保存综合结果（包含截图信息）
+    
+    已成功的模型会记录步骤，重试或恢复时只重新调用尚未成功的模型。
+    
+    Returns:
+        bool: 是否完成
+    """
+    scraped_data = storage.get_post(content_id)
+    if not scraped_data:
+        raise ValueError(f"帖子库中没有帖子 {content_id}")
+    
+    logger.info(f"\n【AI分析】帖子 {content_id}")
+    
+    analyzers = load_analyzers()
+    checkpoints = get_checkpoints(content_id)
+    ai_results = {}
+    for analyzer in analyzers:
+        result = load_checkpointed_result(content_id, analyzer, checkpoints)
+        if result:
+            logger.info(f"{analyzer.label}分析已完成，使用上次保存的结果")
+            ai_results[analyzer.name] = result
+    
+    # 并发执行其余的AI分析
+    pending = [analyzer for analyzer in analyzers if analyzer.name not in ai_results]
+    if pending:
+        ai_results.update(run_ai_analysis(scraped_data, analyzers=pending, use_cache=use_cache))
+        for analyzer in pending:
+            result = ai_results[analyzer.name]
+            if result and 'error' not in result:
+                record_checkpoint(content_id, f"analyzed:{analyzer.name}",
+                                  {"file": str(ai_result_path(content_id, analyzer.name))})
+    ai_results = {analyzer.name: ai_results[analyzer.name] for analyzer in analyzers}
+    
+    # 保存综合结果（包含截图信息）
+    summary_data = {
+        "post_data": {
+            "contentID": content_id,
+            "time": scraped_data.get('time'),
+            "text": scraped_data.get('text'),
+            "url": scraped_data.get('url'),
+            "images": scraped_data.get('images'),
+            "videos": scraped_data.get('videos'),
+            "screenshot": scraped_data.get('screenshot')  # 截图路径
+        },
+        "ai_analysis": ai_results,
+        # 每个模型的结果由哪个版本的提示词生成（超时或出错的模型记录当前版本）
+        "prompt_versions": {
+            name: (result or {}).get('prompt_version', {}).get('version') or get_prompt(name).version
+            for name, result in ai_results.items()
+        },
+        "analysis_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+    
+    summary_file_name = f"{content_id}_all_ai_results.json"
+    summary_file_path = config.RESULT_DIR / summary_file_name
+    with open(summary_file_path, 'w', encoding='utf-8') as f:
+        json.dump(summary_data, f, ensure_ascii=False, indent=2)
+    logger.info(f"所有AI分析结果（含帖子数据）已保存到: {summary_file_path}")
+    return True
+
+def generate_post_article(content_id):
+    """生成阶段：生成适合微信公众号的HTML文章"""
+    logger.info(f"\n【文章生成】帖子 {content_id}")
+    generator = ArticleGenerator()
+    html_file, screenshot_path = generator.generate_article(content_id)
+    record_checkpoint(content_id, "article", {"html_file": str(html_file), "screenshot": str(screenshot_path)})
+    logger.info(f"文章HTML已生成: {html_file}")
+    logger.info(f"使用截图: {screenshot_path}")
+    return True
+
+def publish_post(content_id):
+    """
+    发布阶段：创建草稿并提交发布任务，不等待发布结果（由 confirm 阶段在后台确认）
+    
+    草稿创建后会记录步骤，发布失败重试时直接发布已有草稿，
+    只多一次微信接口调用，不会重新生成文章或上传图片。
+    """
+    logger.info(f"\n【微信发布】帖子 {content_id}")
+    publisher = WechatPublisher()
+    checkpoints = get_checkpoints(content_id)
+    if "published" in checkpoints:
+        logger.info("该帖子已发布，跳过")
+        return True
+    if "publish_failed" in checkpoints:
+        raise StageFailed(f"该帖子的发布已被拒绝（{checkpoints['publish_failed']['reason']}），不再重新提交")
+    if "submitted" in checkpoints:
+        logger.info(f"发布任务已提交 (publish_id: {checkpoints['submitted']['publish_id']})，等待确认")
+        return True
+    
+    draft = checkpoints.get("draft")
+    if draft:
+        logger.info(f"草稿已创建 (media_id: {draft['media_id']})，直接发布")
+    else:
+        article = checkpoints.get("article")
+        if not article or not Path(article['html_file']).exists():
+            generate_post_article(content_id)
+            article = get_checkpoints(content_id)["article"]
+        draft = publisher.create_article_draft(content_id, article['html_file'], article['screenshot'])
+        if not draft:
+            logger.error("创建微信草稿失败")
+            return False
+        record_checkpoint(content_id, "draft", draft)
+    
+    record = publisher.submit_publish(content_id, draft)
+    if not record:
+        logger.error("提交微信发布任务失败")
+        return False
+    record_checkpoint(content_id, "submitted", {"publish_id": record['publish_id'], "draft_media_id": draft['media_id'],
+                                                "submitted_at": time.time()})
+    logger.info(f"发布任务已提交 (publish_id: {record['publish_id']})，发布结果在后台确认")
+    return True
+
+def confirm_publish_post(content_id):
+    """
+    确认阶段：查询一次发布结果，仍在发布中时按指数退避推迟到稍后再查
+
+    等待期间不占用处理队列的工作线程。常规失败时清除提交记录，
+    重试时（或 --resume 时）由本阶段重新提交已创建的草稿；审核不通过、删除、封禁
+    记录为 publish_failed，任务直接失败，不再重新提交。
+    """
+    checkpoints = get_checkpoints(content_id)
+    if "published" in checkpoints:
+        return True
+    if "publish_failed" in checkpoints:
+        raise StageFailed(f"该帖子的发布已被拒绝（{checkpoints['publish_failed']['reason']}），不再重新提交")
+    submitted = checkpoints.get("submitted")
+    if not submitted:
+        # 上次发布失败后提交记录已清除，重新提交草稿后再确认
+        if not publish_post(content_id):
+            return False
+        raise StageDeferred(publish_poll_delay(1))
+    
+    publisher = WechatPublisher()
+    record = publisher.confirm_publish(submitted['publish_id'])
+    if record['status'] == 'published':
+        record_checkpoint(content_id, "published", {"draft_media_id": submitted['draft_media_id'],
+                                                    "publish_id": submitted['publish_id'],
+                                                    "article_url": record.get('article_url')})
+        logger.info(f"微信公众号发布成功！文章链接: {record.get('article_url')}")
+        return True
+    if record['status'] == 'failed':
+        publish_status = (record.get('publish_result') or {}).get('publish_status')
+        clear_checkpoints(content_id, ["submitted"])
+        if publish_status in RESUBMITTABLE_PUBLISH_STATUS:
+            logger.error("微信公众号发布失败，重试时重新提交草稿")
+            return False
+        record_checkpoint(content_id, "publish_failed", {"draft_media_id": submitted['draft_media_id'],
+                                                         "publish_id": submitted['publish_id'],
+                                                         "publish_status": publish_status,
+                                                         "reason": record.get('reason')})
+        raise StageFailed(f"微信公众号发布失败：{record.get('reason')}，不再重新提交")
+    
+    elapsed = time.time() - submitted.get('submitted_at', time.time())
+    if elapsed > config.PUBLISH_CONFIRM_TIMEOUT:
+        # 保留提交记录：重试时继续查询同一个发布任务
+        logger.error(f"发布任务 {submitted['publish_id']} 已等待 {elapsed:.0f} 秒仍未完成")
+        return False
+    delay = publish_poll_delay(record.get('polls', 1))
+    raise StageDeferred(delay, f"发布中，已等待 {elapsed:.0f} 秒，{delay:g} 秒后再次查询")
+
+def log_job_result(content_id, success):
+    """任务结束时输出执行结果摘要"""
+    scraped_data = storage.get_post(content_id) or {}
+    
+    ai_results = {}
+    summary_file_path = config.RESULT_DIR / f"{content_id}_all_ai_results.json"
+    try:
+        with open(summary_file_path, 'r', encoding='utf-8') as f:
+            ai_results = json.load(f).get('ai_analysis', {})
+    except Exception:
+        pass
+    
+    logger.info("\n" + "="*60)
+    logger.info(f"执行结果摘要 ({'成功' if success else '失败'})")
+    logger.info("="*60)
+    logger.info(f"帖子ID: {content_id}")
+    logger.info(f"发布时间: {scraped_data.get('time')}")
+    logger.info(f"文本内容: {'有' if scraped_data.get('text') else '无'}")
+    logger.info(f"图片数量: {len(scraped_data.get('images') or [])}")
+    logger.info(f"视频: {'有' if scraped_data.get('videos') else '无'}")
+    logger.info(f"截图: {'已保存' if scraped_data.get('screenshot') else '未生成'}")
+    if ai_results:
+        logger.info("AI分析: " + ", ".join(
+            f"{name.upper()}-{'✓' if result and 'error' not in result else '✗'}"
+            for name, result in ai_results.items()
+        ))
+    if not success:
+        job = get_job(content_id)
+        if job:
+            logger.info(f"失败阶段: {job['stage']}，错误: {job['last_error']}")
+    logger.info("="*60 + "\n")
+
+def build_pipeline(skip_publish=False, use_cache=True):
+    """
+    创建帖子处理队列：分析 → 生成 → 发布 → 确认发布结果
+    
+    Args:
+        skip_publish (bool): 是否跳过发布阶段
+        use_cache (bool): 是否复用已缓存的AI分析结果
+    """
+    stages = [
+        ("analyze", lambda content_id: analyze_post(content_id, use_cache=use_cache)),
+        ("generate", generate_post_article),
+    ]
+    if not skip_publish:
+        # 加载环境变量
+        from dotenv import load_dotenv
+        env_path = config.BASE_DIR / ".env"
+        if env_path.exists():
+            load_dotenv(dotenv_path=env_path)
+            logger.info("已加载.env配置文件")
+        stages.append(("publish", publish_post))
+        stages.append(("confirm", confirm_publish_post))
+    else:
+        logger.info("跳过发布步骤（--skip-publish参数）")
+    return Pipeline(stages, on_finished=log_job_result)
+
+def run_scraper(pipeline, once=False, post_index=None, resume=False):
+    """
+    采集阶段：抓取新帖子并加入处理队列（分析、生成、发布由队列的工作线程完成）
+    
+    浏览器只能在创建它的线程中使用，所以采集始终在主线程执行。
+    
+    Args:
+        pipeline (Pipeline): 处理队列
+        once (bool): 是否单次运行模式（没有新帖子时重新处理最新的帖子）
         post_index (int): 要采集的非置顶帖子索引
+        resume (bool): 已处理过的帖子是否保留已完成的步骤（否则单次运行模式下从头处理）
+        
+    Returns:
+        list: 加入队列的帖子ID，采集出错时返回None
     """
     try:
         logger.info("="*60)
@@ -81,218 +437,70 @@ def run_scraper(once=False, skip_publish=False, post_index=None):
             logger.info("首次运行，尚无历史记录")
         
         # 执行爬取
-        if USE_UNDETECTED:
+        if post_index is not None and USE_UNDETECTED:
             scraped_data = scrape_latest_post(post_index=post_index)
+            scraped_posts = [scraped_data] if scraped_data else []
         else:
-            scraped_data = scrape_latest_post()
+            latest_post_id = None
+            if previous_post_id and config.PROBE_BEFORE_SCRAPE:
+                # 先低成本探测最新帖子ID，没有变化时跳过完整采集
+                latest_post_id = probe_latest_post_id()
+            if latest_post_id and not post_parser.is_newer(latest_post_id, previous_post_id):
+                logger.info(f"最新帖子仍是 {latest_post_id}，跳过完整采集")
+                scraped_posts = []
+            else:
+                # 一次页面加载抓取上次之后的所有新帖子；首次运行只处理最新的一个
+                limit = config.TIMELINE_BATCH_LIMIT if previous_post_id else 1
+                scraped_posts = scrape_timeline(limit=limit, since_id=previous_post_id)
         
-        if not scraped_data:
-            logger.warning("未能获取任何帖子")
-            return False
-            
-        current_post_id = scraped_data.get('contentID')
+        if not scraped_posts and once:
+            latest_post = storage.get_latest_post()
+            if latest_post:
+                logger.info(f"单次运行模式：重新分析已爬取的最新帖子 (ID: {latest_post['contentID']})")
+                scraped_posts = [latest_post]
         
-        if current_post_id == previous_post_id and not once:
-            logger.info(f"没有新帖子 (ID: {current_post_id})")
-            return True
-        else:
-            if current_post_id != previous_post_id:
-                logger.info(f"成功爬取新帖子 (ID: {current_post_id})")
-            else:
-                logger.info(f"单次运行模式：重新分析已爬取的最新帖子 (ID: {current_post_id})")
-
-            logger.info(f"发布时间: {scraped_data.get('time')}")
-            
-            # 显示爬取结果摘要
-            text = scraped_data.get('text')
-            if text:
-                preview = text[:50] + "..." if len(text) > 50 else text
-                logger.info(f"文本内容: {preview}")
-
-            # 安全处理图片数量
-            images = scraped_data.get('images')
-            if images is None:
-                logger.info(f"图片数量: 0")
-            elif isinstance(images, list):
-                logger.info(f"图片数量: {len(images)}")
-            else:
-                logger.info(f"图片数量: 0")
-
-            # 安全处理视频
-            videos = scraped_data.get('videos')
-            logger.info(f"视频: {'有' if videos else '无'}")
-
-            # 安全处理截图
-            screenshot = scraped_data.get('screenshot')
-            logger.info(f"截图: {'已保存' if screenshot else '未生成'}")
-
-            # ========== 2. 分析阶段 ==========
-            logger.info(f"\n【第2步：AI分析】")
-            logger.info(f"开始对帖子 {current_post_id} 进行多AI分析...")
-            
-            # 加载系统提示词
-            system_prompt_path = config.BASE_DIR / "docs" / "system_prompt.md"
-            system_prompt_text = ""
-            try:
-                with open(system_prompt_path, 'r', encoding='utf-8') as f:
-                    system_prompt_text = f.read().strip()
-                if not system_prompt_text:
-                    raise ValueError("system_prompt.md 文件内容为空或只有注释。")
-                logger.info("成功加载 system_prompt.md")
-            except FileNotFoundError:
-                logger.error(f"未找到 system_prompt.md 文件于: {system_prompt_path}。使用默认分析提示。")
-                system_prompt_text = "你是一位金融分析师，请分析以下内容并以JSON格式返回结果，确保分析结果是一个合法的JSON对象。"
-            except ValueError as e:
-                logger.error(f"{e} 使用默认分析提示。")
-                system_prompt_text = "你是一位金融分析师，请分析以下内容并以JSON格式返回结果，确保分析结果是一个合法的JSON对象。"
-
-            # 按顺序执行三个AI分析：qwen → grok → gemini
-            ai_results = {}
-            
-            # 2.1 QWEN分析
-            logger.info("\n--- 开始QWEN分析 ---")
-            qwen_result = analyze_content_with_qwen(scraped_data, system_prompt_text)
-            if qwen_result:
-                logger.info("QWEN分析完成")
-                ai_results['qwen'] = qwen_result
-                # 保存QWEN结果
-                qwen_file_name = f"{current_post_id}_qwen.json"
-                qwen_file_path = config.RESULT_DIR / qwen_file_name
-                try:
-                    with open(qwen_file_path, 'w', encoding='utf-8') as f:
-                        json.dump(qwen_result, f, ensure_ascii=False, indent=2)
-                    logger.info(f"QWEN分析结果已保存到: {qwen_file_path}")
-                except Exception as e:
-                    logger.error(f"保存QWEN分析结果失败: {e}")
-            else:
-                logger.error("QWEN分析失败")
-                ai_results['qwen'] = {"error": "QWEN analysis failed"}
-            
-            # 2.2 GROK分析
-            logger.info("\n--- 开始GROK分析 ---")
-            grok_result = analyze_content_with_grok(scraped_data, system_prompt_text)
-            if grok_result:
-                logger.info("GROK分析完成")
-                ai_results['grok'] = grok_result
-                # 保存GROK结果
-                grok_file_name = f"{current_post_id}_grok.json"
-                grok_file_path = config.RESULT_DIR / grok_file_name
-                try:
-                    with open(grok_file_path, 'w', encoding='utf-8') as f:
-                        json.dump(grok_result, f, ensure_ascii=False, indent=2)
-                    logger.info(f"GROK分析结果已保存到: {grok_file_path}")
-                except Exception as e:
-                    logger.error(f"保存GROK分析结果失败: {e}")
-            else:
-                logger.error("GROK分析失败")
-                ai_results['grok'] = {"error": "GROK analysis failed"}
-            
-            # 2.3 GEMINI分析
-            logger.info("\n--- 开始GEMINI分析 ---")
-            gemini_result = analyze_content_with_gemini(scraped_data, system_prompt_text)
-            if gemini_result:
-                logger.info("GEMINI分析完成")
-                ai_results['gemini'] = gemini_result
-                # 保存GEMINI结果
-                gemini_file_name = f"{current_post_id}_gemini.json"
-                gemini_file_path = config.RESULT_DIR / gemini_file_name
-                try:
-                    with open(gemini_file_path, 'w', encoding='utf-8') as f:
-                        json.dump(gemini_result, f, ensure_ascii=False, indent=2)
-                    logger.info(f"GEMINI分析结果已保存到: {gemini_file_path}")
-                except Exception as e:
-                    logger.error(f"保存GEMINI分析结果失败: {e}")
-            else:
-                logger.error("GEMINI分析失败")
-                ai_results['gemini'] = {"error": "GEMINI analysis failed"}
-            
-            # 保存综合结果（包含截图信息）
-            summary_data = {
-                "post_data": {
-                    "contentID": current_post_id,
-                    "time": scraped_data.get('time'),
-                    "text": scraped_data.get('text'),
-                    "url": scraped_data.get('url'),
-                    "images": scraped_data.get('images'),
-                    "videos": scraped_data.get('videos'),
-                    "screenshot": scraped_data.get('screenshot')  # 截图路径
-                },
-                "ai_analysis": ai_results,
-                "analysis_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-            
-            summary_file_name = f"{current_post_id}_all_ai_results.json"
-            summary_file_path = config.RESULT_DIR / summary_file_name
-            try:
-                with open(summary_file_path, 'w', encoding='utf-8') as f:
-                    json.dump(summary_data, f, ensure_ascii=False, indent=2)
-                logger.info(f"所有AI分析结果（含帖子数据）已保存到: {summary_file_path}")
-            except Exception as e:
-                logger.error(f"保存综合分析结果失败: {e}")
-            
-            logger.info("\nAI分析阶段完成")
-            
-            # ========== 3. 生成阶段 ==========
-            logger.info(f"\n【第3步：文章生成】")
-            
-            try:
-                generator = ArticleGenerator()
-                html_file, screenshot_path = generator.generate_article(current_post_id)
-                logger.info(f"文章HTML已生成: {html_file}")
-                logger.info(f"使用截图: {screenshot_path}")
-            except Exception as e:
-                logger.error(f"文章生成失败: {e}")
-                return False
-            
-            # ========== 4. 发布阶段 ==========
-            if not skip_publish:
-                logger.info(f"\n【第4步：微信发布】")
-                
-                try:
-                    # 加载环境变量
-                    from dotenv import load_dotenv
-                    env_path = config.BASE_DIR / ".env"
-                    if env_path.exists():
-                        load_dotenv(dotenv_path=env_path)
-                        logger.info("已加载.env配置文件")
-                    
-                    publisher = WechatPublisher()
-                    publish_result = publisher.publish_article(current_post_id)
-                    
-                    if publish_result:
-                        logger.info("微信公众号发布成功！")
-                    else:
-                        logger.error("微信公众号发布失败")
-                        
-                except Exception as e:
-                    logger.error(f"发布过程出错: {e}")
-                    return False
-            else:
-                logger.info("\n跳过发布步骤（--skip-publish参数）")
-            
-            # ========== 执行结果摘要 ==========
-            logger.info("\n" + "="*60)
-            logger.info("执行结果摘要")
-            logger.info("="*60)
-            logger.info(f"帖子ID: {current_post_id}")
-            logger.info(f"发布时间: {scraped_data.get('time')}")
-            logger.info(f"文本内容: {'有' if scraped_data.get('text') else '无'}")
-            logger.info(f"图片数量: {len(scraped_data.get('images') or [])}")
-            logger.info(f"视频: {'有' if scraped_data.get('videos') else '无'}")
-            logger.info(f"截图: {'已保存' if scraped_data.get('screenshot') else '未生成'}")
-            logger.info(f"AI分析: QWEN-{'✓' if ai_results.get('qwen') and 'error' not in ai_results['qwen'] else '✗'}, "
-                       f"GROK-{'✓' if ai_results.get('grok') and 'error' not in ai_results['grok'] else '✗'}, "
-                       f"GEMINI-{'✓' if ai_results.get('gemini') and 'error' not in ai_results['gemini'] else '✗'}")
-            logger.info(f"文章生成: {'✓' if html_file else '✗'}")
-            if not skip_publish:
-                logger.info(f"微信发布: {'✓' if publish_result else '✗'}")
-            logger.info("="*60 + "\n")
-            
-            return True
+        if not scraped_posts:
+            logger.info("没有新帖子")
+            return []
+        
+        queued = []
+        for scraped_data in scraped_posts:
+            current_post_id = scraped_data['contentID']
+            logger.info(f"待处理帖子 (ID: {current_post_id})")
+            log_post_summary(scraped_data)
+            # 加入队列后工作线程随时可能领取，步骤记录要先写入
+            record_checkpoint(current_post_id, "scraped", {"screenshot": scraped_data.get('screenshot')})
+            # 单次运行模式下已处理过的帖子也从头重新处理（--resume 时从未完成的步骤继续）
+            pipeline.enqueue(current_post_id, restart=once and not resume)
+            queued.append(current_post_id)
+        
+        if len(queued) > 1:
+            logger.info(f"本轮共有 {len(queued)} 个新帖子加入处理队列")
+        return queued
     
     except Exception as e:
         logger.error(f"流程运行出错: {str(e)}", exc_info=True)
+        return None
+
+def run_once(skip_publish=False, post_index=None, use_cache=True, resume=False):
+    """
+    单次运行：采集后等待队列处理完本轮的帖子（包括失败后的重试）
+    
+    resume 为True时先恢复上次未完成的帖子，从各自第一个未完成的阶段继续。
+    """
+    pipeline = build_pipeline(skip_publish=skip_publish, use_cache=use_cache)
+    pipeline.start()
+    try:
+        waiting = pipeline.resume() if resume else []
+        queued = run_scraper(pipeline, once=True, post_index=post_index, resume=resume)
+        waiting += [content_id for content_id in queued or [] if content_id not in waiting]
+        if waiting:
+            pipeline.wait_for(waiting)
+    finally:
+        pipeline.stop()
+    if queued is None or not waiting:
         return False
+    return all((pipeline.get_job(content_id) or {}).get('status') == 'done' for content_id in waiting)
 
 def cleanup():
     """清理资源"""
@@ -300,30 +508,58 @@ def cleanup():
         cleanup_browser()
     except Exception as e:
         logger.error(f"清理浏览器失败: {e}")
+    close_clients()
+    close_wechat_session()
+    tracing.shutdown()
 
-def continuous_run(interval_minutes, skip_publish=False):
-    """持续运行爬虫，按指定间隔"""
+def continuous_run(interval_minutes, skip_publish=False, use_cache=True, resume=False):
+    """
+    持续运行爬虫；新帖子在后台队列中处理，不阻塞下一轮采集
+    
+    采集间隔按发帖活跃度在上下限之间自动调整（见 AdaptiveScheduler），
+    interval_minutes 只在还没有发帖记录时使用。
+    """
+    pipeline = build_pipeline(skip_publish=skip_publish, use_cache=use_cache)
+    pipeline.start()
+    if resume:
+        pipeline.resume()
+    scheduler = AdaptiveScheduler(interval_minutes)
+    
+    def run_cycle():
+        run_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        logger.info(f"\n{'#'*60}")
+        logger.info(f"# 新一轮执行开始: {run_time}")
+        logger.info(f"{'#'*60}\n")
+        
+        queued = run_scraper(pipeline)
+        
+        logger.info(f"\n{'#'*60}")
+        logger.info(f"# 本轮采集结束 ({'失败' if queued is None else f'新帖子 {len(queued)} 个'})")
+        logger.info(f"# 处理队列: {pipeline.stats()}")
+        browser_stats = get_browser_stats()
+        logger.info(f"# 浏览器: 当前实例已运行 {browser_stats['cycles']} 轮，累计重启 {browser_stats['restarts']} 次")
+        for guard_stats in get_guard_stats():
+            if guard_stats['circuit'] != 'closed':
+                logger.info(f"# 模型接口: {guard_stats['provider']} 熔断中，剩余 {guard_stats['cooldown_remaining']:.0f} 秒")
+        for provider, latency in get_client_stats().items():
+            logger.info(f"# 模型接口: {provider} 首个片段耗时 冷启动 {latency['cold_ms']} ms，"
+                        f"复用连接平均 {latency['warm_ms']} ms（{latency['warm_calls']} 次），"
+                        f"输入 {latency['input_tokens']} tokens，缓存命中 {latency['cached_tokens']}")
+        for endpoint, api_stats in get_api_stats().items():
+            logger.info(f"# 微信接口: {endpoint} 请求 {api_stats['requests']} 次，错误 {api_stats['errors']}，"
+                        f"重试 {api_stats['retries']}，平均 {api_stats['avg_ms']} ms，最长 {api_stats['max_ms']} ms")
+        logger.info(f"{'#'*60}\n")
+        return len(queued) if queued is not None else None
+    
     try:
-        while True:
-            run_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            logger.info(f"\n{'#'*60}")
-            logger.info(f"# 新一轮执行开始: {run_time}")
-            logger.info(f"{'#'*60}\n")
-            
-            success = run_scraper(skip_publish=skip_publish)
-            
-            logger.info(f"\n{'#'*60}")
-            logger.info(f"# 本轮执行结束 ({'成功' if success else '失败'})")
-            logger.info(f"# 等待 {interval_minutes} 分钟后再次运行...")
-            logger.info(f"{'#'*60}\n")
-            
-            time.sleep(interval_minutes * 60)
-            
+        scheduler.run(run_cycle)
     except KeyboardInterrupt:
         logger.info("\n程序被用户中断")
-        cleanup()
     except Exception as e:
         logger.error(f"持续运行出错: {str(e)}", exc_info=True)
+    finally:
+        # 未处理完的任务保留在数据库中，下次启动时继续
+        pipeline.stop(timeout=5)
         cleanup()
 
 def main():
@@ -341,10 +577,12 @@ def main():
 示例：
   python main.py --once                    # 运行一次完整流程
   python main.py --once --skip-publish     # 运行一次但跳过发布
-  python main.py --interval 30             # 每30分钟运行一次
+  python main.py --interval 30             # 持续运行，按发帖活跃度自动调整间隔
+  python main.py --once --no-cache         # 忽略AI分析缓存，重新调用所有模型
+  python main.py --once --resume           # 继续处理上次未完成的帖子（如只重试发布）
 
 注意事项：
-  - 发布后会自动轮询状态，确认发布是否成功
+  - 提交发布后在后台轮询状态（间隔逐渐加长），确认发布是否成功，不阻塞下一轮采集
   - 发布成功后会返回文章链接
   - 如发布失败会显示具体失败原因
         """
@@ -353,23 +591,34 @@ def main():
     parser.add_argument("--once", action="store_true", 
                        help="只运行一次完整流程（采集→分析→生成→发布）")
     parser.add_argument("--interval", type=int, default=30, 
-                       help="持续运行时的间隔时间（分钟），默认30分钟")
+                       help="持续运行时的默认间隔时间（分钟），默认30分钟；有发帖记录后按发帖活跃度自动调整")
     parser.add_argument("--skip-publish", action="store_true",
                        help="跳过微信发布步骤（仅采集、分析、生成）")
     parser.add_argument("--post-index", type=int, default=None,
                        help="指定要采集的非置顶帖子索引（从0开始）。例如：--post-index 2 表示采集第三个帖子")
+    parser.add_argument("--no-cache", action="store_true",
+                       help="不使用AI分析缓存，强制重新调用所有模型")
+    parser.add_argument("--resume", action="store_true",
+                       help="从第一个未完成的阶段继续处理上次失败或中断的帖子，已完成的分析、草稿不会重做")
     
     args = parser.parse_args()
     
     # 初始化配置
     config.init()
     
+    if config.METRICS_PORT > 0:
+        tracing.start_metrics_server()
+    
+    use_cache = config.ANALYSIS_CACHE_ENABLED and not args.no_cache
+    if not use_cache:
+        logger.info("已关闭AI分析缓存")
+    
     if args.once:
         logger.info("单次运行模式")
-        run_scraper(once=True, skip_publish=args.skip_publish, post_index=args.post_index)
+        run_once(skip_publish=args.skip_publish, post_index=args.post_index, use_cache=use_cache, resume=args.resume)
     else:
-        logger.info(f"持续运行模式，间隔时间: {args.interval}分钟")
-        continuous_run(args.interval, skip_publish=args.skip_publish)
+        logger.info(f"持续运行模式，采集间隔 {config.POLL_MIN_INTERVAL_MINUTES:g}~{config.POLL_MAX_INTERVAL_MINUTES:g} 分钟自适应（默认 {args.interval} 分钟）")
+        continuous_run(args.interval, skip_publish=args.skip_publish, use_cache=use_cache, resume=args.resume)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,150 @@
+# media_index.py
+import os
+import shutil
+import logging
+from datetime import datetime
+from pathlib import Path
+
+import storage
+from analysis_cache import file_sha256
+
+# 获取logger
+logger = logging.getLogger(__name__)
+
+MEDIA_SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    url TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    mtime REAL,
+    fetched_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_media_sha256 ON media(sha256);
+"""
+
+def _connection():
+    storage.ensure_schema("media", MEDIA_SCHEMA)
+    return storage.get_connection()
+
+def lookup(url):
+    """
+    按URL查找已下载的媒体
+
+    Returns:
+        dict: {url, path, size, sha256, mtime, fetched_at}，未记录时返回None
+    """
+    row = _connection().execute("SELECT * FROM media WHERE url = ?", (url,)).fetchone()
+    return dict(row) if row else None
+
+def find_by_sha256(sha256, exclude_path=None):
+    """查找内容相同且文件仍然有效的媒体记录"""
+    rows = _connection().execute("SELECT * FROM media WHERE sha256 = ?", (sha256,)).fetchall()
+    for row in rows:
+        entry = dict(row)
+        if exclude_path and Path(entry['path']) == Path(exclude_path):
+            continue
+        if verify(entry):
+            return entry
+    return None
+
+def verify(entry):
+    """
+    检查记录对应的本地文件是否仍然完整
+
+    大小和修改时间都未变化时直接认为有效，修改时间变化时重新计算sha256。
+    """
+    try:
+        stat = os.stat(entry['path'])
+    except OSError:
+        return False
+    if stat.st_size != entry['size']:
+        return False
+    if entry.get('mtime') == stat.st_mtime:
+        return True
+    if file_sha256(entry['path']) != entry['sha256']:
+        return False
+    # 内容未变，更新修改时间，下次无需重新计算
+    conn = _connection()
+    with conn:
+        conn.execute("UPDATE media SET mtime = ? WHERE url = ?", (stat.st_mtime, entry['url']))
+    return True
+
+def record(url, path):
+    """
+    记录下载完成的媒体，并对内容相同的文件做去重
+
+    已有相同sha256的文件时，用硬链接替换新文件，多个帖子共享同一份磁盘数据。
+
+    Returns:
+        dict: 写入的记录
+    """
+    path = str(path)
+    sha256 = file_sha256(path)
+
+    duplicate = find_by_sha256(sha256, exclude_path=path)
+    if duplicate:
+        if _link_in_place(duplicate['path'], path):
+            logger.info(f"媒体内容与 {duplicate['path']} 相同，已改为硬链接: {path}")
+
+    stat = os.stat(path)
+    entry = {
+        "url": url,
+        "path": path,
+        "size": stat.st_size,
+        "sha256": sha256,
+        "mtime": stat.st_mtime,
+        "fetched_at": datetime.now().isoformat(),
+    }
+    conn = _connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO media (url, path, size, sha256, mtime, fetched_at) "
+            "VALUES (:url, :path, :size, :sha256, :mtime, :fetched_at) "
+            "ON CONFLICT(url) DO UPDATE SET path = excluded.path, size = excluded.size, "
+            "sha256 = excluded.sha256, mtime = excluded.mtime, fetched_at = excluded.fetched_at",
+            entry
+        )
+    return entry
+
+def materialize(entry, target_path):
+    """
+    把已下载的媒体放到目标路径（优先硬链接，不支持时复制）
+
+    Returns:
+        bool: 是否成功
+    """
+    target_path = str(target_path)
+    if Path(entry['path']) == Path(target_path):
+        return True
+    tmp_path = f"{target_path}.link"
+    try:
+        try:
+            os.link(entry['path'], tmp_path)
+        except OSError:
+            shutil.copyfile(entry['path'], tmp_path)
+        os.replace(tmp_path, target_path)
+        return True
+    except OSError as e:
+        logger.warning(f"复用已下载媒体失败: {entry['path']} -> {target_path}, 错误: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+
+def _link_in_place(source_path, target_path):
+    """用指向 source_path 的硬链接原子替换 target_path，失败时保留原文件"""
+    if os.path.samefile(source_path, target_path):
+        return False
+    tmp_path = f"{target_path}.link"
+    try:
+        os.link(source_path, tmp_path)
+        os.replace(tmp_path, target_path)
+        return True
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
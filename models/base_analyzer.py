@@ -0,0 +1,287 @@
+import json
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# 将项目根目录添加到sys.path，以便导入config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+import analysis_cache
+import tracing
+from models.json_stream import IncrementalJSONParser
+from models.resilience import get_guard
+from models.prompts import PromptVersion, get_prompt
+
+logger = logging.getLogger(__name__)
+
+# 流式输出时一出现就写入日志的字段
+STREAM_LOG_FIELDS = ("综合评分", "市场相关性")
+
+def load_system_prompt(analyzer_name=None):
+    """
+    获取系统提示词（由 models/prompts.py 的注册表加载并热更新）
+
+    Args:
+        analyzer_name (str, optional): 分析器名称，指定了提示词变体时返回变体内容
+
+    Returns:
+        str: 系统提示词
+    """
+    return get_prompt(analyzer_name).text
+
+def format_post_text(scraped_post_data, text_label="文本内容: ", include_media_summary=True):
+    """
+    将帖子数据格式化为纯文本描述
+
+    Args:
+        scraped_post_data (dict): 帖子数据
+        text_label (str): 正文前缀
+        include_media_summary (bool): 是否附加图片/视频数量说明
+
+    Returns:
+        str: 文本描述，没有任何内容时返回空字符串
+    """
+    content_parts = []
+
+    # 添加文本内容
+    text_content = scraped_post_data.get("text")
+    if text_content and isinstance(text_content, str) and text_content.strip():
+        content_parts.append(f"{text_label}{text_content.strip()}")
+
+    # 添加URL链接
+    url_content = scraped_post_data.get("url")
+    if url_content and isinstance(url_content, str) and url_content.strip() and url_content != "null":
+        content_parts.append(f"相关链接: {url_content}")
+
+    if include_media_summary:
+        images = scraped_post_data.get("images")
+        if images and images != "null" and isinstance(images, list):
+            content_parts.append(f"包含图片: {len(images)}张")
+
+        videos = scraped_post_data.get("videos")
+        if videos and videos != "null" and isinstance(videos, str):
+            content_parts.append("包含视频: 1个")
+
+    return "\n".join(content_parts)
+
+def clean_json_response(response_text):
+    """去掉模型输出中可能包裹JSON的markdown代码块标记"""
+    cleaned_response = response_text.strip()
+
+    if cleaned_response.startswith('```json'):
+        cleaned_response = cleaned_response[7:]
+        if cleaned_response.endswith('```'):
+            cleaned_response = cleaned_response[:-3]
+        cleaned_response = cleaned_response.strip()
+    elif cleaned_response.startswith('```'):
+        lines = cleaned_response.split('\n')
+        if len(lines) > 1:
+            cleaned_response = '\n'.join(lines[1:])
+            if cleaned_response.endswith('```'):
+                cleaned_response = cleaned_response[:-3]
+        cleaned_response = cleaned_response.strip()
+
+    return cleaned_response
+
+def parse_json_response(response_text):
+    """
+    清理并解析模型输出的JSON
+
+    Raises:
+        json.JSONDecodeError: 输出不是合法JSON
+    """
+    return json.loads(clean_json_response(response_text))
+
+def build_fallback_result(error, status="分析失败", raw_response=None):
+    """
+    构建分析失败时的占位结果，保证文章生成阶段拿到的字段齐全
+
+    Args:
+        error (str): 错误描述（英文，写入 "error" 字段）
+        status (str): 显示在各字段中的状态说明
+        raw_response (str, optional): 模型原始输出
+    """
+    result = {
+        "error": error,
+        "分析时间": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "市场相关性": status,
+        "综合评分": "0%",
+        "影响分析": {
+            "直接影响": status,
+            "影响路径": status,
+            "影响时限": "无",
+            "影响强度": "无"
+        },
+        "个股建议": [],
+        "风险提示": "由于技术原因无法完成分析"
+    }
+    if raw_response is not None:
+        result["raw_response"] = raw_response
+    return result
+
+class Analyzer:
+    """
+    AI分析器基类
+
+    子类需要设置 name / label 并实现 _analyze()，
+    并声明能力：multimodal（是否直接读取图片/视频）、
+    structured_output（是否由接口强制JSON输出）、max_concurrency（同时进行的最大请求数）。
+    model_name 和 generation_params 参与分析缓存键的计算；prompt_variant 指定使用的提示词变体
+    （默认按 PROMPT_VARIANTS 配置）。
+    同一 provider 的分析器共享限流、重试和熔断（见 models/resilience.py）。
+    """
+    name = None
+    label = None
+    multimodal = False
+    structured_output = False
+    max_concurrency = 1
+    provider = None
+    model_name = None
+    generation_params = {}
+    prompt_variant = None
+
+    def __init__(self):
+        # 限制同一提供商的并发请求数
+        self._semaphore = threading.BoundedSemaphore(max(1, self.max_concurrency))
+        self.guard = get_guard(self.provider or self.name)
+
+    @property
+    def capabilities(self):
+        """分析器能力声明"""
+        return {
+            "multimodal": self.multimodal,
+            "structured_output": self.structured_output,
+            "max_concurrency": self.max_concurrency,
+        }
+
+    def is_available(self):
+        """是否已配置好可以调用（例如API密钥存在）"""
+        return True
+
+    def cache_identity(self, post):
+        """
+        返回本次分析实际使用的 (模型名称, 生成参数)，用于计算缓存键
+
+        根据帖子内容切换模型的分析器（例如多模态）需要重写此方法。
+        """
+        return self.model_name, self.generation_params
+
+    def analyze(self, post, system_prompt_text=None, use_cache=None, on_field=None):
+        """
+        分析单个帖子
+
+        Args:
+            post (dict): 帖子数据
+            system_prompt_text (str, optional): 系统提示词，默认使用提示词注册表中本分析器的版本
+            use_cache (bool, optional): 是否使用分析缓存，默认取 config.ANALYSIS_CACHE_ENABLED
+            on_field (callable, optional): 流式输出中每个顶层字段完成时回调 (分析器名称, 字段名, 值)
+
+        Returns:
+            dict: 分析结果（"prompt_version" 字段记录所用提示词的版本），
+                未配置或调用失败时返回None或带 "error" 字段的结果
+        """
+        with tracing.span(f"analyze.{self.name}", post.get('contentID'), model=self.model_name,
+                          provider=self.guard.name) as analyze_span:
+            if system_prompt_text is None:
+                prompt = get_prompt(self.name, self.prompt_variant)
+            else:
+                # 调用方直接传入的提示词不在注册表中，只记录内容哈希
+                prompt = PromptVersion("custom", system_prompt_text)
+            system_prompt_text = prompt.text
+            if use_cache is None:
+                use_cache = config.ANALYSIS_CACHE_ENABLED
+
+            cache_key = None
+            if use_cache:
+                model_name, generation_params = self.cache_identity(post)
+                cache_key = analysis_cache.make_cache_key(post, system_prompt_text, model_name, generation_params,
+                                                          prompt_hash=prompt.sha256)
+                cached_result = analysis_cache.get(cache_key)
+                if cached_result is not None:
+                    logger.info(f"{self.label}命中分析缓存 ({cache_key[:12]})，跳过API调用")
+                    cached_result["prompt_version"] = prompt.provenance()
+                    analyze_span.set(cached=True)
+                    return cached_result
+
+            # 提供商熔断期间直接跳过，不再等待超时
+            if not self.guard.available():
+                logger.warning(f"{self.label}: {self.guard.name} 处于熔断状态，{self.guard.breaker.remaining():.0f} 秒内跳过分析")
+                analyze_span.fail("circuit open")
+                return build_fallback_result(f"{self.guard.name} circuit open", status="服务暂不可用")
+
+            with self._semaphore:
+                result = self._analyze(post, system_prompt_text, on_field)
+            if result is not None:
+                result["prompt_version"] = prompt.provenance()
+            if not result or "error" in result:
+                analyze_span.fail((result or {}).get("error", "no result"))
+
+            # 只缓存成功且完整的结果，失败或被截断的下次重新调用
+            if cache_key and result and "error" not in result and not result.get("partial_response"):
+                analysis_cache.put(cache_key, result, model_name=model_name)
+            return result
+
+    def analyze_batch(self, posts, system_prompt_text=None, use_cache=None):
+        """
+        批量分析帖子，并发数不超过 max_concurrency
+
+        Returns:
+            list: 与 posts 顺序一致的分析结果
+        """
+        posts = list(posts)
+        if not posts:
+            return []
+
+        workers = min(max(1, self.max_concurrency), len(posts))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"batch-{self.name}") as executor:
+            return list(executor.map(tracing.bind(lambda post: self.analyze(post, system_prompt_text, use_cache)), posts))
+
+    def collect_stream(self, chunks, on_field=None):
+        """
+        消费模型流式输出的文本片段并增量解析JSON
+
+        关键字段一输出就写入日志并回调 on_field；输出被截断或中途断开时，
+        尽量从已收到的内容中恢复，结果带 "partial_response": True。
+
+        Args:
+            chunks (iterable): 文本片段
+            on_field (callable, optional): 每个顶层字段完成时回调 (分析器名称, 字段名, 值)
+
+        Returns:
+            tuple: (分析结果, 原始输出)，完全无法解析时分析结果为None
+
+        Raises:
+            Exception: 流在输出任何可用内容之前出错
+        """
+        parser = IncrementalJSONParser()
+        try:
+            for chunk in chunks:
+                for key, value in parser.feed(chunk):
+                    if key in STREAM_LOG_FIELDS:
+                        logger.info(f"{self.label} {key}: {value}")
+                    if on_field:
+                        try:
+                            on_field(self.name, key, value)
+                        except Exception as e:
+                            logger.warning(f"字段回调出错: {e}")
+        except Exception as e:
+            if parser.partial_result() is None:
+                raise
+            logger.error(f"{self.label}流式输出中断: {e}")
+
+        if parser.complete:
+            return parser.result(), parser.text
+        result = parser.partial_result()
+        if result:
+            logger.warning(f"{self.label}输出不完整，已恢复 {len(result)} 个字段: {', '.join(result)}")
+            result["partial_response"] = True
+        return result, parser.text
+
+    def _analyze(self, post, system_prompt_text, on_field=None):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} name={self.name!r} capabilities={self.capabilities}>"
@@ -0,0 +1,222 @@
+import os
+import sys
+import hashlib
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import httpx
+from dotenv import load_dotenv
+
+# 将项目根目录添加到sys.path，以便导入config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+
+logger = logging.getLogger(__name__)
+
+# 当前线程的token用量收集器（见 collect_usage）
+_usage_scope = threading.local()
+
+_env_loaded = False
+_env_lock = threading.Lock()
+
+def load_env():
+    """加载项目根目录下的 .env（每个进程只加载一次，各分析器模块共用）"""
+    global _env_loaded
+    with _env_lock:
+        if _env_loaded:
+            return
+        _env_loaded = True
+        env_path = config.BASE_DIR / ".env"
+        if env_path.exists():
+            load_dotenv(dotenv_path=env_path, override=True)
+            logger.info(f"已加载 .env 文件: {env_path}")
+        else:
+            logger.warning(f".env 文件未在 {env_path} 找到。")
+
+def mask_key(value):
+    """日志中只显示密钥的前几位"""
+    return f"{value[:6]}..." if value else "未设置"
+
+def prompt_digest(text):
+    """提示词的短哈希，用于区分缓存的客户端和提供商侧的提示词缓存"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+def build_http_client():
+    """
+    创建带连接池和 keep-alive 的 httpx 客户端，供 OpenAI 兼容接口使用
+
+    同一个客户端在进程内复用，后续请求不再重复 TLS 握手。
+    """
+    return httpx.Client(
+        timeout=httpx.Timeout(config.AI_HTTP_TIMEOUT, connect=10.0),
+        limits=httpx.Limits(
+            max_connections=config.AI_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=config.AI_HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=config.AI_HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+class ClientPool:
+    """
+    进程级的SDK客户端池
+
+    客户端在第一次使用时创建，之后所有线程共享同一个实例（OpenAI、httpx、
+    GenerativeModel 都是线程安全的）。同时按提供商统计首次调用（冷启动，
+    包含建立连接）和后续调用（复用连接）到第一个输出片段的耗时，
+    以及输入token数和其中命中提供商提示词缓存的token数。
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._usage = {}
+
+    def get(self, key, factory):
+        """
+        获取客户端，不存在时调用 factory() 创建
+
+        Args:
+            key (tuple|str): 客户端标识（例如 ("xai", base_url)），不要直接放入密钥
+            factory (callable): 创建客户端的函数
+        """
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                started = time.monotonic()
+                client = factory()
+                self._clients[key] = client
+                # 日志中不输出原始key（可能含有密钥相关的信息），只记录提供商名称和短哈希
+                name = key[0] if isinstance(key, tuple) else "client"
+                logger.info(f"已创建客户端 {name}#{prompt_digest(repr(key))[:8]}"
+                            f"（{(time.monotonic() - started) * 1000:.0f} ms）")
+            return client
+
+    def record_latency(self, provider, seconds):
+        """记录一次调用的耗时，提供商的第一次调用记为冷启动"""
+        with self._lock:
+            entry = self._latency.setdefault(provider, {"cold": [], "warm": []})
+            kind = "warm" if entry["cold"] else "cold"
+            entry[kind].append(seconds)
+            # 只保留最近的记录
+            del entry[kind][:-100]
+        logger.debug(f"{provider} 首个片段耗时 {seconds * 1000:.0f} ms（{'冷启动' if kind == 'cold' else '复用连接'}）")
+
+    def record_usage(self, provider, input_tokens, cached_tokens=0, output_tokens=0):
+        """记录一次调用的token用量（cached_tokens 为输入中命中提示词缓存的部分）"""
+        usage = {"input_tokens": input_tokens or 0, "cached_tokens": cached_tokens or 0,
+                 "output_tokens": output_tokens or 0}
+        with self._lock:
+            entry = self._usage.setdefault(provider, {"calls": 0, "input_tokens": 0, "cached_tokens": 0,
+                                                      "output_tokens": 0})
+            entry["calls"] += 1
+            for key, value in usage.items():
+                entry[key] += value
+        collector = getattr(_usage_scope, "collector", None)
+        if collector is not None:
+            for key, value in usage.items():
+                collector[key] = collector.get(key, 0) + value
+        logger.debug(f"{provider} 输入 {usage['input_tokens']} tokens（缓存命中 {usage['cached_tokens']}），"
+                     f"输出 {usage['output_tokens']} tokens")
+
+    def timed_stream(self, provider, open_stream):
+        """
+        发起流式请求并逐个返回片段，记录从发起请求到收到第一个片段的耗时
+
+        Args:
+            provider (str): 提供商名称
+            open_stream (callable): 发起请求并返回可迭代的流
+        """
+        started = time.monotonic()
+        first = True
+        for chunk in open_stream():
+            if first:
+                first = False
+                self.record_latency(provider, time.monotonic() - started)
+            yield chunk
+
+    def stats(self):
+        """
+        各提供商冷启动和复用连接的平均耗时（毫秒），以及累计的输入token数
+
+        Returns:
+            dict: {提供商: {"cold_ms", "warm_ms", "warm_calls", "input_tokens", "cached_tokens", "output_tokens"}}
+        """
+        with self._lock:
+            latency = {provider: {kind: list(values) for kind, values in entry.items()}
+                       for provider, entry in self._latency.items()}
+            usage = {provider: dict(entry) for provider, entry in self._usage.items()}
+        result = {}
+        for provider in list(latency) + [p for p in usage if p not in latency]:
+            cold = latency.get(provider, {}).get("cold", [])
+            warm = latency.get(provider, {}).get("warm", [])
+            provider_usage = usage.get(provider, {})
+            result[provider] = {
+                "cold_ms": round(sum(cold) / len(cold) * 1000) if cold else None,
+                "warm_ms": round(sum(warm) / len(warm) * 1000) if warm else None,
+                "warm_calls": len(warm),
+                "input_tokens": provider_usage.get("input_tokens", 0),
+                "cached_tokens": provider_usage.get("cached_tokens", 0),
+                "output_tokens": provider_usage.get("output_tokens", 0),
+            }
+        return result
+
+    def close(self):
+        """关闭所有客户端（下次使用时重新创建）"""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+            self._latency.clear()
+            self._usage.clear()
+        for client in clients:
+            close = getattr(client, "close", None)
+            if callable(close):
+                try:
+                    close()
+                except Exception as e:
+                    logger.debug(f"关闭客户端失败: {e}")
+
+_pool = ClientPool()
+
+def get_client(key, factory):
+    """从进程级客户端池获取客户端"""
+    return _pool.get(key, factory)
+
+def timed_stream(provider, open_stream):
+    """见 ClientPool.timed_stream"""
+    return _pool.timed_stream(provider, open_stream)
+
+def record_usage(provider, input_tokens, cached_tokens=0, output_tokens=0):
+    """见 ClientPool.record_usage"""
+    _pool.record_usage(provider, input_tokens, cached_tokens, output_tokens)
+
+@contextmanager
+def collect_usage():
+    """
+    收集当前线程内模型调用的token用量（分析器的请求都在调用 analyze() 的线程中发出）
+
+    用法:
+        with collect_usage() as usage:
+            analyzer.analyze(post)
+        usage  # {"input_tokens": ..., "cached_tokens": ..., "output_tokens": ...}
+    """
+    previous = getattr(_usage_scope, "collector", None)
+    collector = {}
+    _usage_scope.collector = collector
+    try:
+        yield collector
+    finally:
+        _usage_scope.collector = previous
+
+def get_client_stats():
+    """各提供商冷启动/复用连接的调用耗时"""
+    return _pool.stats()
+
+def close_clients():
+    """关闭所有SDK客户端"""
+    _pool.close()
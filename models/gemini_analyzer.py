@@ -1,195 +1,266 @@
-import json
 import logging
 import os
-from dotenv import load_dotenv
-from pathlib import Path
 import sys
+import threading
+import time
+from datetime import timedelta
 import google.generativeai as genai
-from datetime import datetime
+from google.generativeai import caching
 
 # 将项目根目录添加到sys.path，以便导入config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config
+from models.base_analyzer import Analyzer, format_post_text, build_fallback_result
+from models.registry import register_analyzer
+from models.clients import load_env, mask_key, get_client, timed_stream, prompt_digest, record_usage
 
 logger = logging.getLogger(__name__)
 
-# 加载 .env 文件
-env_path = config.BASE_DIR / ".env"
-if env_path.exists():
-    logger.info(f"尝试加载 .env 文件: {env_path}")
-    load_dotenv(dotenv_path=env_path, override=True)
-    logger.info(f".env 文件已处理。")
-else:
-    logger.warning(f".env 文件未在 {env_path} 找到。")
+# 加载 .env 文件（进程内只加载一次）
+load_env()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 # 使用支持更多功能的模型
 GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-pro")
 
-logger.info(f"获取到的 GEMINI_API_KEY: {GEMINI_API_KEY[:10]}..." if GEMINI_API_KEY else "未找到GEMINI_API_KEY")
-logger.info(f"使用的 GEMINI_MODEL_NAME: {GEMINI_MODEL_NAME}")
+logger.debug(f"GEMINI_API_KEY: {mask_key(GEMINI_API_KEY)}，GEMINI_MODEL_NAME: {GEMINI_MODEL_NAME}")
 
 if not GEMINI_API_KEY:
     logger.error("未找到 GEMINI API 密钥 (GEMINI_API_KEY)，无法与GEMINI交互。")
 else:
     genai.configure(api_key=GEMINI_API_KEY)
 
-def format_content_for_gemini(scraped_post_data):
-    """
-    将采集到的帖子数据格式化为适合GEMINI的内容
-    """
-    content_parts = []
-    
-    # 添加文本内容
-    text_content = scraped_post_data.get("text")
-    if text_content and isinstance(text_content, str) and text_content.strip():
-        content_parts.append(f"文本内容: {text_content.strip()}")
-    
-    # 添加URL链接
-    url_content = scraped_post_data.get("url")
-    if url_content and isinstance(url_content, str) and url_content.strip() and url_content != "null":
-        content_parts.append(f"相关链接: {url_content}")
-    
-    # 处理图片（GEMINI支持图片分析）
-    images = scraped_post_data.get("images")
-    if images and images != "null" and isinstance(images, list):
-        content_parts.append(f"包含图片: {len(images)}张")
-        # 注意：这里可以扩展为实际上传图片到GEMINI进行分析
-    
-    # 处理视频
-    videos = scraped_post_data.get("videos")
-    if videos and videos != "null" and isinstance(videos, str):
-        content_parts.append("包含视频: 1个")
-    
-    if not content_parts:
-        return "没有可供分析的内容。"
-    
-    return "\n".join(content_parts)
-
-def analyze_content_with_gemini(scraped_post_data, system_prompt_text):
-    """
-    使用GEMINI分析内容
-    """
-    if not GEMINI_API_KEY:
-        logger.error("GEMINI API Key 未配置，无法进行分析。")
-        return None
-
-    try:
-        logger.info(f"向GEMINI发送内容进行分析 (模型: {GEMINI_MODEL_NAME})...")
-        
-        # 格式化内容
-        user_content = format_content_for_gemini(scraped_post_data)
-        
-        # 在系统提示词中强调JSON格式要求
-        enhanced_system_prompt = f"""{system_prompt_text}
-
-重要格式要求：
+# 在系统提示词中强调JSON格式要求，并给出JSON格式示例（追加在 system_prompt.md 之后）
+# 固定内容全部放在系统指令中，帖子内容单独作为用户消息，系统指令可以整体缓存
+GEMINI_PROMPT_SUFFIX = """重要格式要求：
 1. 必须以完整的JSON格式返回分析结果
 2. 即使判断内容与中国股市无关，也要按照完整的JSON格式返回
 3. 不要返回纯文本，必须是有效的JSON对象
 4. 如果相关性低，请在JSON中的"市场相关性"字段标注为"低"，在"个股建议"中返回空数组[]
 5. 请进行深度思考分析
-6. 请主动搜索相关的最新股票信息和市场数据"""
-        
-        # 创建模型实例
-        model = genai.GenerativeModel(
-            model_name=GEMINI_MODEL_NAME,
-            system_instruction=enhanced_system_prompt
-        )
-        
-        # 简化的生成参数配置
-        generation_config = genai.types.GenerationConfig(
-            temperature=0.1,
-            top_p=0.8,
-            top_k=40,
-            max_output_tokens=8192,
-            response_mime_type="application/json"  # 只强制JSON格式
-        )
-        
-        # 构建完整的提示，包含JSON格式示例
-        full_prompt = f"""请分析以下特朗普社交媒体内容对中国A股市场的影响：
-
-{user_content}
+6. 请主动搜索相关的最新股票信息和市场数据
 
 请严格按照以下JSON格式返回结果：
-{{
+{
     "分析时间": "2025-05-25 18:12:00",
     "特朗普言论摘要": "核心内容概括",
     "市场相关性": "高/中/低",
     "综合评分": "+XX%或-XX%",
-    "影响分析": {{
+    "影响分析": {
         "直接影响": "具体说明",
         "影响路径": "传导链条",
         "影响时限": "短期/中期/长期",
         "影响强度": "重大/中等/轻微"
-    }},
-    "搜索发现": {{
+    },
+    "搜索发现": {
         "关键信息": ["信息1", "信息2"],
         "数据来源": ["来源1", "来源2"]
-    }},
+    },
     "个股建议": [],
     "风险提示": "风险提示内容",
     "思维链": "完整的分析推理过程"
-}}
+}
 
 请确保返回的是有效的JSON格式。"""
-        
-        # 发送请求
-        response = model.generate_content(
-            full_prompt,
-            generation_config=generation_config
-        )
-        
-        if response.text:
-            analysis_result_str = response.text
-            
-            logger.info("GEMINI分析完成。")
-            logger.debug(f"GEMINI原始输出: {response}")
-            
+
+# 用户消息只包含帖子内容；{user_content} 为帖子内容
+GEMINI_USER_PROMPT_TEMPLATE = """请分析以下特朗普社交媒体内容对中国A股市场的影响，按系统指令中的JSON格式返回结果：
+
+{user_content}"""
+
+# 简化的生成参数配置
+GEMINI_GENERATION_PARAMS = {
+    "temperature": 0.1,
+    "top_p": 0.8,
+    "top_k": 40,
+    "max_output_tokens": 8192,
+    "response_mime_type": "application/json"  # 只强制JSON格式
+}
+
+# 生成参数对象不随请求变化，只创建一次
+GEMINI_GENERATION_CONFIG = genai.types.GenerationConfig(**GEMINI_GENERATION_PARAMS)
+
+# 上下文缓存（CachedContent）：{(模型名称, 提示词哈希): (GenerativeModel, CachedContent, 过期时间)}
+_context_caches = {}
+# 创建缓存失败的提示词（例如提示词短于模型要求的最小token数），在记录的时间之前不再尝试
+_context_cache_failures = {}
+_context_cache_lock = threading.Lock()
+# 缓存剩余有效期不足这个秒数时重新创建，避免请求发出时缓存已过期
+_CONTEXT_CACHE_MARGIN = 120
+# 同时保留的上下文缓存数量（不同模型或提示词版本各占一个），超过时删除最早创建的
+_MAX_CONTEXT_CACHES = 4
+
+def get_cached_gemini_model(system_instruction, model_name=GEMINI_MODEL_NAME):
+    """
+    使用上下文缓存的 GenerativeModel，系统指令只在创建缓存时上传一次
+
+    system_prompt.md 变化（哈希不同）时创建新缓存，不再使用的旧缓存超过
+    _MAX_CONTEXT_CACHES 个后被删除；缓存快过期时也重新创建。
+
+    Returns:
+        GenerativeModel: 绑定了缓存的模型，缓存不可用时返回None
+    """
+    key = (model_name, prompt_digest(system_instruction))
+    digest = key[1]
+    now = time.time()
+    with _context_cache_lock:
+        entry = _context_caches.get(key)
+        if entry and entry[2] - now > _CONTEXT_CACHE_MARGIN:
+            return entry[0]
+        if _context_cache_failures.get(key, 0) > now:
+            return None
+        _context_caches.pop(key, None)
+
+        # 删除最早创建的旧缓存（例如提示词修改前的版本）
+        while len(_context_caches) >= _MAX_CONTEXT_CACHES:
+            old_key = next(iter(_context_caches))
+            old_cache = _context_caches.pop(old_key)[1]
             try:
-                # 直接解析JSON
-                analysis_result_json = json.loads(analysis_result_str)
-                logger.info("GEMINI JSON解析成功")
-                return analysis_result_json
-                
-            except json.JSONDecodeError as e:
-                logger.error(f"无法将GEMINI的输出解析为JSON: '{analysis_result_str[:500]}...'. 错误: {e}")
+                old_cache.delete()
+                logger.info(f"删除不再使用的GEMINI上下文缓存 {old_cache.name}")
+            except Exception as e:
+                logger.debug(f"删除GEMINI上下文缓存失败: {e}")
+
+        ttl = timedelta(minutes=config.GEMINI_CONTEXT_CACHE_TTL_MINUTES)
+        try:
+            cache = caching.CachedContent.create(
+                model=model_name,
+                display_name=f"system-prompt-{digest}",
+                system_instruction=system_instruction,
+                ttl=ttl
+            )
+            model = genai.GenerativeModel.from_cached_content(cache)
+        except Exception as e:
+            # 提示词太短或模型不支持缓存时会失败，一小时内直接发送系统指令
+            logger.warning(f"创建GEMINI上下文缓存失败，改为每次发送系统指令: {e}")
+            _context_cache_failures[key] = now + 3600
+            return None
+
+        _context_caches[key] = (model, cache, now + ttl.total_seconds())
+        logger.info(f"已创建GEMINI上下文缓存 {cache.name}（有效期 {config.GEMINI_CONTEXT_CACHE_TTL_MINUTES:g} 分钟）")
+        return model
+
+def get_gemini_model(system_instruction, model_name=GEMINI_MODEL_NAME):
+    """
+    进程内共享的 GenerativeModel（按模型和系统提示词区分）
+
+    开启 AI_PROMPT_CACHE_ENABLED 时优先使用上下文缓存。
+    底层的gRPC通道由 genai.configure() 创建并在进程内复用，
+    这里只避免每次分析都重新构建模型对象。
+    """
+    if config.AI_PROMPT_CACHE_ENABLED:
+        model = get_cached_gemini_model(system_instruction, model_name)
+        if model is not None:
+            return model
+    return get_client(("google", model_name, prompt_digest(system_instruction)), lambda: genai.GenerativeModel(
+        model_name=model_name,
+        system_instruction=system_instruction
+    ))
+
+def format_content_for_gemini(scraped_post_data):
+    """
+    将采集到的帖子数据格式化为适合GEMINI的内容
+    """
+    # 注意：GEMINI支持图片分析，这里可以扩展为实际上传图片到GEMINI进行分析
+    return format_post_text(scraped_post_data) or "没有可供分析的内容。"
+
+class GeminiAnalyzer(Analyzer):
+    """使用GEMINI分析内容"""
+    name = "gemini"
+    label = "GEMINI"
+    multimodal = False
+    structured_output = True
+    max_concurrency = int(os.getenv("GEMINI_MAX_CONCURRENCY", "2"))
+    provider = "google"
+    model_name = GEMINI_MODEL_NAME
+    generation_params = {
+        **GEMINI_GENERATION_PARAMS,
+        "prompt_suffix": GEMINI_PROMPT_SUFFIX,
+        "user_prompt_template": GEMINI_USER_PROMPT_TEMPLATE,
+    }
+
+    def is_available(self):
+        return bool(GEMINI_API_KEY)
+
+    def _analyze(self, scraped_post_data, system_prompt_text, on_field=None):
+        if not GEMINI_API_KEY:
+            logger.error("GEMINI API Key 未配置，无法进行分析。")
+            return None
+
+        try:
+            logger.info(f"向GEMINI发送内容进行分析 (模型: {self.model_name}，流式输出)...")
+
+            # 格式化内容
+            user_content = format_content_for_gemini(scraped_post_data)
+
+            # 在系统提示词中强调JSON格式要求
+            enhanced_system_prompt = f"{system_prompt_text}\n\n{GEMINI_PROMPT_SUFFIX}"
+
+            # 复用进程内的模型实例（优先使用上下文缓存）
+            model = get_gemini_model(enhanced_system_prompt, self.model_name)
+
+            # 用户消息只包含帖子内容，JSON格式示例在系统指令中
+            full_prompt = GEMINI_USER_PROMPT_TEMPLATE.format(user_content=user_content)
+
+            def stream_text(response):
+                usage = None
+                for chunk in response:
+                    usage = getattr(chunk, 'usage_metadata', None) or usage
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        # 没有文本的片段（例如只有安全评级或结束原因）
+                        continue
+                    if text:
+                        yield text
+                # 最后一个片段带有本次调用的token用量
+                if usage is not None:
+                    record_usage(self.provider, getattr(usage, 'prompt_token_count', 0),
+                                 getattr(usage, 'cached_content_token_count', 0),
+                                 getattr(usage, 'candidates_token_count', 0))
+
+            def open_stream():
+                # 发送请求
+                return model.generate_content(
+                    full_prompt,
+                    generation_config=GEMINI_GENERATION_CONFIG,
+                    stream=True
+                )
+
+            def request():
+                return self.collect_stream(stream_text(timed_stream(self.provider, open_stream)), on_field)
+
+            # 限流、临时错误重试、熔断
+            analysis_result_json, analysis_result_str = self.guard.call(request)
+
+            if not analysis_result_str:
+                logger.error("GEMINI返回空响应")
+                return build_fallback_result("GEMINI returned empty response", status="无响应")
+
+            logger.info("GEMINI分析完成。")
+            logger.debug("GEMINI原始输出: %s", analysis_result_str)
+
+            if analysis_result_json is None:
+                logger.error(f"无法将GEMINI的输出解析为JSON: '{analysis_result_str[:500]}...'")
                 # 创建fallback JSON
-                fallback_json = {
-                    "error": "Failed to parse GEMINI response as JSON",
-                    "raw_response": analysis_result_str,
-                    "分析时间": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "市场相关性": "解析失败",
-                    "综合评分": "0%",
-                    "影响分析": {
-                        "直接影响": "JSON解析失败",
-                        "影响路径": "无法解析",
-                        "影响时限": "无",
-                        "影响强度": "无"
-                    },
-                    "搜索发现": {
-                        "关键信息": [],
-                        "数据来源": []
-                    },
-                    "个股建议": [],
-                    "风险提示": "本分析因JSON解析失败，结果可能不准确。",
-                    "思维链": analysis_result_str
-                }
+                fallback_json = build_fallback_result(
+                    "Failed to parse GEMINI response as JSON",
+                    status="解析失败",
+                    raw_response=analysis_result_str
+                )
+                fallback_json["风险提示"] = "本分析因JSON解析失败，结果可能不准确。"
+                fallback_json["思维链"] = analysis_result_str
                 return fallback_json
-        else:
-            logger.error("GEMINI返回空响应")
-            return {
-                "error": "GEMINI returned empty response",
-                "分析时间": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "市场相关性": "无响应",
-                "综合评分": "0%"
-            }
-
-    except Exception as e:
-        logger.error(f"与GEMINI交互时发生未知错误: {str(e)}", exc_info=True)
-        return {
-            "error": f"GEMINI interaction error: {str(e)}",
-            "分析时间": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "市场相关性": "错误",
-            "综合评分": "0%"
-        } 
\ No newline at end of file
+
+            logger.info("GEMINI JSON解析成功")
+            return analysis_result_json
+
+        except Exception as e:
+            logger.error(f"与GEMINI交互时发生未知错误: {str(e)}", exc_info=True)
+            return build_fallback_result(f"GEMINI interaction error: {str(e)}", status="错误")
+
+gemini_analyzer = register_analyzer(GeminiAnalyzer())
+
+def analyze_content_with_gemini(scraped_post_data, system_prompt_text):
+    """兼容旧接口：使用已注册的GEMINI分析器"""
+    return gemini_analyzer.analyze(scraped_post_data, system_prompt_text)
@@ -0,0 +1,185 @@
+import re
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = " \t\r\n"
+_LITERAL_END = ",}]" + _WHITESPACE
+_PARTIAL_UNICODE_ESCAPE = re.compile(r"\\u[0-9a-fA-F]{0,3}$")
+
+class IncrementalJSONParser:
+    """
+    流式输出的增量JSON解析器
+
+    逐块喂入模型输出的文本，顶层对象的每个字段一写完就可以拿到，
+    不必等整个响应结束；第一个 "{" 之前的内容（例如 ```json 代码块标记）会被忽略。
+    输出被截断时，partial_result() 会补全括号和未结束的字符串，尽量保留已经输出的内容。
+
+    用法:
+        parser = IncrementalJSONParser()
+        for chunk in stream:
+            for key, value in parser.feed(chunk):
+                ...
+        result = parser.result() if parser.complete else parser.partial_result()
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.fields = {}
+        self.complete = False
+
+        self._pos = 0
+        self._start = None  # 顶层 "{" 的位置
+        self._end = None  # 顶层 "}" 之后的位置
+        # 每层容器: [类型("obj"/"arr"), 期待的下一个记号("key"/"colon"/"value"/"comma")]
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._string_is_key = False
+        self._literal_start = None
+        self._key = None  # 顶层对象当前字段名
+        self._value_start = None  # 顶层对象当前字段值的起始位置
+        self._safe_end = None  # 最近一个可以截断并补全括号的位置
+        self._safe_closers = ""
+
+    def feed(self, chunk):
+        """
+        喂入一段文本
+
+        Returns:
+            list: 本次新完成的顶层字段 [(字段名, 值)]
+        """
+        if not chunk or self.complete:
+            return []
+        self.text += chunk
+        completed = []
+        text = self.text
+        i = self._pos
+        while i < len(text) and not self.complete:
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._string_is_key:
+                        frame = self._stack[-1]
+                        frame[1] = "colon"
+                        if len(self._stack) == 1:
+                            self._key = json.loads(text[self._string_start:i + 1])
+                    else:
+                        self._value_done(i + 1, completed)
+                i += 1
+                continue
+
+            if self._literal_start is not None:
+                if c not in _LITERAL_END:
+                    i += 1
+                    continue
+                # 数字/true/false/null 结束，当前字符继续按结构字符处理
+                self._literal_start = None
+                self._value_done(i, completed)
+
+            if self._start is None:
+                if c == "{":
+                    self._start = i
+                    self._stack.append(["obj", "key"])
+                    self._mark_safe(i + 1)
+                i += 1
+                continue
+
+            if c in _WHITESPACE:
+                pass
+            elif c in "{[":
+                if len(self._stack) == 1:
+                    self._value_start = i
+                self._stack.append(["obj", "key"] if c == "{" else ["arr", "value"])
+                self._mark_safe(i + 1)
+            elif c in "}]":
+                self._stack.pop()
+                if not self._stack:
+                    self._end = i + 1
+                    self.complete = True
+                else:
+                    self._value_done(i + 1, completed)
+            elif c == ",":
+                frame = self._stack[-1]
+                frame[1] = "key" if frame[0] == "obj" else "value"
+            elif c == ":":
+                self._stack[-1][1] = "value"
+            elif c == '"':
+                frame = self._stack[-1]
+                self._in_string = True
+                self._string_start = i
+                self._string_is_key = frame[0] == "obj" and frame[1] == "key"
+                if len(self._stack) == 1 and not self._string_is_key:
+                    self._value_start = i
+            else:
+                self._literal_start = i
+                if len(self._stack) == 1:
+                    self._value_start = i
+            i += 1
+        self._pos = i
+        return completed
+
+    def _closers(self):
+        return "".join("}" if frame[0] == "obj" else "]" for frame in reversed(self._stack))
+
+    def _mark_safe(self, end):
+        self._safe_end = end
+        self._safe_closers = self._closers()
+
+    def _value_done(self, end, completed):
+        self._stack[-1][1] = "comma"
+        self._mark_safe(end)
+        if len(self._stack) == 1 and self._key is not None:
+            try:
+                value = json.loads(self.text[self._value_start:end])
+            except ValueError as e:
+                logger.debug(f"字段 {self._key} 解析失败: {e}")
+                return
+            self.fields[self._key] = value
+            completed.append((self._key, value))
+
+    def result(self):
+        """完整的JSON对象（complete 为True时可用）"""
+        if not self.complete:
+            raise ValueError("JSON输出尚未结束")
+        return json.loads(self.text[self._start:self._end])
+
+    def partial_result(self):
+        """
+        从被截断的输出中恢复尽可能多的内容
+
+        Returns:
+            dict: 恢复出的对象，没有任何可用内容时返回None
+        """
+        if self.complete:
+            return self.result()
+        if self._start is None:
+            return None
+
+        candidates = []
+        if self._in_string and not self._string_is_key:
+            # 截断在字符串值中间：去掉不完整的转义序列后补上引号
+            text = self.text[self._start:]
+            if self._escape:
+                text = text[:-1]
+            else:
+                text = _PARTIAL_UNICODE_ESCAPE.sub("", text)
+            candidates.append(text + '"' + self._closers())
+        if self._safe_end is not None:
+            candidates.append(self.text[self._start:self._safe_end] + self._safe_closers)
+
+        for candidate in candidates:
+            try:
+                recovered = json.loads(candidate)
+            except ValueError:
+                continue
+            if isinstance(recovered, dict) and recovered:
+                return recovered
+        return dict(self.fields) or None
@@ -0,0 +1,150 @@
+import os
+import sys
+import time
+import hashlib
+import logging
+import threading
+
+# 将项目根目录添加到sys.path，以便导入config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+
+logger = logging.getLogger(__name__)
+
+# system_prompt.md 缺失或为空时使用的默认提示词
+DEFAULT_SYSTEM_PROMPT = "你是一位金融分析师，请分析以下内容并以JSON格式返回结果，确保分析结果是一个合法的JSON对象。"
+
+# 默认提示词（docs/system_prompt.md）的名称
+DEFAULT_PROMPT_NAME = "system_prompt"
+
+class PromptVersion:
+    """
+    一个已加载的提示词
+
+    Attributes:
+        name (str): 提示词名称（system_prompt 或 docs/prompts/ 下的变体名）
+        text (str): 提示词内容
+        sha256 (str): 内容的sha256，用于缓存键
+        version (str): 写入分析结果的版本标识，格式为 "名称@哈希前12位"
+        path (Path): 来源文件，内置默认提示词为None
+    """
+
+    def __init__(self, name, text, path=None, mtime=None):
+        self.name = name
+        self.text = text
+        self.path = path
+        self.mtime = mtime
+        self.sha256 = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        self.version = f"{name}@{self.sha256[:12]}"
+
+    def provenance(self):
+        """写入分析结果的提示词来源信息"""
+        return {"name": self.name, "version": self.version, "sha256": self.sha256}
+
+    def __repr__(self):
+        return f"<PromptVersion {self.version}>"
+
+class PromptRegistry:
+    """
+    提示词注册表：启动时加载一次，之后按文件修改时间热更新
+
+    默认所有模型使用 docs/system_prompt.md；PROMPT_VARIANTS 可以为单个模型指定
+    docs/prompts/{变体名}.md。文件被修改后，在 PROMPT_RELOAD_INTERVAL 秒内重新加载；
+    重新加载失败（文件被删除或清空）时继续使用上一次成功加载的内容。
+
+    Args:
+        prompt_file (Path, optional): 默认提示词文件，默认 config.SYSTEM_PROMPT_FILE
+        variant_dir (Path, optional): 变体目录，默认 config.PROMPT_VARIANT_DIR
+        variants (dict, optional): {分析器名称: 变体名}，默认 config.PROMPT_VARIANTS
+        reload_interval (float, optional): 检查文件变化的最小间隔（秒），默认 config.PROMPT_RELOAD_INTERVAL
+    """
+
+    def __init__(self, prompt_file=None, variant_dir=None, variants=None, reload_interval=None):
+        self.prompt_file = prompt_file or config.SYSTEM_PROMPT_FILE
+        self.variant_dir = variant_dir or config.PROMPT_VARIANT_DIR
+        self.variants = dict(variants if variants is not None else config.PROMPT_VARIANTS)
+        self.reload_interval = reload_interval if reload_interval is not None else config.PROMPT_RELOAD_INTERVAL
+        self._prompts = {}  # {提示词名称: PromptVersion}
+        self._checked = {}  # {提示词名称: 上次检查文件的时间}
+        self._lock = threading.Lock()
+
+    def _path_for(self, name):
+        if name == DEFAULT_PROMPT_NAME:
+            return self.prompt_file
+        return self.variant_dir / f"{name}.md"
+
+    def _load(self, name, current):
+        """读取提示词文件；文件没有变化时返回 current，读取失败时返回None"""
+        path = self._path_for(name)
+        try:
+            mtime = os.stat(path).st_mtime
+            if current is not None and current.path == path and current.mtime == mtime:
+                return current
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read().strip()
+            if not text:
+                raise ValueError(f"{path.name} 文件内容为空或只有注释。")
+        except FileNotFoundError:
+            logger.error(f"未找到提示词文件: {path}")
+            return None
+        except (OSError, ValueError) as e:
+            logger.error(f"加载提示词 {name} 失败: {e}")
+            return None
+
+        prompt = PromptVersion(name, text, path=path, mtime=mtime)
+        if current is None:
+            logger.info(f"成功加载提示词 {prompt.version}")
+        elif prompt.sha256 != current.sha256:
+            logger.info(f"提示词已更新: {current.version} -> {prompt.version}")
+        return prompt
+
+    def get(self, analyzer_name=None, variant=None):
+        """
+        获取分析器使用的提示词
+
+        Args:
+            analyzer_name (str, optional): 分析器名称，用于查找 PROMPT_VARIANTS 中的变体
+            variant (str, optional): 直接指定变体名（例如 benchmark.py 对比不同提示词时），优先于 PROMPT_VARIANTS
+
+        Returns:
+            PromptVersion: 提示词；默认提示词文件不可用时返回内置的 DEFAULT_SYSTEM_PROMPT
+        """
+        name = variant or self.variants.get(analyzer_name, DEFAULT_PROMPT_NAME)
+        with self._lock:
+            current = self._prompts.get(name)
+            now = time.monotonic()
+            if current is None or now - self._checked.get(name, 0) >= self.reload_interval:
+                self._checked[name] = now
+                loaded = self._load(name, current)
+                if loaded is not None:
+                    self._prompts[name] = current = loaded
+                elif current is not None:
+                    logger.warning(f"继续使用上一次加载的提示词 {current.version}")
+            if current is not None:
+                return current
+
+        if name != DEFAULT_PROMPT_NAME:
+            logger.warning(f"{analyzer_name or ''} 的提示词变体 {name} 不可用，使用默认提示词")
+            return self.get()
+        logger.error("使用默认分析提示。")
+        return PromptVersion("default", DEFAULT_SYSTEM_PROMPT)
+
+    def versions(self):
+        """已加载的提示词版本 {名称: 版本标识}"""
+        with self._lock:
+            return {name: prompt.version for name, prompt in self._prompts.items()}
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry():
+    """进程内共享的提示词注册表"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PromptRegistry()
+        return _registry
+
+def get_prompt(analyzer_name=None, variant=None):
+    """获取分析器使用的提示词（见 PromptRegistry.get）"""
+    return get_registry().get(analyzer_name, variant)
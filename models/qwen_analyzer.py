@@ -2,7 +2,6 @@
 import json
 import logging
 import os
-from dotenv import load_dotenv
 from pathlib import Path
 import sys
 import dashscope
@@ -13,20 +12,22 @@ from dashscope import MultiModalConversation, Generation
 # 将项目根目录添加到sys.path，以便导入config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import config
+import storage
+from logging_setup import LazyJSON
+from models.base_analyzer import (
+    Analyzer, format_post_text, build_fallback_result
+)
+from models.registry import register_analyzer
+from models.resilience import ProviderError
+from models.clients import load_env, mask_key, timed_stream, record_usage
 
 logger = logging.getLogger(__name__)
 
-# 加载 .env 文件
-env_path = config.BASE_DIR / ".env"
-if env_path.exists():
-    logger.info(f"尝试加载 .env 文件: {env_path}")
-    load_dotenv(dotenv_path=env_path, override=True)
-    logger.info(f".env 文件已处理。")
-else:
-    logger.warning(f".env 文件未在 {env_path} 找到。")
+# 加载 .env 文件（进程内只加载一次）
+load_env()
 
 DASHSCOPE_API_KEY = os.getenv("DASHSCOPE_API_KEY")
-logger.info(f"获取到的 DASHSCOPE_API_KEY (通过 os.getenv): {DASHSCOPE_API_KEY}")
+logger.debug(f"DASHSCOPE_API_KEY: {mask_key(DASHSCOPE_API_KEY)}")
 
 # 模型配置
 default_text_model = "qwen-max"  # 文本使用
@@ -35,12 +36,42 @@ default_video_model = "qwen2.5-vl-72b-instruct"  # 视频和图片使用
 QWEN_TEXT_MODEL = os.getenv("QWEN_MODEL_NAME", default_text_model)
 QWEN_VIDEO_MODEL = os.getenv("QWEN_VIDEO_MODEL_NAME", default_video_model)
 
-logger.info(f"文本模型: '{QWEN_TEXT_MODEL}'")
-logger.info(f"视觉模型(图片/视频): '{QWEN_VIDEO_MODEL}'")
+logger.debug(f"文本模型: '{QWEN_TEXT_MODEL}'，视觉模型(图片/视频): '{QWEN_VIDEO_MODEL}'")
 
 if not DASHSCOPE_API_KEY:
     logger.error("未找到 Dashscope API 密钥 (DASHSCOPE_API_KEY)，无法与通义千问交互。")
 
+# 生成参数（Generation API 直接传入，MultiModalConversation API 通过 extra_body 传入）
+QWEN_GENERATION_PARAMS = {
+    "enable_search": True,  # 启用联网搜索
+    "search_options": {
+        "forced_search": True  # 强制搜索
+    },
+    "enable_thinking": True,  # 启用思维链功能
+    "thinking_budget": 10000,  # 思考过程的最大长度
+    "response_format": {"type": "json_object"}  # 强制JSON格式输出
+}
+
+def detect_media_type(scraped_post_data):
+    """
+    判断帖子会以哪种媒体类型发送给通义千问，与 format_media_and_text_for_qwen 的规则一致
+
+    Returns:
+        str: 'video', 'image' 或 'text'
+    """
+    video = scraped_post_data.get("videos")
+    if video and video != "null" and isinstance(video, str) and Path(video).is_file():
+        return 'video'
+    images = scraped_post_data.get("images")
+    if images and images != "null" and isinstance(images, list):
+        if any(isinstance(img, str) and img and Path(img).is_file() for img in images):
+            return 'image'
+    return 'text'
+
+def select_qwen_model(media_type, text_model=QWEN_TEXT_MODEL, video_model=QWEN_VIDEO_MODEL):
+    """图片和视频都使用视觉模型，纯文本使用文本模型"""
+    return video_model if media_type in ['video', 'image'] else text_model
+
 def format_media_and_text_for_qwen(scraped_post_data):
     """
     将采集到的帖子数据格式化为适合通义千问 MultiModalConversation 的内容列表。
@@ -91,17 +122,8 @@ def format_media_and_text_for_qwen(scraped_post_data):
                 media_type = 'image'
                 logger.info(f"图片文件已准备 (作为视频帧): {len(image_urls)}张")
 
-    # 构建文本描述
-    text_parts = []
-    text_content = scraped_post_data.get("text")
-    if text_content and isinstance(text_content, str) and text_content.strip():
-        text_parts.append(text_content.strip())
-    
-    url_content = scraped_post_data.get("url")
-    if url_content and isinstance(url_content, str) and url_content.strip() and url_content != "null":
-        text_parts.append(f"相关链接: {url_content}")
-    
-    text_description = "\n".join(text_parts)
+    # 构建文本描述（媒体已直接传入，不需要数量说明）
+    text_description = format_post_text(scraped_post_data, text_label="", include_media_summary=False)
     
     # 如果完全没有内容，提供默认文本
     if not text_description.strip() and media_type == 'text':
@@ -113,197 +135,191 @@ def format_media_and_text_for_qwen(scraped_post_data):
 
     return content_list, media_type
 
-def analyze_content_with_qwen(scraped_post_data, system_prompt_text):
-    if not DASHSCOPE_API_KEY:
-        logger.error("Dashscope API Key 未配置，无法进行分析。")
-        return None
+def extract_stream_text(response):
+    """
+    从流式响应的一个片段中取出新增的文本（兼容 Generation 和 MultiModalConversation 两种格式）
 
-    try:
-        logger.info("向通义千问发送内容进行分析...")
-        
-        user_formatted_content, media_type = format_media_and_text_for_qwen(scraped_post_data)
-        
-        if not user_formatted_content:
-            logger.error("格式化后的用户输入内容为空或无效，无法发送给通义千问。")
+    Returns:
+        tuple: (正文片段, 思考过程片段)
+
+    Raises:
+        ProviderError: 接口返回错误（带状态码，429/5xx 会被重试）
+    """
+    if response.status_code != 200:
+        raise ProviderError(
+            f"API调用失败。状态码: {response.status_code}, "
+            f"错误代码: {getattr(response, 'code', None)}, 错误信息: {getattr(response, 'message', None)}",
+            status_code=response.status_code
+        )
+    output = response.output or {}
+    choices = output.get('choices')
+    if not choices:
+        return output.get('text') or "", ""
+
+    message = choices[0].get('message') or {}
+    content = message.get('content')
+    if isinstance(content, list):
+        content = "".join(part.get('text', '') for part in content if isinstance(part, dict))
+    return content or "", message.get('reasoning_content') or ""
+
+class QwenAnalyzer(Analyzer):
+    """通义千问分析器：视频/图片走 MultiModalConversation，纯文本走 Generation"""
+    name = "qwen"
+    label = "QWEN"
+    multimodal = True
+    structured_output = True
+    max_concurrency = int(os.getenv("QWEN_MAX_CONCURRENCY", "2"))
+    provider = "dashscope"
+    model_name = QWEN_TEXT_MODEL
+    video_model = QWEN_VIDEO_MODEL
+    generation_params = QWEN_GENERATION_PARAMS
+
+    def is_available(self):
+        return bool(DASHSCOPE_API_KEY)
+
+    def cache_identity(self, post):
+        return select_qwen_model(detect_media_type(post), self.model_name, self.video_model), self.generation_params
+
+    def _analyze(self, scraped_post_data, system_prompt_text, on_field=None):
+        if not DASHSCOPE_API_KEY:
+            logger.error("Dashscope API Key 未配置，无法进行分析。")
             return None
 
-        # 根据媒体类型选择模型
-        if media_type in ['video', 'image']:  # 图片和视频都使用视觉模型
-            model_name = QWEN_VIDEO_MODEL
-            logger.info(f"检测到视频内容，使用视频模型: {model_name}")
-        else:
-            model_name = QWEN_TEXT_MODEL
-            logger.info(f"检测到{media_type}内容，使用文本/图片模型: {model_name}")
+        try:
+            logger.info("向通义千问发送内容进行分析...")
+
+            user_formatted_content, media_type = format_media_and_text_for_qwen(scraped_post_data)
+
+            if not user_formatted_content:
+                logger.error("格式化后的用户输入内容为空或无效，无法发送给通义千问。")
+                return None
+
+            # 根据媒体类型选择模型
+            model_name = select_qwen_model(media_type, self.model_name, self.video_model)
+            if media_type in ['video', 'image']:  # 图片和视频都使用视觉模型
+                logger.info(f"检测到视频内容，使用视频模型: {model_name}")
+            else:
+                logger.info(f"检测到{media_type}内容，使用文本/图片模型: {model_name}")
+
+            # 系统提示词固定作为第一条消息，帖子内容在后，相同前缀可以命中百炼的隐式上下文缓存
+
+            # 如果是纯文本，使用Generation API
+            if media_type == 'text' and all(part.get('text') for part in user_formatted_content):
+                logger.info("使用Generation API处理纯文本（流式输出）")
+
+                # 提取纯文本内容
+                text_content = ""
+                for part in user_formatted_content:
+                    if part.get('text'):
+                        text_content += part['text'] + "\n"
+
+                messages = [
+                    {'role': 'system', 'content': system_prompt_text},
+                    {'role': 'user', 'content': text_content.strip()}
+                ]
+
+                def call_api():
+                    return Generation.call(
+                        api_key=DASHSCOPE_API_KEY,
+                        model=model_name,
+                        messages=messages,
+                        result_format='message',
+                        stream=True,
+                        incremental_output=True,
+                        **QWEN_GENERATION_PARAMS
+                    )
+
+            else:
+                # 使用多模态API处理视频/图片
+                logger.info("使用MultiModalConversation API处理多媒体（流式输出）")
+                messages = [
+                    {'role': 'system', 'content': [{'text': system_prompt_text}]},
+                    {'role': 'user', 'content': user_formatted_content}
+                ]
+
+                # 多模态API使用extra_body传递参数
+                def call_api():
+                    return MultiModalConversation.call(
+                        api_key=DASHSCOPE_API_KEY,
+                        model=model_name,
+                        messages=messages,
+                        stream=True,
+                        incremental_output=True,
+                        extra_body=dict(QWEN_GENERATION_PARAMS)
+                    )
+
+            def stream_text(responses):
+                thinking_started = False
+                usage = None
+                for response in responses:
+                    text, reasoning = extract_stream_text(response)
+                    usage = getattr(response, 'usage', None) or usage
+                    # 思考过程只提示一次，不参与JSON解析
+                    if reasoning and not thinking_started:
+                        thinking_started = True
+                        logger.info("通义千问正在思考...")
+                    if text:
+                        yield text
+                # 每个片段都带有累计的token用量，取最后一个
+                if usage:
+                    details = usage.get('prompt_tokens_details') or {}
+                    record_usage(self.provider, usage.get('input_tokens', 0), details.get('cached_tokens', 0),
+                                 usage.get('output_tokens', 0))
+
+            def request():
+                # dashscope SDK 在进程内共享HTTP会话，这里只记录调用耗时
+                return self.collect_stream(stream_text(timed_stream(self.provider, call_api)), on_field)
+
+            # 限流、临时错误重试、熔断
+            analysis_result_json, analysis_result_str = self.guard.call(request)
 
-        # 如果是纯文本，使用Generation API
-        if media_type == 'text' and all(part.get('text') for part in user_formatted_content):
-            logger.info("使用Generation API处理纯文本")
-            
-            # 提取纯文本内容
-            text_content = ""
-            for part in user_formatted_content:
-                if part.get('text'):
-                    text_content += part['text'] + "\n"
-            
-            messages = [
-                {'role': 'system', 'content': system_prompt_text},
-                {'role': 'user', 'content': text_content.strip()}
-            ]
-            
-            response = Generation.call(
-                api_key=DASHSCOPE_API_KEY,
-                model=model_name,
-                messages=messages,
-                result_format='message',
-                enable_search=True,  # 启用联网搜索
-                search_options={
-                    "forced_search": True  # 强制搜索
-                },
-                enable_thinking=True,  # 启用思维链功能
-                thinking_budget=10000,  # 思考过程的最大长度
-                response_format={"type": "json_object"}  # 强制JSON格式输出
-            )
-            
-        else:
-            # 使用多模态API处理视频/图片
-            logger.info("使用MultiModalConversation API处理多媒体")
-            messages = [
-                {'role': 'system', 'content': [{'text': system_prompt_text}]},
-                {'role': 'user', 'content': user_formatted_content}
-            ]
-            
-            # 多模态API使用extra_body传递参数
-            response = MultiModalConversation.call(
-                api_key=DASHSCOPE_API_KEY,
-                model=model_name,
-                messages=messages,
-                extra_body={
-                    "enable_search": True,  # 启用联网搜索
-                    "search_options": {
-                        "forced_search": True  # 强制搜索
-                    },
-                    "enable_thinking": True,  # 启用思维链
-                    "thinking_budget": 10000,
-                    "response_format": {"type": "json_object"}  # JSON格式输出
-                }
-            )
-
-        # 统一处理响应
-        if response.status_code == 200 and response.output:
-            analysis_result_str = None
-            
-            # 尝试从不同的响应格式中提取内容
-            if hasattr(response.output, 'choices') and response.output.choices:
-                choice = response.output.choices[0]
-                
-                # Generation API 响应
-                if hasattr(choice, 'message'):
-                    message = choice.message
-                    if hasattr(message, 'content'):
-                        analysis_result_str = message.content
-                    elif isinstance(message, dict) and 'content' in message:
-                        analysis_result_str = message['content']
-                    
-                # MultiModalConversation API 响应
-                elif hasattr(choice, 'message') and hasattr(choice.message, 'content'):
-                    message_content = choice.message.content
-                    if isinstance(message_content, list) and len(message_content) > 0:
-                        analysis_result_str = message_content[0].get("text", "")
-                    else:
-                        analysis_result_str = str(message_content)
-            
-            # 如果还是没有获取到，尝试其他方式
-            if not analysis_result_str:
-                if hasattr(response.output, 'text'):
-                    analysis_result_str = response.output.text
-                else:
-                    analysis_result_str = str(response.output)
-            
             if not analysis_result_str:
                 logger.error("API返回的分析结果为空")
                 return None
-                
-            logger.info("API调用成功，开始解析结果")
-            logger.debug(f"原始响应: {analysis_result_str[:500]}...")
-            
-            try:
-                # 清理可能的markdown格式
-                cleaned_response = analysis_result_str.strip()
-                
-                if cleaned_response.startswith('```json'):
-                    cleaned_response = cleaned_response[7:]
-                    if cleaned_response.endswith('```'):
-                        cleaned_response = cleaned_response[:-3]
-                    cleaned_response = cleaned_response.strip()
-                elif cleaned_response.startswith('```'):
-                    lines = cleaned_response.split('\n')
-                    if len(lines) > 1:
-                        cleaned_response = '\n'.join(lines[1:])
-                        if cleaned_response.endswith('```'):
-                            cleaned_response = cleaned_response[:-3]
-                    cleaned_response = cleaned_response.strip()
-                
-                # 尝试解析JSON
-                analysis_result_json = json.loads(cleaned_response)
-                logger.info("JSON解析成功")
-                return analysis_result_json
-                
-            except json.JSONDecodeError as e:
-                logger.error(f"无法将输出解析为JSON: {e}")
+
+            logger.info("API调用成功")
+            logger.debug("原始响应: %.500s...", analysis_result_str)
+
+            if analysis_result_json is None:
+                logger.error("无法将输出解析为JSON")
                 logger.info("返回默认结构")
-                return {
-                    "error": "Failed to parse response as JSON",
-                    "raw_response": analysis_result_str,
-                    "综合评分": "0%",
-                    "市场相关性": "无法分析",
-                    "影响分析": {
-                        "直接影响": "分析失败",
-                        "影响路径": "分析失败",
-                        "影响时限": "分析失败",
-                        "影响强度": "分析失败"
-                    },
-                    "风险提示": "由于技术原因无法完成分析"
-                }
-        else:
-            logger.error(f"API调用失败。状态码: {response.status_code}")
-            if hasattr(response, 'code'):
-                logger.error(f"错误代码: {response.code}")
-            if hasattr(response, 'message'):
-                logger.error(f"错误信息: {response.message}")
-            return None
+                return build_fallback_result(
+                    "Failed to parse response as JSON",
+                    status="无法分析",
+                    raw_response=analysis_result_str
+                )
 
-    except Exception as e:
-        logger.error(f"与通义千问交互时发生未知错误: {str(e)}", exc_info=True)
-    return None
+            logger.info("JSON解析成功")
+            return analysis_result_json
+
+        except Exception as e:
+            logger.error(f"与通义千问交互时发生未知错误: {str(e)}", exc_info=True)
+        return None
+
+qwen_analyzer = register_analyzer(QwenAnalyzer())
+
+def analyze_content_with_qwen(scraped_post_data, system_prompt_text=None):
+    """兼容旧接口：使用已注册的通义千问分析器"""
+    return qwen_analyzer.analyze(scraped_post_data, system_prompt_text)
 
 if __name__ == '__main__':
     config.init()
 
-    system_prompt_path = config.BASE_DIR / "docs" / "system_prompt.md"
-    try:
-        with open(system_prompt_path, 'r', encoding='utf-8') as f:
-            test_system_prompt = f.read().strip()
-    except FileNotFoundError:
-        logger.error(f"未找到 system_prompt.md 文件")
-        test_system_prompt = "你是一位金融分析师，请分析以下内容并以JSON格式返回结果。"
-
     latest_post_to_analyze = None
-    if config.HISTORY_FILE.exists():
-        try:
-            with open(config.HISTORY_FILE, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-                if history and isinstance(history, list) and len(history) > 0:
-                    latest_post_to_analyze = history[-1]
-                    logger.info(f"从 history.json 加载了最新的帖子 (ID: {latest_post_to_analyze.get('contentID')})")
-        except Exception as e:
-            logger.error(f"读取 history.json 失败: {e}")
+    try:
+        latest_post_to_analyze = storage.get_latest_post()
+        if latest_post_to_analyze:
+            logger.info(f"从帖子库加载了最新的帖子 (ID: {latest_post_to_analyze.get('contentID')})")
+    except Exception as e:
+        logger.error(f"读取帖子库失败: {e}")
 
     if latest_post_to_analyze:
-        analysis_result = analyze_content_with_qwen(latest_post_to_analyze, test_system_prompt)
+        # 提示词由注册表加载，与主流程使用同一版本
+        analysis_result = analyze_content_with_qwen(latest_post_to_analyze)
         
         if analysis_result:
             logger.info("通义千问分析结果:")
-            logger.info(json.dumps(analysis_result, indent=2, ensure_ascii=False))
+            logger.info("%s", LazyJSON(analysis_result, indent=2))
             
             result_file_name = f"{latest_post_to_analyze['contentID']}_qwen.json"
             result_file_path = config.RESULT_DIR / result_file_name
@@ -0,0 +1,66 @@
+import importlib
+import logging
+import os
+import sys
+
+# 将项目根目录添加到sys.path，以便导入config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+
+logger = logging.getLogger(__name__)
+
+# 已注册的分析器：{名称: Analyzer实例}，按注册顺序排列
+_analyzers = {}
+
+def register_analyzer(analyzer):
+    """
+    注册分析器实例，同名分析器会被替换
+
+    Returns:
+        Analyzer: 传入的分析器，方便在模块级别直接赋值
+    """
+    if not analyzer.name:
+        raise ValueError(f"分析器缺少名称: {analyzer!r}")
+    _analyzers[analyzer.name] = analyzer
+    logger.debug(f"已注册分析器: {analyzer!r}")
+    return analyzer
+
+def unregister_analyzer(name):
+    """移除已注册的分析器"""
+    _analyzers.pop(name, None)
+
+def get_analyzer(name):
+    """按名称获取分析器，未注册时返回None"""
+    return _analyzers.get(name)
+
+def get_analyzers():
+    """按注册顺序返回所有分析器"""
+    return list(_analyzers.values())
+
+def load_analyzers(names=None):
+    """
+    导入并注册分析器模块（models/{name}_analyzer.py）
+
+    新增模型只需放入对应模块并加入 AI_ANALYZERS 配置，无需修改 main.py。
+
+    Args:
+        names (list, optional): 要加载的分析器名称，默认使用 config.AI_ANALYZERS
+
+    Returns:
+        list: 成功加载的分析器，顺序与 names 一致
+    """
+    names = names if names is not None else config.AI_ANALYZERS
+    loaded = []
+    for name in names:
+        if name not in _analyzers:
+            try:
+                importlib.import_module(f"models.{name}_analyzer")
+            except Exception as e:
+                logger.error(f"加载分析器 {name} 失败: {e}")
+                continue
+        analyzer = _analyzers.get(name)
+        if analyzer is None:
+            logger.error(f"模块 models.{name}_analyzer 未注册名为 {name} 的分析器")
+            continue
+        loaded.append(analyzer)
+    return loaded
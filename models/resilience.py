@@ -0,0 +1,245 @@
+import os
+import sys
+import time
+import random
+import logging
+import threading
+
+# 将项目根目录添加到sys.path，以便导入config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# 可以重试的HTTP状态码（限流、服务端错误）
+TRANSIENT_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+class ProviderError(Exception):
+    """接口返回的错误（SDK没有抛出异常、只在响应中给出状态码时使用）"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+class CircuitOpenError(Exception):
+    """提供商处于熔断状态，本次调用被直接跳过"""
+
+def status_code_of(exc):
+    """从各SDK的异常中取出HTTP状态码，取不到时返回None"""
+    for attr in ("status_code", "http_status", "code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int) and 100 <= value < 600:
+            return value
+    response = getattr(exc, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+def is_transient(exc):
+    """
+    是否为值得重试的临时错误：429/5xx、超时、连接错误
+
+    不依赖具体SDK的异常类型（openai、google-api-core、dashscope、requests 各不相同），
+    按状态码和异常类名判断。
+    """
+    status = status_code_of(exc)
+    if status is not None:
+        return status in TRANSIENT_STATUS_CODES
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    names = [cls.__name__ for cls in type(exc).__mro__]
+    return any("Timeout" in name or "Connection" in name or name in ("ServiceUnavailable", "DeadlineExceeded")
+               for name in names)
+
+def retry_after_of(exc):
+    """接口通过 Retry-After 头指定的等待秒数，没有时返回None"""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    """
+    令牌桶限流
+
+    Args:
+        rate_per_minute (float): 每分钟补充的令牌数，<=0 表示不限流
+        burst (int): 桶容量（允许的突发请求数）
+    """
+
+    def __init__(self, rate_per_minute, burst=1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取一个令牌，不够时阻塞等待；返回等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败 failure_threshold 次后打开，cooldown 秒内拒绝调用；
+    冷却结束后放行一次试探调用，成功则恢复，失败则重新开始冷却。
+    """
+
+    def __init__(self, name, failure_threshold, cooldown):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def remaining(self):
+        """距离冷却结束的秒数"""
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def allow(self):
+        """是否允许本次调用（半开状态下只放行一个试探调用）"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._probing:
+                self._probing = True
+                logger.info(f"{self.name} 熔断冷却结束，放行一次试探调用")
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(f"{self.name} 调用恢复正常，关闭熔断")
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                logger.error(f"{self.name} 连续失败 {self.failures} 次，熔断 {self.cooldown:g} 秒")
+            self._probing = False
+
+class ProviderGuard:
+    """
+    单个提供商的调用保护：令牌桶限流 + 临时错误指数退避重试 + 熔断
+
+    同一提供商的所有分析器共享一个实例（见 get_guard）。
+    """
+
+    def __init__(self, name, rate_per_minute, burst, max_retries, backoff, backoff_max,
+                 failure_threshold, cooldown):
+        self.name = name
+        self.bucket = TokenBucket(rate_per_minute, burst)
+        self.breaker = CircuitBreaker(name, failure_threshold, cooldown)
+        self.max_retries = max(0, max_retries)
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+
+    def available(self):
+        """当前是否可以调用（未熔断，或已到试探时间）"""
+        return self.breaker.state != "open"
+
+    def call(self, func, *args, **kwargs):
+        """
+        执行一次接口调用
+
+        Raises:
+            CircuitOpenError: 提供商处于熔断状态
+            Exception: 非临时错误，或重试用完后的最后一个错误
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} 处于熔断状态，{self.breaker.remaining():.0f} 秒后重试")
+
+        attempt = 0
+        while True:
+            waited = self.bucket.acquire()
+            if waited >= 1:
+                logger.info(f"{self.name} 限流等待 {waited:.1f} 秒")
+            try:
+                # 每次请求（含重试）一个span，限流等待不计入
+                with tracing.span(f"model.{self.name}", attempt=attempt + 1):
+                    result = func(*args, **kwargs)
+            except Exception as e:
+                if not is_transient(e):
+                    # 请求本身有问题（参数、鉴权等），不代表提供商不可用
+                    self.breaker.record_success()
+                    raise
+                if attempt >= self.max_retries:
+                    self.breaker.record_failure()
+                    raise
+                attempt += 1
+                delay = retry_after_of(e)
+                if delay is None:
+                    delay = min(self.backoff * 2 ** (attempt - 1), self.backoff_max)
+                    delay *= random.uniform(0.5, 1.5)
+                logger.warning(f"{self.name} 临时错误 (第{attempt}/{self.max_retries}次重试，{delay:.1f} 秒后): {e}")
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    def stats(self):
+        return {
+            "provider": self.name,
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "cooldown_remaining": round(self.breaker.remaining(), 1),
+        }
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+def get_guard(provider):
+    """获取提供商的调用保护（按 config.AI_RATE_LIMITS 等配置创建，进程内共享）"""
+    with _guards_lock:
+        guard = _guards.get(provider)
+        if guard is None:
+            guard = ProviderGuard(
+                provider,
+                rate_per_minute=config.AI_RATE_LIMITS.get(provider, config.AI_RATE_PER_MINUTE),
+                burst=config.AI_RATE_BURST,
+                max_retries=config.AI_MAX_RETRIES,
+                backoff=config.AI_RETRY_BACKOFF,
+                backoff_max=config.AI_RETRY_BACKOFF_MAX,
+                failure_threshold=config.AI_CIRCUIT_FAILURE_THRESHOLD,
+                cooldown=config.AI_CIRCUIT_COOLDOWN,
+            )
+            _guards[provider] = guard
+        return guard
+
+def get_guard_stats():
+    """所有提供商的熔断状态"""
+    with _guards_lock:
+        return [guard.stats() for guard in _guards.values()]
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+# 将项目根目录添加到sys.path，以便导入models
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models.base_analyzer import Analyzer, format_post_text, build_fallback_result
+from models.registry import register_analyzer
+from models.clients import timed_stream, record_usage
+
+logger = logging.getLogger(__name__)
+
+# 每秒输出的字符数，用于模拟流式输出的速度
+_STUB_CHARS_PER_SECOND = 2000
+
+class StubAnalyzer(Analyzer):
+    """
+    本地模拟的分析器，不访问网络，用于 benchmark.py 和离线调试
+
+    输出由帖子内容和 model_name 决定（同样的输入总是得到同样的结果），
+    按 latency 秒模拟首个片段的延迟，按 failure_rate 的比例输出被截断的JSON。
+    """
+    name = "stub"
+    label = "STUB"
+    multimodal = False
+    structured_output = True
+    max_concurrency = int(os.getenv("STUB_MAX_CONCURRENCY", "8"))
+    provider = "stub"
+    model_name = "stub-1"
+    generation_params = {}
+    latency = float(os.getenv("STUB_LATENCY", "0.5"))
+    failure_rate = float(os.getenv("STUB_FAILURE_RATE", "0"))
+
+    def _seed(self, post):
+        material = f"{self.model_name}\n{post.get('contentID')}\n{post.get('text')}"
+        return int(hashlib.sha256(material.encode('utf-8')).hexdigest()[:16], 16)
+
+    def build_result(self, post):
+        """根据帖子内容生成确定的模拟分析结果"""
+        rng = random.Random(self._seed(post))
+        score = rng.randint(-80, 80)
+        relevance = "高" if abs(score) >= 50 else "中" if abs(score) >= 20 else "低"
+        return {
+            "分析时间": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "特朗普言论摘要": (post.get('text') or "")[:60],
+            "市场相关性": relevance,
+            "综合评分": f"{score:+d}%",
+            "影响分析": {
+                "直接影响": "模拟结果",
+                "影响路径": "模拟结果",
+                "影响时限": rng.choice(["短期", "中期", "长期"]),
+                "影响强度": rng.choice(["重大", "中等", "轻微"])
+            },
+            "个股建议": [],
+            "风险提示": "本结果由本地模拟分析器生成，仅用于测试。",
+            "思维链": "模拟结果"
+        }
+
+    def _analyze(self, scraped_post_data, system_prompt_text, on_field=None):
+        output = json.dumps(self.build_result(scraped_post_data), ensure_ascii=False)
+        rng = random.Random(self._seed(scraped_post_data) ^ 0x5EED)
+        if rng.random() < self.failure_rate:
+            # 模拟输出在中途被截断
+            output = output[:rng.randint(1, len(output) - 1)]
+
+        def open_stream():
+            time.sleep(self.latency * rng.uniform(0.8, 1.2))
+            return (output[i:i + 40] for i in range(0, len(output), 40))
+
+        def stream_text(chunks):
+            for chunk in chunks:
+                time.sleep(len(chunk) / _STUB_CHARS_PER_SECOND)
+                yield chunk
+            # 按字符数粗略估算token用量
+            user_text = format_post_text(scraped_post_data)
+            record_usage(self.provider, (len(system_prompt_text) + len(user_text)) // 2, 0, len(output) // 2)
+
+        def request():
+            return self.collect_stream(stream_text(timed_stream(self.provider, open_stream)), on_field)
+
+        result, raw = self.guard.call(request)
+        if result is None:
+            return build_fallback_result("Failed to parse STUB response as JSON", status="解析失败", raw_response=raw)
+        return result
+
+stub_analyzer = register_analyzer(StubAnalyzer())
@@ -0,0 +1,408 @@
+# pipeline.py
+import time
+import json
+import logging
+import threading
+from datetime import datetime
+
+import config
+import storage
+import tracing
+
+# 获取logger
+logger = logging.getLogger(__name__)
+
+JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    content_id TEXT PRIMARY KEY,
+    stage TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, not_before);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    content_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    detail TEXT,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (content_id, name)
+);
+"""
+
+# 任务状态
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+def _connection():
+    storage.ensure_schema("jobs", JOBS_SCHEMA)
+    return storage.get_connection()
+
+def _now():
+    return datetime.now().isoformat()
+
+def get_job(content_id):
+    """获取任务状态，不存在时返回None"""
+    row = _connection().execute("SELECT * FROM jobs WHERE content_id = ?", (str(content_id),)).fetchone()
+    return dict(row) if row else None
+
+def record_checkpoint(content_id, name, detail=None):
+    """
+    记录帖子完成的一个步骤（scraped、analyzed:{模型}、article、draft、submitted、published、publish_failed）
+
+    Args:
+        content_id (str): 帖子ID
+        name (str): 步骤名称
+        detail (dict, optional): 恢复时需要的信息，例如结果文件路径、草稿media_id
+    """
+    conn = _connection()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO checkpoints (content_id, name, detail, created_at) VALUES (?, ?, ?, ?)",
+            (str(content_id), name, json.dumps(detail, ensure_ascii=False) if detail is not None else None, _now())
+        )
+
+def get_checkpoints(content_id):
+    """
+    获取帖子已完成的步骤
+
+    Returns:
+        dict: {步骤名称: detail}
+    """
+    rows = _connection().execute(
+        "SELECT name, detail FROM checkpoints WHERE content_id = ? ORDER BY created_at", (str(content_id),)
+    ).fetchall()
+    return {row['name']: json.loads(row['detail']) if row['detail'] else None for row in rows}
+
+def clear_checkpoints(content_id, names=None):
+    """清除帖子的步骤记录（names为空时全部清除），之后这些步骤会重新执行"""
+    conn = _connection()
+    with conn:
+        if names is None:
+            conn.execute("DELETE FROM checkpoints WHERE content_id = ?", (str(content_id),))
+        else:
+            conn.executemany(
+                "DELETE FROM checkpoints WHERE content_id = ? AND name = ?",
+                [(str(content_id), name) for name in names]
+            )
+
+class StageDeferred(Exception):
+    """
+    阶段还不能完成（例如等待微信发布结果），delay 秒后再次执行，不计入失败次数
+
+    等待期间工作线程可以去处理其他任务。
+    """
+
+    def __init__(self, delay, message=None):
+        super().__init__(message or f"{delay:g} 秒后再次执行")
+        self.delay = delay
+
+class StageFailed(Exception):
+    """阶段失败且重试也不会成功（例如文章被平台审核拒绝），直接放弃处理，不再重试"""
+
+class Pipeline:
+    """
+    持久化在SQLite中的帖子处理队列
+
+    每个新帖子是一个任务，按 stages 的顺序逐阶段推进（例如 分析 → 生成 → 发布），
+    每完成一个阶段就写回数据库。多个工作线程各自领取任务，
+    不同帖子的不同阶段可以同时进行；进程重启后从未完成的阶段继续，
+    已完成的阶段不会重做。
+
+    Args:
+        stages (list): [(阶段名称, 处理函数)]，处理函数接收 content_id，
+                       返回False或抛出异常表示失败，抛出 StageDeferred 表示稍后再执行，
+                       抛出 StageFailed 表示失败且不再重试
+        workers (int, optional): 工作线程数，默认 config.PIPELINE_WORKERS
+        max_attempts (int, optional): 每个阶段的最大尝试次数，默认 config.PIPELINE_MAX_ATTEMPTS
+        on_finished (callable, optional): 任务结束时回调 (content_id, 是否成功)
+    """
+
+    def __init__(self, stages, workers=None, max_attempts=None, on_finished=None):
+        if not stages:
+            raise ValueError("至少需要一个处理阶段")
+        self.stages = list(stages)
+        self._handlers = dict(self.stages)
+        self._stage_names = [name for name, _ in self.stages]
+        self.workers = max(1, workers or config.PIPELINE_WORKERS)
+        self.max_attempts = max(1, max_attempts or config.PIPELINE_MAX_ATTEMPTS)
+        self.on_finished = on_finished
+
+        self._threads = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Condition()
+        self._busy = 0
+
+    def enqueue(self, content_id, restart=False):
+        """
+        添加任务，已存在的任务不会重复添加
+
+        Args:
+            content_id (str): 帖子ID
+            restart (bool): 已存在时是否从第一个阶段重新处理
+
+        Returns:
+            bool: 是否新建或重置了任务
+        """
+        content_id = str(content_id)
+        now = _now()
+        conn = _connection()
+        with conn:
+            if restart:
+                cursor = conn.execute(
+                    "INSERT INTO jobs (content_id, stage, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(content_id) DO UPDATE SET stage = excluded.stage, status = excluded.status, "
+                    "attempts = 0, not_before = 0, last_error = NULL, updated_at = excluded.updated_at "
+                    "WHERE jobs.status != ?",
+                    (content_id, self._stage_names[0], PENDING, now, now, RUNNING)
+                )
+                added = cursor.rowcount > 0
+                if added:
+                    # 从头处理时之前记录的步骤全部作废（scraped 由采集在加入队列前记录，保留）。
+                    # 与重置任务在同一个事务中，工作线程领取任务时不会看到旧的步骤记录
+                    conn.execute("DELETE FROM checkpoints WHERE content_id = ? AND name != ?", (content_id, "scraped"))
+            else:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO jobs (content_id, stage, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (content_id, self._stage_names[0], PENDING, now, now)
+                )
+                added = cursor.rowcount > 0
+        if added:
+            logger.info(f"帖子 {content_id} 已加入处理队列")
+            self._notify()
+        return added
+
+    def resume(self):
+        """
+        重新调度上次未完成的任务：放弃处理的任务从失败的阶段重新开始，
+        已完成的阶段及步骤记录不会重做
+
+        Returns:
+            list: 待处理的帖子ID
+        """
+        placeholders = ", ".join("?" * len(self._stage_names))
+        conn = _connection()
+        with conn:
+            conn.execute(
+                f"UPDATE jobs SET status = ?, attempts = 0, not_before = 0, updated_at = ? "
+                f"WHERE status = ? AND stage IN ({placeholders})",
+                (PENDING, _now(), FAILED, *self._stage_names)
+            )
+        rows = conn.execute(
+            f"SELECT content_id, stage FROM jobs WHERE status IN (?, ?) AND stage IN ({placeholders}) "
+            f"ORDER BY created_at, content_id",
+            (PENDING, RUNNING, *self._stage_names)
+        ).fetchall()
+        for row in rows:
+            logger.info(f"恢复处理帖子 {row['content_id']}，从阶段 {row['stage']} 开始")
+        self._notify()
+        return [row['content_id'] for row in rows]
+
+    def recover(self):
+        """把上次进程退出时仍在处理中的任务放回队列（从当前阶段重新开始）"""
+        conn = _connection()
+        with conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?",
+                (PENDING, _now(), RUNNING)
+            )
+        if cursor.rowcount:
+            logger.info(f"恢复了 {cursor.rowcount} 个上次未完成的任务")
+        return cursor.rowcount
+
+    def start(self):
+        """启动工作线程"""
+        if self._threads:
+            return
+        self.recover()
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"pipeline-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"处理队列已启动（{self.workers} 个工作线程，阶段: {' → '.join(self._stage_names)}）")
+
+    def stop(self, timeout=None):
+        """停止工作线程，正在执行的阶段会执行完"""
+        self._stop.set()
+        self._notify()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def wait_until_idle(self, timeout=None):
+        """
+        等待当前可执行的任务全部处理完（等待重试的任务不计入）
+
+        Returns:
+            bool: 是否在超时前处理完
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._wakeup:
+            while self._busy or self._has_ready_jobs():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._wakeup.wait(min(1.0, remaining) if remaining is not None else 1.0)
+        return True
+
+    def wait_for(self, content_ids, timeout=None):
+        """
+        等待指定任务结束（完成或放弃），包括等待中的重试
+
+        Returns:
+            bool: 是否在超时前全部结束
+        """
+        content_ids = [str(content_id) for content_id in content_ids]
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._wakeup:
+            while any(self._is_open(get_job(content_id)) for content_id in content_ids):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._wakeup.wait(min(1.0, remaining) if remaining is not None else 1.0)
+        return True
+
+    def stats(self):
+        """各状态的任务数"""
+        rows = _connection().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+    def get_job(self, content_id):
+        return get_job(content_id)
+
+    def _notify(self):
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def _ready_jobs_sql(self, columns):
+        """可执行任务的查询：只包含本队列能处理的阶段（例如 --skip-publish 时不领取发布阶段的任务）"""
+        placeholders = ", ".join("?" * len(self._stage_names))
+        sql = (f"SELECT {columns} FROM jobs WHERE status = ? AND not_before <= ? "
+               f"AND stage IN ({placeholders}) ORDER BY created_at, content_id LIMIT 1")
+        return sql, (PENDING, time.time(), *self._stage_names)
+
+    def _is_open(self, job):
+        """任务是否还会被本队列继续处理"""
+        return job is not None and job['status'] in (PENDING, RUNNING) and job['stage'] in self._handlers
+
+    def _has_ready_jobs(self):
+        return _connection().execute(*self._ready_jobs_sql("1")).fetchone() is not None
+
+    def _claim(self):
+        """领取一个可执行的任务，返回 (content_id, stage)，没有时返回None"""
+        conn = _connection()
+        while True:
+            row = conn.execute(*self._ready_jobs_sql("content_id, stage")).fetchone()
+            if row is None:
+                return None
+            with conn:
+                cursor = conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? "
+                    "WHERE content_id = ? AND status = ?",
+                    (RUNNING, _now(), row['content_id'], PENDING)
+                )
+            # 被其他线程抢先领取时换下一个
+            if cursor.rowcount == 1:
+                return row['content_id'], row['stage']
+
+    def _worker(self):
+        while not self._stop.is_set():
+            with self._wakeup:
+                job = self._claim()
+                if job is None:
+                    self._wakeup.wait(1.0)
+                    continue
+                self._busy += 1
+            try:
+                self._run_stage(*job)
+            finally:
+                with self._wakeup:
+                    self._busy -= 1
+                    self._wakeup.notify_all()
+        storage.close_connection()
+
+    def _run_stage(self, content_id, stage):
+        handler = self._handlers.get(stage)
+        error = None
+        retryable = True
+        start_time = time.monotonic()
+        with tracing.span(f"stage.{stage}", content_id) as stage_span:
+            try:
+                if handler is None:
+                    raise ValueError(f"未知的处理阶段: {stage}")
+                if handler(content_id) is False:
+                    error = f"阶段 {stage} 返回失败"
+            except StageDeferred as e:
+                stage_span.set(deferred=e.delay)
+                self._defer(content_id, stage, e)
+                return
+            except StageFailed as e:
+                error = str(e)
+                retryable = False
+            except Exception as e:
+                logger.error(f"帖子 {content_id} 在阶段 {stage} 出错: {e}", exc_info=True)
+                error = str(e)
+            if error is not None:
+                stage_span.fail(error)
+
+        conn = _connection()
+        elapsed = time.monotonic() - start_time
+        if error is None:
+            index = self._stage_names.index(stage)
+            next_stage = self._stage_names[index + 1] if index + 1 < len(self._stage_names) else None
+            with conn:
+                conn.execute(
+                    "UPDATE jobs SET stage = ?, status = ?, attempts = 0, not_before = 0, last_error = NULL, "
+                    "updated_at = ? WHERE content_id = ?",
+                    (next_stage or stage, PENDING if next_stage else DONE, _now(), content_id)
+                )
+            logger.info(f"帖子 {content_id} 阶段 {stage} 完成，耗时 {elapsed:.1f} 秒")
+            if next_stage:
+                return
+            self._finished(content_id, True)
+            return
+
+        attempts = conn.execute("SELECT attempts FROM jobs WHERE content_id = ?", (content_id,)).fetchone()['attempts']
+        if retryable and attempts < self.max_attempts:
+            delay = config.PIPELINE_RETRY_DELAY * 2 ** (attempts - 1)
+            with conn:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, not_before = ?, last_error = ?, updated_at = ? WHERE content_id = ?",
+                    (PENDING, time.time() + delay, error, _now(), content_id)
+                )
+            logger.warning(f"帖子 {content_id} 阶段 {stage} 失败 (第{attempts}/{self.max_attempts}次)，{delay:g} 秒后重试: {error}")
+        else:
+            with conn:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, last_error = ?, updated_at = ? WHERE content_id = ?",
+                    (FAILED, error, _now(), content_id)
+                )
+            if retryable:
+                logger.error(f"帖子 {content_id} 阶段 {stage} 已失败 {attempts} 次，放弃处理: {error}")
+            else:
+                logger.error(f"帖子 {content_id} 阶段 {stage} 失败且无法重试，放弃处理: {error}")
+            self._finished(content_id, False)
+
+    def _defer(self, content_id, stage, deferred):
+        conn = _connection()
+        with conn:
+            # 领取时已经计入一次尝试，推迟不算失败，这里退回
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), not_before = ?, updated_at = ? "
+                "WHERE content_id = ?",
+                (PENDING, time.time() + deferred.delay, _now(), content_id)
+            )
+        logger.info(f"帖子 {content_id} 阶段 {stage} 尚未完成，{deferred}")
+
+    def _finished(self, content_id, success):
+        if self.on_finished:
+            try:
+                self.on_finished(content_id, success)
+            except Exception as e:
+                logger.error(f"任务结束回调出错: {e}")
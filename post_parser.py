@@ -0,0 +1,271 @@
+# post_parser.py
+import re
+import json
+import logging
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from urllib.parse import urlparse, parse_qs
+
+from bs4 import BeautifulSoup
+
+import config
+
+# 获取logger
+logger = logging.getLogger(__name__)
+
+# 帖子时间统一转换为浏览器所在时区，与页面上显示的时间一致
+_display_timezone = ZoneInfo(config.BROWSER_CONFIG["timezone"])
+
+def is_timeline_response(url):
+    """判断请求URL是否为时间线接口（置顶帖子接口除外）"""
+    if not re.search(config.TIMELINE_API_PATTERN, url or ""):
+        return False
+    query = parse_qs(urlparse(url).query)
+    return query.get('pinned', ['false'])[0].lower() != 'true'
+
+def is_first_timeline_page(url):
+    """是否为时间线接口的第一页（没有 max_id 翻页参数），可以直接请求它来探测最新帖子"""
+    return is_timeline_response(url) and 'max_id' not in parse_qs(urlparse(url).query)
+
+def content_id_from_href(href):
+    """从帖子链接中提取帖子ID，失败返回None"""
+    match = re.search(r'/posts/(\d+)', href or "")
+    return match.group(1) if match else None
+
+def format_api_time(created_at):
+    """把接口中的UTC时间（ISO 8601）转换为 "%Y-%m-%d %H:%M:%S" 格式的本地时间"""
+    try:
+        post_time = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+        return post_time.astimezone(_display_timezone).strftime("%Y-%m-%d %H:%M:%S")
+    except Exception as e:
+        logger.error(f"时间解析错误: {str(e)}")
+        return created_at
+
+def html_to_text(content):
+    """把帖子正文的HTML片段转换为纯文本，段落之间换行"""
+    if not content:
+        return None
+    fragment = BeautifulSoup(content, 'html.parser')
+    for br in fragment.find_all('br'):
+        br.replace_with('\n')
+    paragraphs = fragment.find_all('p') or [fragment]
+    text = "\n".join(p.get_text().strip() for p in paragraphs).strip()
+    return text or None
+
+def parse_status(status):
+    """
+    把时间线接口中的一条帖子转换为帖子信息
+
+    Args:
+        status (dict): 接口返回的帖子对象
+
+    Returns:
+        dict: 帖子信息，包含ID、时间、文本、图片URL和视频URL（与HTML解析结果格式相同）
+    """
+    # 转发的帖子使用被转发内容
+    source = status.get('reblog') or status
+
+    url_link = None
+    card = source.get('card') or {}
+    if card.get('url'):
+        url_link = card['url']
+    elif source.get('content'):
+        link_element = BeautifulSoup(source['content'], 'html.parser').select_one("a[href]")
+        if link_element:
+            url_link = link_element['href']
+
+    image_urls = []
+    video_url = None
+    for media in source.get('media_attachments') or []:
+        media_url = media.get('url') or media.get('remote_url')
+        if not media_url:
+            continue
+        if media.get('type') == 'image':
+            image_urls.append(media_url)
+        elif media.get('type') in ('video', 'gifv') and not video_url:
+            video_url = media_url
+
+    return {
+        "contentID": str(status['id']),
+        "time": format_api_time(status.get('created_at', '')),
+        "text": html_to_text(source.get('content')),
+        "url": url_link,
+        "image_urls": image_urls,
+        "video_url": video_url
+    }
+
+def parse_timeline_payloads(payloads):
+    """
+    从捕获到的时间线接口响应中提取帖子
+
+    Args:
+        payloads (list): 接口响应体（已解析的JSON列表或原始字符串）
+
+    Returns:
+        list: 非置顶帖子信息，按发布时间从新到旧排列，已按ID去重
+    """
+    posts = {}
+    for payload in payloads:
+        if isinstance(payload, (str, bytes)):
+            try:
+                payload = json.loads(payload)
+            except ValueError as e:
+                logger.warning(f"时间线接口响应不是合法JSON，已忽略: {e}")
+                continue
+        if not isinstance(payload, list):
+            continue
+        for status in payload:
+            if not isinstance(status, dict) or not status.get('id'):
+                continue
+            if status.get('pinned'):
+                logger.info(f"跳过置顶帖子 (ID: {status['id']})")
+                continue
+            try:
+                post_info = parse_status(status)
+            except Exception as e:
+                logger.warning(f"解析帖子 {status.get('id')} 失败，已跳过: {e}")
+                continue
+            posts[post_info['contentID']] = post_info
+
+    # 帖子ID是随时间递增的数字字符串
+    return sorted(posts.values(), key=lambda post: (len(post['contentID']), post['contentID']), reverse=True)
+
+def is_newer(content_id, since_id):
+    """帖子ID是否比 since_id 更新（ID是随时间递增的数字字符串）"""
+    return (len(content_id), content_id) > (len(since_id), since_id)
+
+def pick_timeline_posts(content_ids, limit, oldest):
+    """
+    从时间线上的新帖子中选出本轮处理的 limit 个
+
+    Args:
+        content_ids (iterable): 帖子ID
+        limit (int): 最多保留的帖子数
+        oldest (bool): 为True时保留最早的帖子（有上次记录时，更新的帖子留到下一轮，
+                       不会因为 since_id 前移而漏掉），否则保留最新的
+
+    Returns:
+        set: 保留的帖子ID
+    """
+    ordered = sorted(set(content_ids), key=lambda content_id: (len(content_id), content_id))
+    return set(ordered[:limit] if oldest else ordered[-limit:])
+
+def is_pinned_element(post):
+    """页面中的帖子元素是否带有置顶标记"""
+    pinned_indicator = post.select_one(config.SELECTORS['pinned_indicator'])
+    return bool(pinned_indicator and "Pinned" in pinned_indicator.get_text(strip=True))
+
+def parse_post_element(post):
+    """
+    从页面中的一个帖子元素提取帖子信息（HTML解析）
+
+    Args:
+        post (Tag): 帖子元素
+
+    Returns:
+        dict: 帖子信息，包含ID、时间、文本、图片URL和视频URL，失败返回None
+    """
+    # 提取内容ID
+    post_link = post.select_one(config.SELECTORS['post_link_primary'])
+    if not post_link:
+        post_link = post.select_one(config.SELECTORS['post_link_secondary'])
+        
+    if not post_link:
+        logger.error("未找到帖子链接")
+        return None
+        
+    href = post_link.get('href', '')
+    content_id = content_id_from_href(href)
+    if not content_id:
+        logger.error(f"无法从链接中提取内容ID: {href}")
+        return None
+    
+    # 提取时间
+    time_element = post.select_one("time")
+    if not time_element:
+        logger.error("未找到时间元素")
+        return None
+        
+    time_str = time_element.get('title', '')
+    try:
+        # 解析时间格式 "May 04, 2025, 11:47 AM"
+        post_time = datetime.strptime(time_str, "%b %d, %Y, %I:%M %p")
+        formatted_time = post_time.strftime("%Y-%m-%d %H:%M:%S")
+    except Exception as e:
+        logger.error(f"时间解析错误: {str(e)}")
+        formatted_time = time_str
+    
+    # 提取文本内容
+    text_element = post.select_one(config.SELECTORS['text'])
+    text_content = text_element.get_text(strip=True) if text_element else None
+    if text_content == "":
+        text_content = None
+
+    # 提取URL链接
+    url_link = None
+    if text_element:
+        link_element = text_element.select_one(config.SELECTORS['text_embedded_link'])
+        if link_element and 'href' in link_element.attrs:
+            url_link = link_element['href']
+            # 确保是完整URL
+            if not url_link.startswith(('http://', 'https://')):
+                url_link = f"https://truthsocial.com{url_link}"
+
+    # 提取图片URL
+    image_urls = []
+    image_containers = post.select(config.SELECTORS['image_container'])
+    for container in image_containers:
+        # 过滤掉头像和其他界面元素的图片
+        if 'rounded-full' in container.get('class', []):
+            continue
+            
+        img = container.select_one(config.SELECTORS['image'])
+        if img and 'src' in img.attrs:
+            image_url = img['src']
+            # 确保使用完整URL
+            if not image_url.startswith(('http://', 'https://')):
+                if image_url.startswith('./'):
+                    image_url = image_url[2:]
+                # 为相对URL添加域名
+                image_url = f"https://truthsocial.com/{image_url}"
+            image_urls.append(image_url)
+    
+    # 提取视频URL
+    video_element = post.select_one(config.SELECTORS['video_generic'])
+    if not video_element:
+        video_element = post.select_one(config.SELECTORS['video_480p'])
+        
+    video_url = video_element['src'] if video_element else None
+    
+    return {
+        "contentID": content_id,
+        "time": formatted_time,
+        "text": text_content,
+        "url": url_link,
+        "image_urls": image_urls,
+        "video_url": video_url
+    }
+
+def parse_timeline_html(soup):
+    """
+    从页面HTML中提取所有非置顶帖子
+
+    Args:
+        soup (BeautifulSoup): 解析后的页面
+
+    Returns:
+        list: 帖子信息，按页面顺序（从新到旧）排列，无法解析的帖子会被跳过
+    """
+    posts = []
+    for i, post in enumerate(soup.select(config.SELECTORS['post'])):
+        if is_pinned_element(post):
+            logger.info(f"跳过置顶帖子 (索引: {i})")
+            continue
+        try:
+            post_info = parse_post_element(post)
+        except Exception as e:
+            logger.error(f"提取帖子信息失败 (索引: {i}): {str(e)}")
+            continue
+        if post_info:
+            posts.append(post_info)
+    return posts
@@ -0,0 +1,150 @@
+# scheduler.py
+import time
+import random
+import logging
+import threading
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import config
+import storage
+
+# 获取logger
+logger = logging.getLogger(__name__)
+
+# 帖子时间与页面显示一致，使用浏览器所在时区
+_post_timezone = ZoneInfo(config.BROWSER_CONFIG["timezone"])
+_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def _post_now():
+    return datetime.now(_post_timezone).replace(tzinfo=None)
+
+def _parse_post_times(times):
+    parsed = []
+    for value in times:
+        try:
+            parsed.append(datetime.strptime(value, _TIME_FORMAT))
+        except (TypeError, ValueError):
+            continue
+    return parsed
+
+class AdaptiveScheduler:
+    """
+    按发帖活跃度调整采集间隔的调度器
+
+    发帖频率取以下两者中较高的一个：
+      - 最近 POLL_ACTIVITY_WINDOW_HOURS 小时内的发帖频率
+      - 过去 POLL_HISTORY_DAYS 天里当前这个小时的平均发帖频率
+    每个平均发帖间隔内采集两次，结果限制在 [POLL_MIN_INTERVAL_MINUTES, POLL_MAX_INTERVAL_MINUTES]，
+    上一轮发现新帖子时直接使用下限。
+
+    下一轮的时间从本轮开始时刻算起（单调时钟），采集本身的耗时不会累积成漂移；
+    某一轮耗时超过了间隔时，错过的轮次直接跳过，不会连续补跑。
+
+    Args:
+        default_interval (float): 没有任何发帖记录时的采集间隔（分钟）
+        min_interval (float, optional): 间隔下限（分钟），默认 config.POLL_MIN_INTERVAL_MINUTES
+        max_interval (float, optional): 间隔上限（分钟），默认 config.POLL_MAX_INTERVAL_MINUTES
+        jitter (float, optional): 间隔随机浮动的比例，默认 config.POLL_JITTER
+    """
+
+    def __init__(self, default_interval, min_interval=None, max_interval=None, jitter=None):
+        self.min_interval = min_interval if min_interval is not None else config.POLL_MIN_INTERVAL_MINUTES
+        self.max_interval = max(self.min_interval, max_interval if max_interval is not None else config.POLL_MAX_INTERVAL_MINUTES)
+        self.default_interval = min(max(default_interval, self.min_interval), self.max_interval)
+        self.jitter = min(max(jitter if jitter is not None else config.POLL_JITTER, 0.0), 0.5)
+
+        self.cycles = 0
+        self.skipped_cycles = 0
+        self.last_interval = None
+        self._stop = threading.Event()
+
+    def posting_rate(self, now=None):
+        """
+        估算当前的发帖频率
+
+        Returns:
+            tuple: (最近的发帖频率, 当前时段的历史发帖频率)，单位 帖/小时；没有任何记录时返回None
+        """
+        now = now or _post_now()
+        history_start = now - timedelta(days=config.POLL_HISTORY_DAYS)
+        post_times = _parse_post_times(storage.list_post_times(history_start.strftime(_TIME_FORMAT)))
+        if not post_times:
+            return None
+
+        window_start = now - timedelta(hours=config.POLL_ACTIVITY_WINDOW_HOURS)
+        recent = sum(1 for t in post_times if window_start <= t <= now)
+        recent_rate = recent / config.POLL_ACTIVITY_WINDOW_HOURS
+
+        # 历史记录不足 POLL_HISTORY_DAYS 天时按实际覆盖的天数计算
+        days = min(config.POLL_HISTORY_DAYS, max(1, (now - post_times[0]).days + 1))
+        same_hour = sum(1 for t in post_times if t.hour == now.hour and t < now.replace(minute=0, second=0, microsecond=0))
+        hourly_rate = same_hour / days
+        return recent_rate, hourly_rate
+
+    def next_interval(self, new_posts=None):
+        """
+        计算下一轮的采集间隔（不含随机浮动）
+
+        Args:
+            new_posts (int, optional): 本轮发现的新帖子数
+
+        Returns:
+            tuple: (间隔分钟数, 原因)
+        """
+        if new_posts:
+            return self.min_interval, f"本轮发现 {new_posts} 个新帖子"
+
+        try:
+            rates = self.posting_rate()
+        except Exception as e:
+            logger.warning(f"统计发帖频率失败，使用默认间隔: {e}")
+            rates = None
+        if rates is None:
+            return self.default_interval, "暂无发帖记录"
+
+        recent_rate, hourly_rate = rates
+        rate = max(recent_rate, hourly_rate)
+        reason = f"最近 {recent_rate:.2f} 帖/小时，当前时段历史 {hourly_rate:.2f} 帖/小时"
+        if rate <= 0:
+            return self.max_interval, reason
+        # 每个平均发帖间隔内采集两次
+        interval = 60 / rate / 2
+        return min(max(interval, self.min_interval), self.max_interval), reason
+
+    def stop(self):
+        """停止调度（当前这一轮会执行完）"""
+        self._stop.set()
+
+    def run(self, job):
+        """
+        循环执行采集，直到调用 stop()
+
+        Args:
+            job (callable): 一轮采集，返回本轮发现的新帖子数（出错时返回None）
+        """
+        self._stop.clear()
+        next_due = time.monotonic()
+        while not self._stop.is_set():
+            delay = next_due - time.monotonic()
+            if delay > 0 and self._stop.wait(delay):
+                break
+
+            started = time.monotonic()
+            new_posts = job()
+            self.cycles += 1
+
+            interval, reason = self.next_interval(new_posts)
+            period = interval * 60 * random.uniform(1 - self.jitter, 1 + self.jitter)
+            self.last_interval = period / 60
+            next_due = started + period
+
+            now = time.monotonic()
+            if now >= next_due:
+                # 本轮耗时超过了间隔：跳过错过的轮次，对齐到下一个时间点
+                missed = int((now - started) // period)
+                next_due = started + (missed + 1) * period
+                self.skipped_cycles += missed
+                logger.warning(f"本轮采集耗时 {now - started:.0f} 秒，超过采集间隔，跳过 {missed} 轮")
+
+            logger.info(f"下一轮采集在 {(next_due - now) / 60:.1f} 分钟后（{reason}）")
@@ -1,5 +1,4 @@
 # scraper.py
-import re
 import json
 import logging
 from datetime import datetime
@@ -12,6 +11,9 @@ import random
 import time as time_module
 
 import config
+import storage
+import post_parser
+from browser_session import BrowserSession, CycleTimer
 from downloader import download_media
 
 # 获取logger
@@ -23,8 +25,13 @@ _context = None
 _page = None
 _playwright = None
 
-def init_browser():
-    """初始化浏览器实例"""
+# 本轮捕获到的时间线接口响应
+_captured_responses = []
+# 最近一次页面加载请求的时间线接口第一页，探测最新帖子时直接请求它
+_timeline_api_url = None
+
+def _launch_browser():
+    """启动浏览器实例（由浏览器会话调用）"""
     global _browser, _context, _page, _playwright
     
     if _browser is None:
@@ -96,6 +103,9 @@ def init_browser():
             _page = _browser.pages[0]
         else:
             _page = _browser.new_page()
+        
+        # 记录页面自己请求的时间线接口响应
+        _page.on("response", _on_response)
             
         # 注入一些JavaScript来进一步隐藏自动化特征
         _page.add_init_script("""
@@ -150,57 +160,196 @@ def init_browser():
         """)
         
         logger.info("浏览器初始化完成（使用持久化用户数据）")
-        
-        # 注册退出时的清理函数
-        atexit.register(cleanup_browser)
     
     return _page
 
-def cleanup_browser():
-    """清理浏览器资源"""
+def _close_browser():
+    """关闭浏览器实例（由浏览器会话调用）"""
     global _browser, _context, _page, _playwright
     
     logger.info("清理浏览器资源...")
     # 注意：使用 launch_persistent_context 时，browser 就是 context
-    if _browser:
-        _browser.close()
+    try:
+        if _browser:
+            _browser.close()
+    finally:
         _browser = None
         _page = None
-    if _playwright:
-        _playwright.stop()
-        _playwright = None
+        if _playwright:
+            _playwright.stop()
+            _playwright = None
     logger.info("浏览器资源已清理")
 
-def fetch_page_and_screenshot():
+def _probe_page(page):
+    """存活检查：页面未关闭且能执行脚本"""
+    return not page.is_closed() and page.evaluate("1") == 1
+
+# 浏览器会话：存活检查、崩溃重启、定期回收
+_session = BrowserSession("playwright", launch=_launch_browser, close=_close_browser, probe=_probe_page)
+
+def init_browser():
+    """获取可用的浏览器页面（首次调用或浏览器崩溃/回收后会重新启动）"""
+    return _session.acquire()
+
+def cleanup_browser():
+    """清理浏览器资源"""
+    _session.close()
+
+def get_browser_stats():
+    """浏览器会话统计（轮数、重启次数、内存、各阶段耗时）"""
+    return _session.stats()
+
+# 注册退出时的清理函数
+atexit.register(cleanup_browser)
+
+def _on_response(response):
+    """记录时间线接口的响应（响应体在页面加载完成后再读取）"""
+    global _timeline_api_url
+    if response.request.method == "GET" and response.ok and post_parser.is_timeline_response(response.url):
+        _captured_responses.append(response)
+        if post_parser.is_first_timeline_page(response.url):
+            _timeline_api_url = response.url
+
+def _collect_api_posts():
+    """读取本轮捕获到的时间线接口响应，返回非置顶帖子信息（从新到旧）"""
+    payloads = []
+    while _captured_responses:
+        response = _captured_responses.pop(0)
+        try:
+            payloads.append(response.json())
+        except Exception as e:
+            logger.warning(f"读取时间线接口响应失败: {response.url}, 错误: {e}")
+    return post_parser.parse_timeline_payloads(payloads)
+
+def _select_post_element(page, content_id=None):
     """
-    使用Playwright获取Truth Social页面内容并截图
+    找到要截图的帖子元素
     
-    Returns:
-        tuple: (BeautifulSoup对象, 截图路径)，失败则返回(None, None)
+    Args:
+        content_id (str, optional): 指定帖子ID；不指定时选择第一个非置顶帖子
     """
-    try:
-        # 获取或初始化浏览器页面
-        page = init_browser()
+    if content_id:
+        post_element = page.locator(config.SELECTORS['post']).filter(
+            has=page.locator(f'a[href*="/posts/{content_id}"]')
+        ).first
+        if post_element.count() == 0:
+            logger.warning(f"页面上未找到帖子 {content_id}，无法截图")
+            return None
+        return post_element
+    
+    # 获取所有帖子元素
+    all_posts = page.locator(config.SELECTORS['post']).all()
+    
+    for i, post in enumerate(all_posts):
+        # 检查帖子是否包含置顶标记
+        pinned_indicator = post.locator(config.SELECTORS['pinned_indicator'])
+        
+        # 检查是否存在置顶标记并且文本包含 "Pinned"
+        if pinned_indicator.count() > 0:
+            try:
+                pinned_text = pinned_indicator.first.text_content()
+                if pinned_text and "Pinned" in pinned_text:
+                    logger.info(f"跳过置顶帖子 (索引: {i})")
+                    continue
+            except:
+                # 如果获取文本失败，也尝试下一个
+                pass
         
+        # 找到第一个非置顶帖子
+        logger.info(f"选择帖子 (索引: {i})")
+        return post
+    
+    logger.error("未找到非置顶的帖子")
+    return None
+
+def _screenshot_post(page, post_element, name=None):
+    """对帖子元素截图，返回临时截图路径，失败返回None"""
+    # 滚动到帖子位置，确保完全可见
+    post_element.scroll_into_view_if_needed()
+    page.wait_for_timeout(500)  # 等待滚动完成
+    
+    # 隐藏可能的干扰元素（如固定的导航栏、弹窗等）
+    page.evaluate("""
+        // 隐藏可能的固定元素
+        const fixedElements = document.querySelectorAll('[style*="position: fixed"], [style*="position: sticky"]');
+        fixedElements.forEach(el => el.style.display = 'none');
+        
+        // 隐藏可能的模态框
+        const modals = document.querySelectorAll('[role="dialog"], .modal, .popup');
+        modals.forEach(el => el.style.display = 'none');
+        
+        // 隐藏cookie提示等
+        const banners = document.querySelectorAll('[class*="banner"], [class*="consent"], [class*="cookie"]');
+        banners.forEach(el => el.style.display = 'none');
+    """)
+    
+    # 生成截图文件名（默认使用时间戳，稍后会更新为content_id）
+    name = name or datetime.now().strftime('%Y%m%d_%H%M%S')
+    temp_screenshot_path = config.SCREENSHOTS_DIR / f"temp_{name}.png"
+    
+    # 对帖子元素进行截图
+    try:
+        # 获取帖子的边界框
+        bounding_box = post_element.bounding_box()
+        if bounding_box:
+            # 添加一些内边距，确保完整截图
+            padding = 20
+            clip = {
+                'x': max(0, bounding_box['x'] - padding),
+                'y': max(0, bounding_box['y'] - padding),
+                'width': bounding_box['width'] + 2 * padding,
+                'height': bounding_box['height'] + 2 * padding
+            }
+            
+            # 截图特定区域
+            page.screenshot(
+                path=str(temp_screenshot_path),
+                clip=clip,
+                full_page=False
+            )
+            logger.info(f"帖子截图已保存到临时文件: {temp_screenshot_path}")
+        else:
+            # 如果无法获取边界框，使用元素截图方法
+            post_element.screenshot(path=str(temp_screenshot_path))
+            logger.info(f"帖子截图已保存（使用元素截图）: {temp_screenshot_path}")
+        return str(temp_screenshot_path)
+            
+    except Exception as e:
+        logger.error(f"截图失败: {str(e)}")
+        return None
+
+def _load_timeline(page, timer):
+    """
+    刷新或打开目标页面，等待帖子加载完成
+    
+    Returns:
+        bool: 帖子是否已加载
+    """
+    # 丢弃上一轮残留的响应
+    _captured_responses.clear()
+    
+    with timer.stage("navigation"):
         # 添加随机延迟，模拟人类行为
         time_module.sleep(random.uniform(1, 3))
         
-        # 检查是否已经在目标页面
+        # 复用已打开的页面；只等DOM就绪，帖子是否加载由下面的选择器等待判断
+        # （networkidle 在长连接页面上经常要等很久）
         current_url = page.url
         if current_url.startswith(config.TARGET_URL):
             logger.info(f"刷新页面: {config.TARGET_URL}")
             # 随机选择刷新方式
             if random.choice([True, False]):
-                page.reload(wait_until="networkidle")
+                page.reload(wait_until="domcontentloaded")
             else:
                 # 使用 F5 键刷新
                 page.keyboard.press("F5")
-                page.wait_for_load_state("networkidle")
+                page.wait_for_load_state("domcontentloaded")
         else:
             logger.info(f"导航到页面: {config.TARGET_URL}")
             # 第一次访问或URL不匹配，导航到目标页面
-            page.goto(config.TARGET_URL, wait_until="networkidle")
-        
+            page.goto(config.TARGET_URL, wait_until="domcontentloaded")
+    
+    with timer.stage("wait"):
         # 模拟人类行为：随机滚动
         for _ in range(random.randint(1, 3)):
             scroll_amount = random.randint(100, 500)
@@ -217,228 +366,227 @@ def fetch_page_and_screenshot():
             logger.info("帖子内容已加载")
         except PlaywrightTimeoutError:
             logger.error("等待帖子超时")
-            return None, None
+            return False
         
         # 等待图片加载完成（如果有）
         page.wait_for_timeout(2000)  # 额外等待2秒确保图片加载
+    return True
+
+def _probe_api(page):
+    """在页面中直接请求时间线接口第一页，返回最新的非置顶帖子ID"""
+    body = page.evaluate("""async (url) => {
+        const response = await fetch(url, {credentials: 'include', headers: {'Accept': 'application/json'}});
+        if (!response.ok) {
+            throw new Error('HTTP ' + response.status);
+        }
+        return await response.text();
+    }""", _timeline_api_url)
+    posts = post_parser.parse_timeline_payloads([body])
+    return posts[0]['contentID'] if posts else None
+
+def _probe_dom(page):
+    """重新加载页面（不模拟滚动、不截图），只读取第一个非置顶帖子的链接"""
+    if page.url.startswith(config.TARGET_URL):
+        page.reload(wait_until="domcontentloaded")
+    else:
+        page.goto(config.TARGET_URL, wait_until="domcontentloaded")
+    page.wait_for_selector(config.SELECTORS['post'], timeout=15000)
+    href = page.evaluate("""([postSelector, pinnedSelector, linkSelector]) => {
+        for (const post of document.querySelectorAll(postSelector)) {
+            const pinned = post.querySelector(pinnedSelector);
+            if (pinned && pinned.textContent.includes('Pinned')) {
+                continue;
+            }
+            const link = post.querySelector(linkSelector);
+            if (link) {
+                return link.getAttribute('href');
+            }
+        }
+        return null;
+    }""", [config.SELECTORS['post'], config.SELECTORS['pinned_indicator'], config.SELECTORS['post_link_primary']])
+    return post_parser.content_id_from_href(href)
+
+def probe_latest_post_id():
+    """
+    低成本探测最新的非置顶帖子ID，用来判断是否需要完整采集
+    
+    已知时间线接口地址时在页面中直接请求接口第一页（不刷新页面），
+    否则只刷新页面读取第一个帖子链接。
+    
+    Returns:
+        str: 最新帖子ID，探测失败返回None（调用方应继续完整采集）
+    """
+    with _session.cycle() as timer:
+        with timer.stage("probe"):
+            try:
+                page = init_browser()
+                if _timeline_api_url and page.url.startswith(config.TARGET_URL):
+                    try:
+                        return _probe_api(page)
+                    except Exception as e:
+                        logger.warning(f"请求时间线接口失败，改为读取页面: {e}")
+                return _probe_dom(page)
+            except Exception as e:
+                logger.warning(f"探测最新帖子失败: {e}")
+                return None
+
+def fetch_page_and_screenshot(timer=None):
+    """
+    使用Playwright获取Truth Social最新的非置顶帖子并截图
+    
+    优先使用页面加载时时间线接口返回的JSON（CAPTURE_API_RESPONSES），
+    未捕获到接口响应时回退到序列化整个页面并用BeautifulSoup解析。
+    
+    Args:
+        timer (CycleTimer, optional): 记录导航/等待/截图/解析各阶段耗时
+    
+    Returns:
+        tuple: (帖子信息, 截图路径)，失败则返回(None, None)
+    """
+    timer = timer or CycleTimer()
+    try:
+        # 获取或初始化浏览器页面
+        page = init_browser()
+        if not _load_timeline(page, timer):
+            return None, None
         
-        # 获取所有帖子元素
-        all_posts = page.locator(config.SELECTORS['post']).all()
-        
-        # 找到第一个非置顶的帖子
-        post_element = None
-        post_index = 0
+        api_post = None
+        if config.CAPTURE_API_RESPONSES:
+            with timer.stage("parse"):
+                api_posts = _collect_api_posts()
+            if api_posts:
+                api_post = api_posts[0]
+                logger.info(f"从时间线接口获取到 {len(api_posts)} 个帖子，选择最新的非置顶帖子 (ID: {api_post['contentID']})")
+            else:
+                logger.warning("未捕获到时间线接口响应，回退到HTML解析")
         
-        for i, post in enumerate(all_posts):
-            # 检查帖子是否包含置顶标记
-            pinned_indicator = post.locator(config.SELECTORS['pinned_indicator'])
-            
-            # 检查是否存在置顶标记并且文本包含 "Pinned"
-            if pinned_indicator.count() > 0:
-                try:
-                    pinned_text = pinned_indicator.first.text_content()
-                    if pinned_text and "Pinned" in pinned_text:
-                        logger.info(f"跳过置顶帖子 (索引: {i})")
-                        continue
-                except:
-                    # 如果获取文本失败，也尝试下一个
-                    pass
-            
-            # 找到第一个非置顶帖子
-            post_element = post
-            post_index = i
-            logger.info(f"选择帖子 (索引: {post_index})")
-            break
+        with timer.stage("screenshot", api_post['contentID'] if api_post else None):
+            post_element = _select_post_element(page, api_post['contentID'] if api_post else None)
+            temp_screenshot_path = _screenshot_post(page, post_element) if post_element else None
         
+        if api_post:
+            return api_post, temp_screenshot_path
         if not post_element:
-            logger.error("未找到非置顶的帖子")
             return None, None
         
-        # 滚动到帖子位置，确保完全可见
-        post_element.scroll_into_view_if_needed()
-        page.wait_for_timeout(500)  # 等待滚动完成
-        
-        # 隐藏可能的干扰元素（如固定的导航栏、弹窗等）
-        page.evaluate("""
-            // 隐藏可能的固定元素
-            const fixedElements = document.querySelectorAll('[style*="position: fixed"], [style*="position: sticky"]');
-            fixedElements.forEach(el => el.style.display = 'none');
-            
-            // 隐藏可能的模态框
-            const modals = document.querySelectorAll('[role="dialog"], .modal, .popup');
-            modals.forEach(el => el.style.display = 'none');
-            
-            // 隐藏cookie提示等
-            const banners = document.querySelectorAll('[class*="banner"], [class*="consent"], [class*="cookie"]');
-            banners.forEach(el => el.style.display = 'none');
-        """)
-        
-        # 生成截图文件名（使用时间戳，稍后会更新为content_id）
-        temp_screenshot_path = config.SCREENSHOTS_DIR / f"temp_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
-        
-        # 对帖子元素进行截图
-        try:
-            # 获取帖子的边界框
-            bounding_box = post_element.bounding_box()
-            if bounding_box:
-                # 添加一些内边距，确保完整截图
-                padding = 20
-                clip = {
-                    'x': max(0, bounding_box['x'] - padding),
-                    'y': max(0, bounding_box['y'] - padding),
-                    'width': bounding_box['width'] + 2 * padding,
-                    'height': bounding_box['height'] + 2 * padding
-                }
-                
-                # 截图特定区域
-                page.screenshot(
-                    path=str(temp_screenshot_path),
-                    clip=clip,
-                    full_page=False
-                )
-                logger.info(f"帖子截图已保存到临时文件: {temp_screenshot_path}")
-            else:
-                # 如果无法获取边界框，使用元素截图方法
-                post_element.screenshot(path=str(temp_screenshot_path))
-                logger.info(f"帖子截图已保存（使用元素截图）: {temp_screenshot_path}")
-                
-        except Exception as e:
-            logger.error(f"截图失败: {str(e)}")
-            temp_screenshot_path = None
-        
-        # 获取页面HTML
-        html = page.content()
-        
-        soup = BeautifulSoup(html, 'html.parser')
+        with timer.stage("parse"):
+            # 获取页面HTML
+            html = page.content()
+            soup = BeautifulSoup(html, 'html.parser')
+            post_info = extract_post_info(soup)
         logger.info("页面获取成功")
-        return soup, str(temp_screenshot_path) if temp_screenshot_path else None
+        return post_info, temp_screenshot_path
     
     except Exception as e:
         logger.error(f"获取页面失败: {str(e)}")
         return None, None
 
-def extract_post_info(soup):
+def fetch_timeline(limit=20, since_id=None, timer=None):
     """
-    从页面中提取最新的非置顶帖子信息
+    一次页面加载提取多个帖子，不够时向下滚动加载更多
+    
+    遇到 since_id（及更早的帖子）、没有 since_id 时凑够 limit 个帖子、
+    或滚动 TIMELINE_MAX_SCROLLS 次后停止。since_id 之后的新帖子超过 limit 个时
+    保留最早的 limit 个，更新的帖子留到下一轮处理。
     
     Args:
-        soup (BeautifulSoup): 解析后的页面
-        
+        limit (int): 最多返回的帖子数
+        since_id (str, optional): 上次已处理的最新帖子ID
+        timer (CycleTimer, optional): 记录各阶段耗时
+    
     Returns:
-        dict: 帖子信息，包含ID、时间、文本、图片URL和视频URL
+        list: [(帖子信息, 截图路径)]，按发布时间从旧到新排列
     """
+    timer = timer or CycleTimer()
+    collected = {}
+    screenshots = {}
+    seen = set()
     try:
-        # 找到所有帖子
-        all_posts = soup.select(config.SELECTORS['post'])
-        if not all_posts:
-            logger.error("未找到任何帖子")
-            return None
-        
-        # 找到第一个非置顶的帖子
-        post = None
-        for i, p in enumerate(all_posts):
-            # 检查是否包含置顶标记
-            pinned_indicator = p.select_one(config.SELECTORS['pinned_indicator'])
-            if pinned_indicator:
-                pinned_text = pinned_indicator.get_text(strip=True)
-                if "Pinned" in pinned_text:
-                    logger.info(f"跳过置顶帖子 (索引: {i})")
-                    continue
+        page = init_browser()
+        if not _load_timeline(page, timer):
+            return []
+        
+        use_api = None
+        idle_rounds = 0
+        for scroll_round in range(config.TIMELINE_MAX_SCROLLS + 1):
+            with timer.stage("parse"):
+                posts = _collect_api_posts() if use_api is not False and config.CAPTURE_API_RESPONSES else []
+                if use_api is None:
+                    # 首轮决定数据来源，之后保持一致
+                    use_api = bool(posts)
+                    if config.CAPTURE_API_RESPONSES and not use_api:
+                        logger.warning("未捕获到时间线接口响应，回退到HTML解析")
+                if not use_api:
+                    posts = post_parser.parse_timeline_html(BeautifulSoup(page.content(), 'html.parser'))
             
-            # 找到第一个非置顶帖子
-            post = p
-            logger.info(f"处理帖子 (索引: {i})")
-            break
-        
-        if not post:
-            logger.error("未找到非置顶的帖子")
-            return None
-        
-        # 提取内容ID
-        post_link = post.select_one(config.SELECTORS['post_link_primary'])
-        if not post_link:
-            post_link = post.select_one(config.SELECTORS['post_link_secondary'])
+            reached_known = False
+            new_posts = {}
+            for post_info in posts:
+                content_id = post_info['contentID']
+                if since_id and not post_parser.is_newer(content_id, since_id):
+                    reached_known = True
+                    continue
+                if content_id not in seen:
+                    new_posts[content_id] = post_info
+            seen.update(new_posts)
             
-        if not post_link:
-            logger.error("未找到帖子链接")
-            return None
+            # 有 since_id 时保留最早的 limit 个（替换掉之前保留的较新帖子），否则保留最新的；
+            # 不保留的帖子不截图（每张截图都要滚动、等待和读取页面）
+            keep = post_parser.pick_timeline_posts(list(collected) + list(new_posts), limit, oldest=bool(since_id))
+            for content_id in [content_id for content_id in collected if content_id not in keep]:
+                del collected[content_id]
+                screenshot_path = screenshots.pop(content_id, None)
+                if screenshot_path and os.path.exists(screenshot_path):
+                    os.remove(screenshot_path)
+            for content_id, post_info in new_posts.items():
+                if content_id not in keep:
+                    continue
+                collected[content_id] = post_info
+                with timer.stage("screenshot", content_id):
+                    post_element = _select_post_element(page, content_id)
+                    screenshots[content_id] = _screenshot_post(page, post_element, name=content_id) if post_element else None
             
-        href = post_link.get('href', '')
-        content_id = re.search(r'/posts/(\d+)', href)
-        if not content_id:
-            logger.error(f"无法从链接中提取内容ID: {href}")
-            return None
-        content_id = content_id.group(1)
-        
-        # 提取时间
-        time_element = post.select_one("time")
-        if not time_element:
-            logger.error("未找到时间元素")
-            return None
+            logger.info(f"第{scroll_round + 1}屏: 新增 {len(new_posts)} 个帖子，保留 {len(collected)} 个")
+            # 有 since_id 时一直滚动到上次的帖子，才能确定哪些是最早的
+            if reached_known or (not since_id and len(collected) >= limit):
+                break
+            idle_rounds = 0 if new_posts else idle_rounds + 1
+            if idle_rounds >= 2:
+                logger.info("继续滚动没有加载出更多帖子，停止")
+                break
             
-        time_str = time_element.get('title', '')
-        try:
-            # 解析时间格式 "May 04, 2025, 11:47 AM"
-            post_time = datetime.strptime(time_str, "%b %d, %Y, %I:%M %p")
-            formatted_time = post_time.strftime("%Y-%m-%d %H:%M:%S")
-        except Exception as e:
-            logger.error(f"时间解析错误: {str(e)}")
-            formatted_time = time_str
-        
-        # 提取文本内容
-        text_element = post.select_one(config.SELECTORS['text'])
-        text_content = text_element.get_text(strip=True) if text_element else None
-        if text_content == "":
-            text_content = None
-
-        # 提取URL链接
-        url_link = None
-        if text_element:
-            link_element = text_element.select_one(config.SELECTORS['text_embedded_link'])
-            if link_element and 'href' in link_element.attrs:
-                url_link = link_element['href']
-                # 确保是完整URL
-                if not url_link.startswith(('http://', 'https://')):
-                    url_link = f"https://truthsocial.com{url_link}"
+            with timer.stage("wait"):
+                # 滚动到底部附近，触发加载下一页
+                page.mouse.wheel(0, random.randint(1500, 2500))
+                page.wait_for_timeout(random.randint(1500, 2500))
+    
+    except Exception as e:
+        logger.error(f"获取时间线失败: {str(e)}")
+    
+    if since_id and len(seen) > len(collected):
+        logger.warning(f"上次之后有 {len(seen)} 个新帖子，超过单次上限 {limit}，"
+                       f"本轮处理最早的 {len(collected)} 个，其余留到下一轮")
+    
+    # 按时间从旧到新排列
+    ordered = sorted(collected.values(), key=lambda post: (len(post['contentID']), post['contentID']))
+    return [(post_info, screenshots.get(post_info['contentID'])) for post_info in ordered]
 
-        # 提取图片URL
-        image_urls = []
-        image_containers = post.select("div[data-testid='still-image-container']")
-        for container in image_containers:
-            # 过滤掉头像和其他界面元素的图片
-            if 'rounded-full' in container.get('class', []):
-                continue
-                
-            img = container.select_one("img")
-            if img and 'src' in img.attrs:
-                image_url = img['src']
-                # 确保使用完整URL
-                if not image_url.startswith(('http://', 'https://')):
-                    if image_url.startswith('./'):
-                        image_url = image_url[2:]
-                    # 为相对URL添加域名
-                    image_url = f"https://truthsocial.com/{image_url}"
-                image_urls.append(image_url)
-        
-        # 提取视频URL
-        video_element = post.select_one(config.SELECTORS['video_generic'])
-        if not video_element:
-            video_element = post.select_one(config.SELECTORS['video_480p'])
-            
-        video_url = video_element['src'] if video_element else None
-        
-        return {
-            "contentID": content_id,
-            "time": formatted_time,
-            "text": text_content,
-            "url": url_link,
-            "image_urls": image_urls,
-            "video_url": video_url
-        }
+def extract_post_info(soup):
+    """
+    从页面中提取最新的非置顶帖子信息
+    
+    Args:
+        soup (BeautifulSoup): 解析后的页面
         
-    except Exception as e:
-        logger.error(f"提取帖子信息失败: {str(e)}")
+    Returns:
+        dict: 帖子信息，包含ID、时间、文本、图片URL和视频URL
+    """
+    posts = post_parser.parse_timeline_html(soup)
+    if not posts:
+        logger.error("未找到非置顶的帖子")
         return None
+    logger.info(f"处理帖子 (ID: {posts[0]['contentID']})")
+    return posts[0]
 
 def process_post(post_info, screenshot_path=None):
     """
@@ -482,7 +630,7 @@ def process_post(post_info, screenshot_path=None):
             "screenshot": str(final_screenshot_path) if final_screenshot_path else None  # 新增截图路径
         }
         
-        # 保存到JSON文件
+        # 保存到帖子库
         save_post_data(result)
         
         return result
@@ -496,42 +644,13 @@ def process_post(post_info, screenshot_path=None):
 
 def save_post_data(post_data):
     """
-    保存帖子数据到JSON文件
+    保存帖子数据到SQLite帖子库（按contentID更新或插入）
     
     Args:
         post_data (dict): 帖子数据
     """
     try:
-        # 检查历史记录文件是否存在
-        history_exists = config.HISTORY_FILE.exists()
-        
-        # 读取现有历史记录
-        if history_exists:
-            with open(config.HISTORY_FILE, 'r', encoding='utf-8') as f:
-                try:
-                    history = json.load(f)
-                except json.JSONDecodeError:
-                    history = []
-        else:
-            history = []
-            
-        # 检查是否已存在相同内容ID的记录
-        exists = False
-        for i, item in enumerate(history):
-            if item.get('contentID') == post_data['contentID']:
-                # 更新现有记录
-                history[i] = post_data
-                exists = True
-                break
-                
-        # 如果是新记录，添加到历史记录
-        if not exists:
-            history.append(post_data)
-            
-        # 保存更新后的历史记录
-        with open(config.HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
-            
+        storage.save_post_data(post_data)
         logger.info(f"保存帖子数据成功: {post_data['contentID']}")
         
     except Exception as e:
@@ -547,13 +666,9 @@ def scrape_latest_post():
     # 确保配置初始化
     config.init()
     
-    # 获取页面和截图
-    soup, temp_screenshot_path = fetch_page_and_screenshot()
-    if not soup:
-        return None
-        
-    # 提取帖子信息
-    post_info = extract_post_info(soup)
+    with _session.cycle() as timer:
+        # 获取帖子信息和截图
+        post_info, temp_screenshot_path = fetch_page_and_screenshot(timer)
     if not post_info:
         # 如果提取失败，删除临时截图
         if temp_screenshot_path and os.path.exists(temp_screenshot_path):
@@ -564,6 +679,31 @@ def scrape_latest_post():
     result = process_post(post_info, temp_screenshot_path)
     return result
 
+def scrape_timeline(limit=20, since_id=None):
+    """
+    一次页面加载抓取多个新帖子并处理（下载媒体、保存）
+    
+    Args:
+        limit (int): 最多处理的帖子数
+        since_id (str, optional): 上次已处理的最新帖子ID，只返回比它更新的帖子
+    
+    Returns:
+        list: 处理后的帖子数据，按发布时间从旧到新排列
+    """
+    # 确保配置初始化
+    config.init()
+    
+    with _session.cycle() as timer:
+        entries = fetch_timeline(limit=limit, since_id=since_id, timer=timer)
+    
+    results = []
+    for post_info, temp_screenshot_path in entries:
+        result = process_post(post_info, temp_screenshot_path)
+        if result:
+            results.append(result)
+    logger.info(f"时间线抓取完成: {len(results)}/{len(entries)} 个新帖子处理成功")
+    return results
+
 # 测试
 if __name__ == "__main__":
     config.init()
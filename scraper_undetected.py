@@ -1,5 +1,6 @@
 import undetected_chromedriver as uc
 import time
+import base64
 import random
 import json
 import logging
@@ -10,11 +11,13 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 from selenium.webdriver.common.action_chains import ActionChains
 import os
-import re
 from bs4 import BeautifulSoup
 import atexit
 
 import config
+import storage
+import post_parser
+from browser_session import BrowserSession, CycleTimer
 from downloader import download_media
 
 logger = logging.getLogger(__name__)
@@ -22,10 +25,23 @@ logger = logging.getLogger(__name__)
 class UndetectedScraper:
     def __init__(self):
         self.driver = None
+        # 最近一次页面加载请求的时间线接口第一页，探测最新帖子时直接请求它
+        self.timeline_api_url = None
         self.user_data_dir = str(config.BROWSER_USER_DATA_DIR / "undetected_chrome")
+        # 浏览器会话：存活检查、崩溃重启、定期回收
+        self.session = BrowserSession(
+            "undetected-chrome",
+            launch=self._launch_driver,
+            close=self._quit_driver,
+            probe=self._probe_driver
+        )
         
     def init_driver(self):
-        """初始化 undetected-chromedriver"""
+        """获取可用的驱动（首次调用或浏览器崩溃/回收后会重新启动）"""
+        return self.session.acquire()
+    
+    def _launch_driver(self):
+        """初始化 undetected-chromedriver（由浏览器会话调用）"""
         if self.driver is None:
             logger.info("初始化 undetected-chromedriver...")
             
@@ -48,6 +64,9 @@ class UndetectedScraper:
             # 设置代理
             options.add_argument('--proxy-server=socks5://127.0.0.1:10808')
             
+            # 记录网络事件，用于读取时间线接口的响应
+            options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+            
             # 设置语言和时区
             options.add_experimental_option("prefs", {
                 "intl.accept_languages": "en-US,en",
@@ -100,6 +119,10 @@ class UndetectedScraper:
             
         return self.driver
     
+    def _probe_driver(self, driver):
+        """存活检查：浏览器能执行脚本"""
+        return driver.execute_script("return 1") == 1
+    
     def human_like_delay(self, min_sec=1, max_sec=3):
         """模拟人类的随机延迟"""
         delay = random.uniform(min_sec, max_sec)
@@ -146,17 +169,145 @@ class UndetectedScraper:
             
             self.human_like_delay(0.5, 1.5)
     
-    def fetch_page_and_screenshot(self, post_index_to_fetch=None):
+    def _discard_performance_log(self):
+        """清空CDP性能日志，避免读到上一轮的响应"""
+        try:
+            self.driver.get_log('performance')
+        except Exception as e:
+            logger.debug(f"读取性能日志失败: {e}")
+    
+    def _collect_api_posts(self):
+        """
+        从CDP性能日志中找出时间线接口的响应，并通过 Network.getResponseBody 读取响应体
+        
+        Returns:
+            list: 非置顶帖子信息（从新到旧）
+        """
+        payloads = []
+        try:
+            entries = self.driver.get_log('performance')
+        except Exception as e:
+            logger.warning(f"读取性能日志失败: {e}")
+            return []
+        
+        for entry in entries:
+            try:
+                message = json.loads(entry['message'])['message']
+            except (KeyError, ValueError):
+                continue
+            if message.get('method') != 'Network.responseReceived':
+                continue
+            params = message.get('params', {})
+            response = params.get('response', {})
+            if response.get('status') != 200 or not post_parser.is_timeline_response(response.get('url')):
+                continue
+            if post_parser.is_first_timeline_page(response.get('url')):
+                self.timeline_api_url = response['url']
+            try:
+                body = self.driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': params['requestId']})
+            except Exception as e:
+                logger.warning(f"读取时间线接口响应失败: {response.get('url')}, 错误: {e}")
+                continue
+            data = body.get('body', '')
+            payloads.append(base64.b64decode(data) if body.get('base64Encoded') else data)
+        
+        return post_parser.parse_timeline_payloads(payloads)
+    
+    def _select_post_element(self, post_index_to_fetch=None, content_id=None):
         """
-        获取页面内容并截图
+        找到要截图的帖子元素
         
         Args:
-            post_index_to_fetch (int, optional): 要采集的帖子索引（从0开始，不包括置顶帖子）。
-                                                 None表示采集第一个非置顶帖子。
+            post_index_to_fetch (int, optional): 非置顶帖子索引（从0开始）
+            content_id (str, optional): 指定帖子ID，优先于索引
         """
-        driver = self.init_driver()
+        driver = self.driver
+        if content_id:
+            # 帖子可能已滚出页面，不等待隐式超时
+            driver.implicitly_wait(0)
+            try:
+                elements = driver.find_elements(
+                    By.XPATH, f"//div[@data-testid='status'][.//a[contains(@href, '/posts/{content_id}')]]"
+                )
+            finally:
+                driver.implicitly_wait(10)
+            if not elements:
+                logger.warning(f"页面上未找到帖子 {content_id}，无法截图")
+                return None
+            return elements[0]
+        
+        # 查找所有帖子
+        posts = driver.find_elements(By.CSS_SELECTOR, config.SELECTORS['post'])
+        
+        # 收集所有非置顶的帖子
+        non_pinned_posts = []
+        non_pinned_indices = []  # 记录原始索引
+        
+        for i, post in enumerate(posts):
+            try:
+                # 检查是否有置顶标记
+                pinned_elements = post.find_elements(By.CSS_SELECTOR, config.SELECTORS['pinned_indicator'])
+                if pinned_elements:
+                    pinned_text = pinned_elements[0].text
+                    if "Pinned" in pinned_text:
+                        logger.info(f"跳过置顶帖子 (原始索引: {i})")
+                        continue
+            except:
+                pass
+            
+            # 这是一个非置顶帖子
+            non_pinned_posts.append(post)
+            non_pinned_indices.append(i)
+            logger.info(f"找到非置顶帖子 (原始索引: {i}, 非置顶索引: {len(non_pinned_posts)-1})")
+        
+        # 检查是否有足够的非置顶帖子
+        if not non_pinned_posts:
+            logger.error("未找到任何非置顶的帖子")
+            return None
+        
+        # 确定要采集的帖子
+        if post_index_to_fetch is None:
+            # 默认采集第一个非置顶帖子
+            target_index = 0
+        else:
+            target_index = post_index_to_fetch
+        
+        # 检查索引是否有效
+        if target_index >= len(non_pinned_posts):
+            logger.error(f"请求的帖子索引 {target_index} 超出范围，只有 {len(non_pinned_posts)} 个非置顶帖子")
+            return None
+        
+        # 选择目标帖子
+        original_index = non_pinned_indices[target_index]
+        logger.info(f"选择帖子 (非置顶索引: {target_index}, 原始索引: {original_index})")
+        return non_pinned_posts[target_index]
+    
+    def _screenshot_post(self, post_element, name=None):
+        """对帖子元素截图，返回临时截图路径，失败返回None"""
+        # 滚动到帖子位置
+        self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", post_element)
+        self.human_like_delay(0.5, 1)
+        
+        # 生成临时截图文件名（默认使用时间戳）
+        name = name or datetime.now().strftime('%Y%m%d_%H%M%S')
+        temp_screenshot_path = config.SCREENSHOTS_DIR / f"temp_{name}.png"
         
+        # 截图
         try:
+            post_element.screenshot(str(temp_screenshot_path))
+            logger.info(f"帖子截图已保存到临时文件: {temp_screenshot_path}")
+            return str(temp_screenshot_path)
+        except Exception as e:
+            logger.error(f"截图失败: {e}")
+            return None
+    
+    def _load_timeline(self, timer):
+        """刷新或打开目标页面，等待帖子加载完成（超时抛出 TimeoutException）"""
+        driver = self.driver
+        if config.CAPTURE_API_RESPONSES:
+            self._discard_performance_log()
+        
+        with timer.stage("navigation"):
             # 检查是否已经在目标页面
             if driver.current_url.startswith(config.TARGET_URL):
                 logger.info("刷新当前页面")
@@ -164,7 +315,8 @@ class UndetectedScraper:
             else:
                 logger.info(f"导航到: {config.TARGET_URL}")
                 driver.get(config.TARGET_URL)
-            
+        
+        with timer.stage("wait"):
             # 等待页面加载
             self.human_like_delay(2, 4)
             
@@ -182,78 +334,121 @@ class UndetectedScraper:
             
             # 额外等待图片加载
             self.human_like_delay(1, 2)
-            
-            # 查找所有帖子
-            posts = driver.find_elements(By.CSS_SELECTOR, config.SELECTORS['post'])
-            
-            # 收集所有非置顶的帖子
-            non_pinned_posts = []
-            non_pinned_indices = []  # 记录原始索引
-            
-            for i, post in enumerate(posts):
+    
+    def _probe_api(self):
+        """在页面中直接请求时间线接口第一页，返回最新的非置顶帖子ID"""
+        result = self.driver.execute_async_script("""
+            const done = arguments[arguments.length - 1];
+            fetch(arguments[0], {credentials: 'include', headers: {'Accept': 'application/json'}})
+                .then(response => response.ok ? response.text() : Promise.reject(new Error('HTTP ' + response.status)))
+                .then(body => done({body: body}), error => done({error: String(error)}));
+        """, self.timeline_api_url)
+        if result.get('error'):
+            raise RuntimeError(result['error'])
+        posts = post_parser.parse_timeline_payloads([result['body']])
+        return posts[0]['contentID'] if posts else None
+    
+    def _probe_dom(self):
+        """重新加载页面（不模拟人类行为、不截图），只读取第一个非置顶帖子的链接"""
+        driver = self.driver
+        if driver.current_url.startswith(config.TARGET_URL):
+            driver.refresh()
+        else:
+            driver.get(config.TARGET_URL)
+        WebDriverWait(driver, 15).until(EC.presence_of_element_located((By.CSS_SELECTOR, config.SELECTORS['post'])))
+        href = driver.execute_script("""
+            for (const post of document.querySelectorAll(arguments[0])) {
+                const pinned = post.querySelector(arguments[1]);
+                if (pinned && pinned.textContent.includes('Pinned')) {
+                    continue;
+                }
+                const link = post.querySelector(arguments[2]);
+                if (link) {
+                    return link.getAttribute('href');
+                }
+            }
+            return null;
+        """, config.SELECTORS['post'], config.SELECTORS['pinned_indicator'], config.SELECTORS['post_link_primary'])
+        return post_parser.content_id_from_href(href)
+    
+    def probe_latest_post_id(self):
+        """
+        低成本探测最新的非置顶帖子ID，用来判断是否需要完整采集
+        
+        已知时间线接口地址时在页面中直接请求接口第一页（不刷新页面），
+        否则只刷新页面读取第一个帖子链接。
+        
+        Returns:
+            str: 最新帖子ID，探测失败返回None（调用方应继续完整采集）
+        """
+        with self.session.cycle() as timer:
+            with timer.stage("probe"):
                 try:
-                    # 检查是否有置顶标记
-                    pinned_elements = post.find_elements(By.CSS_SELECTOR, config.SELECTORS['pinned_indicator'])
-                    if pinned_elements:
-                        pinned_text = pinned_elements[0].text
-                        if "Pinned" in pinned_text:
-                            logger.info(f"跳过置顶帖子 (原始索引: {i})")
-                            continue
-                except:
-                    pass
-                
-                # 这是一个非置顶帖子
-                non_pinned_posts.append(post)
-                non_pinned_indices.append(i)
-                logger.info(f"找到非置顶帖子 (原始索引: {i}, 非置顶索引: {len(non_pinned_posts)-1})")
-            
-            # 检查是否有足够的非置顶帖子
-            if not non_pinned_posts:
-                logger.error("未找到任何非置顶的帖子")
-                return None, None
-            
-            # 确定要采集的帖子
-            if post_index_to_fetch is None:
-                # 默认采集第一个非置顶帖子
-                target_index = 0
-            else:
-                target_index = post_index_to_fetch
+                    driver = self.init_driver()
+                    if self.timeline_api_url and driver.current_url.startswith(config.TARGET_URL):
+                        try:
+                            return self._probe_api()
+                        except Exception as e:
+                            logger.warning(f"请求时间线接口失败，改为读取页面: {e}")
+                    return self._probe_dom()
+                except Exception as e:
+                    logger.warning(f"探测最新帖子失败: {e}")
+                    return None
+    
+    def fetch_page_and_screenshot(self, post_index_to_fetch=None, timer=None):
+        """
+        获取指定的非置顶帖子并截图
+        
+        优先使用页面加载时时间线接口返回的JSON（CAPTURE_API_RESPONSES），
+        未捕获到接口响应时回退到 page_source + BeautifulSoup 解析。
+        
+        Args:
+            post_index_to_fetch (int, optional): 要采集的帖子索引（从0开始，不包括置顶帖子）。
+                                                 None表示采集第一个非置顶帖子。
+            timer (CycleTimer, optional): 记录导航/等待/截图/解析各阶段耗时
+        
+        Returns:
+            tuple: (帖子信息, 截图路径)，失败则返回(None, None)
+        """
+        timer = timer or CycleTimer()
+        driver = self.init_driver()
+        
+        try:
+            self._load_timeline(timer)
+            
+            api_post = None
+            if config.CAPTURE_API_RESPONSES:
+                with timer.stage("parse"):
+                    api_posts = self._collect_api_posts()
+                target_index = post_index_to_fetch or 0
+                if target_index < len(api_posts):
+                    api_post = api_posts[target_index]
+                    logger.info(f"从时间线接口获取到 {len(api_posts)} 个帖子，选择非置顶索引 {target_index} (ID: {api_post['contentID']})")
+                elif api_posts:
+                    logger.warning(f"时间线接口只返回了 {len(api_posts)} 个帖子，回退到HTML解析")
+                else:
+                    logger.warning("未捕获到时间线接口响应，回退到HTML解析")
+            
+            with timer.stage("screenshot", api_post['contentID'] if api_post else None):
+                post_element = self._select_post_element(
+                    post_index_to_fetch,
+                    content_id=api_post['contentID'] if api_post else None
+                )
+                temp_screenshot_path = self._screenshot_post(post_element) if post_element else None
             
-            # 检查索引是否有效
-            if target_index >= len(non_pinned_posts):
-                logger.error(f"请求的帖子索引 {target_index} 超出范围，只有 {len(non_pinned_posts)} 个非置顶帖子")
+            if api_post:
+                return api_post, temp_screenshot_path
+            if not post_element:
                 return None, None
             
-            # 选择目标帖子
-            post_element = non_pinned_posts[target_index]
-            original_index = non_pinned_indices[target_index]
-            logger.info(f"选择帖子 (非置顶索引: {target_index}, 原始索引: {original_index})")
-            
-            # 滚动到帖子位置
-            driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", post_element)
-            self.human_like_delay(0.5, 1)
-            
-            # 生成临时截图文件名
-            temp_screenshot_path = config.SCREENSHOTS_DIR / f"temp_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
-            
-            # 截图
-            try:
-                post_element.screenshot(str(temp_screenshot_path))
-                logger.info(f"帖子截图已保存到临时文件: {temp_screenshot_path}")
-            except Exception as e:
-                logger.error(f"截图失败: {e}")
-                temp_screenshot_path = None
-            
-            # 获取页面HTML
-            html = driver.page_source
-            soup = BeautifulSoup(html, 'html.parser')
-            
-            # 将选择的帖子索引信息传递给解析函数
-            # 可以在soup对象上附加额外信息
-            soup._selected_post_index = target_index
+            with timer.stage("parse"):
+                # 获取页面HTML
+                html = driver.page_source
+                soup = BeautifulSoup(html, 'html.parser')
+                post_info = extract_post_info(soup, post_index_to_fetch=post_index_to_fetch)
             
             logger.info("页面获取成功")
-            return soup, str(temp_screenshot_path) if temp_screenshot_path else None
+            return post_info, temp_screenshot_path
             
         except TimeoutException:
             logger.error("页面加载超时")
@@ -262,8 +457,104 @@ class UndetectedScraper:
             logger.error(f"获取页面失败: {e}")
             return None, None
     
+    def fetch_timeline(self, limit=20, since_id=None, timer=None):
+        """
+        一次页面加载提取多个帖子，不够时向下滚动加载更多
+        
+        遇到 since_id（及更早的帖子）、没有 since_id 时凑够 limit 个帖子、
+        或滚动 TIMELINE_MAX_SCROLLS 次后停止。since_id 之后的新帖子超过 limit 个时
+        保留最早的 limit 个，更新的帖子留到下一轮处理。
+        
+        Args:
+            limit (int): 最多返回的帖子数
+            since_id (str, optional): 上次已处理的最新帖子ID
+            timer (CycleTimer, optional): 记录各阶段耗时
+        
+        Returns:
+            list: [(帖子信息, 截图路径)]，按发布时间从旧到新排列
+        """
+        timer = timer or CycleTimer()
+        collected = {}
+        screenshots = {}
+        seen = set()
+        driver = self.init_driver()
+        
+        try:
+            self._load_timeline(timer)
+            
+            use_api = None
+            idle_rounds = 0
+            for scroll_round in range(config.TIMELINE_MAX_SCROLLS + 1):
+                with timer.stage("parse"):
+                    posts = self._collect_api_posts() if use_api is not False and config.CAPTURE_API_RESPONSES else []
+                    if use_api is None:
+                        # 首轮决定数据来源，之后保持一致
+                        use_api = bool(posts)
+                        if config.CAPTURE_API_RESPONSES and not use_api:
+                            logger.warning("未捕获到时间线接口响应，回退到HTML解析")
+                    if not use_api:
+                        posts = post_parser.parse_timeline_html(BeautifulSoup(driver.page_source, 'html.parser'))
+                
+                reached_known = False
+                new_posts = {}
+                for post_info in posts:
+                    content_id = post_info['contentID']
+                    if since_id and not post_parser.is_newer(content_id, since_id):
+                        reached_known = True
+                        continue
+                    if content_id not in seen:
+                        new_posts[content_id] = post_info
+                seen.update(new_posts)
+                
+                # 有 since_id 时保留最早的 limit 个（替换掉之前保留的较新帖子），否则保留最新的；
+                # 不保留的帖子不截图（每张截图都要滚动、等待和读取页面）
+                keep = post_parser.pick_timeline_posts(list(collected) + list(new_posts), limit, oldest=bool(since_id))
+                for content_id in [content_id for content_id in collected if content_id not in keep]:
+                    del collected[content_id]
+                    screenshot_path = screenshots.pop(content_id, None)
+                    if screenshot_path and os.path.exists(screenshot_path):
+                        os.remove(screenshot_path)
+                for content_id, post_info in new_posts.items():
+                    if content_id not in keep:
+                        continue
+                    collected[content_id] = post_info
+                    with timer.stage("screenshot", content_id):
+                        post_element = self._select_post_element(content_id=content_id)
+                        screenshots[content_id] = self._screenshot_post(post_element, name=content_id) if post_element else None
+                
+                logger.info(f"第{scroll_round + 1}屏: 新增 {len(new_posts)} 个帖子，保留 {len(collected)} 个")
+                # 有 since_id 时一直滚动到上次的帖子，才能确定哪些是最早的
+                if reached_known or (not since_id and len(collected) >= limit):
+                    break
+                idle_rounds = 0 if new_posts else idle_rounds + 1
+                if idle_rounds >= 2:
+                    logger.info("继续滚动没有加载出更多帖子，停止")
+                    break
+                
+                with timer.stage("wait"):
+                    # 滚动到底部附近，触发加载下一页
+                    driver.execute_script("window.scrollBy(0, arguments[0])", random.randint(1500, 2500))
+                    self.human_like_delay(1.5, 2.5)
+        
+        except TimeoutException:
+            logger.error("页面加载超时")
+        except Exception as e:
+            logger.error(f"获取时间线失败: {e}")
+        
+        if since_id and len(seen) > len(collected):
+            logger.warning(f"上次之后有 {len(seen)} 个新帖子，超过单次上限 {limit}，"
+                           f"本轮处理最早的 {len(collected)} 个，其余留到下一轮")
+        
+        # 按时间从旧到新排列
+        ordered = sorted(collected.values(), key=lambda post: (len(post['contentID']), post['contentID']))
+        return [(post_info, screenshots.get(post_info['contentID'])) for post_info in ordered]
+    
     def cleanup(self):
         """清理资源"""
+        self.session.close()
+    
+    def _quit_driver(self):
+        """关闭浏览器（由浏览器会话调用）"""
         if self.driver:
             logger.info("关闭浏览器")
             try:
@@ -272,7 +563,6 @@ class UndetectedScraper:
                 pass
             self.driver = None
 
-# 从原来的 scraper.py 复制的解析函数
 def extract_post_info(soup, post_index_to_fetch=None):
     """
     从页面中提取指定的非置顶帖子信息
@@ -281,137 +571,21 @@ def extract_post_info(soup, post_index_to_fetch=None):
         soup (BeautifulSoup): 解析后的页面
         post_index_to_fetch (int, optional): 要采集的非置顶帖子索引（从0开始）
     """
-    try:
-        # 如果soup对象有附加的索引信息，优先使用
-        if hasattr(soup, '_selected_post_index'):
-            post_index_to_fetch = soup._selected_post_index
-        
-        # 找到所有帖子
-        all_posts = soup.select(config.SELECTORS['post'])
-        if not all_posts:
-            logger.error("未找到任何帖子")
-            return None
-        
-        # 收集所有非置顶的帖子
-        non_pinned_posts = []
-        
-        for i, p in enumerate(all_posts):
-            # 检查是否包含置顶标记
-            pinned_indicator = p.select_one(config.SELECTORS['pinned_indicator'])
-            if pinned_indicator:
-                pinned_text = pinned_indicator.get_text(strip=True)
-                if "Pinned" in pinned_text:
-                    logger.info(f"跳过置顶帖子 (索引: {i})")
-                    continue
-            
-            # 这是一个非置顶帖子
-            non_pinned_posts.append(p)
-        
-        if not non_pinned_posts:
-            logger.error("未找到任何非置顶的帖子")
-            return None
-        
-        # 确定要处理的帖子
-        if post_index_to_fetch is None:
-            target_index = 0
-        else:
-            target_index = post_index_to_fetch
-        
-        # 检查索引是否有效
-        if target_index >= len(non_pinned_posts):
-            logger.error(f"请求的帖子索引 {target_index} 超出范围，只有 {len(non_pinned_posts)} 个非置顶帖子")
-            return None
-        
-        # 选择目标帖子
-        post = non_pinned_posts[target_index]
-        logger.info(f"处理帖子 (非置顶索引: {target_index})")
-        
-        # 提取内容ID
-        post_link = post.select_one(config.SELECTORS['post_link_primary'])
-        if not post_link:
-            post_link = post.select_one(config.SELECTORS['post_link_secondary'])
-            
-        if not post_link:
-            logger.error("未找到帖子链接")
-            return None
-            
-        href = post_link.get('href', '')
-        content_id = re.search(r'/posts/(\d+)', href)
-        if not content_id:
-            logger.error(f"无法从链接中提取内容ID: {href}")
-            return None
-        content_id = content_id.group(1)
-        
-        # 提取时间
-        time_element = post.select_one("time")
-        if not time_element:
-            logger.error("未找到时间元素")
-            return None
-            
-        time_str = time_element.get('title', '')
-        try:
-            # 解析时间格式 "May 04, 2025, 11:47 AM"
-            post_time = datetime.strptime(time_str, "%b %d, %Y, %I:%M %p")
-            formatted_time = post_time.strftime("%Y-%m-%d %H:%M:%S")
-        except Exception as e:
-            logger.error(f"时间解析错误: {str(e)}")
-            formatted_time = time_str
-        
-        # 提取文本内容
-        text_element = post.select_one(config.SELECTORS['text'])
-        text_content = text_element.get_text(strip=True) if text_element else None
-        if text_content == "":
-            text_content = None
-
-        # 提取URL链接
-        url_link = None
-        if text_element:
-            link_element = text_element.select_one(config.SELECTORS['text_embedded_link'])
-            if link_element and 'href' in link_element.attrs:
-                url_link = link_element['href']
-                # 确保是完整URL
-                if not url_link.startswith(('http://', 'https://')):
-                    url_link = f"https://truthsocial.com{url_link}"
-
-        # 提取图片URL
-        image_urls = []
-        image_containers = post.select("div[data-testid='still-image-container']")
-        for container in image_containers:
-            # 过滤掉头像和其他界面元素的图片
-            if 'rounded-full' in container.get('class', []):
-                continue
-                
-            img = container.select_one("img")
-            if img and 'src' in img.attrs:
-                image_url = img['src']
-                # 确保使用完整URL
-                if not image_url.startswith(('http://', 'https://')):
-                    if image_url.startswith('./'):
-                        image_url = image_url[2:]
-                    # 为相对URL添加域名
-                    image_url = f"https://truthsocial.com/{image_url}"
-                image_urls.append(image_url)
-        
-        # 提取视频URL
-        video_element = post.select_one(config.SELECTORS['video_generic'])
-        if not video_element:
-            video_element = post.select_one(config.SELECTORS['video_480p'])
-            
-        video_url = video_element['src'] if video_element else None
-        
-        return {
-            "contentID": content_id,
-            "time": formatted_time,
-            "text": text_content,
-            "url": url_link,
-            "image_urls": image_urls,
-            "video_url": video_url,
-            "post_index": target_index  # 添加帖子索引信息
-        }
-        
-    except Exception as e:
-        logger.error(f"提取帖子信息失败: {str(e)}")
+    posts = post_parser.parse_timeline_html(soup)
+    if not posts:
+        logger.error("未找到任何非置顶的帖子")
         return None
+    
+    # 确定要处理的帖子
+    target_index = post_index_to_fetch or 0
+    if target_index >= len(posts):
+        logger.error(f"请求的帖子索引 {target_index} 超出范围，只有 {len(posts)} 个非置顶帖子")
+        return None
+    
+    logger.info(f"处理帖子 (非置顶索引: {target_index})")
+    post_info = dict(posts[target_index])
+    post_info["post_index"] = target_index  # 添加帖子索引信息
+    return post_info
 
 def process_post(post_info, screenshot_path=None):
     """处理帖子信息，下载媒体文件并保存结果"""
@@ -446,7 +620,7 @@ def process_post(post_info, screenshot_path=None):
             "screenshot": str(final_screenshot_path) if final_screenshot_path else None
         }
         
-        # 保存到JSON文件
+        # 保存到帖子库
         save_post_data(result)
         
         return result
@@ -459,38 +633,9 @@ def process_post(post_info, screenshot_path=None):
         return None
 
 def save_post_data(post_data):
-    """保存帖子数据到JSON文件"""
+    """保存帖子数据到SQLite帖子库（按contentID更新或插入）"""
     try:
-        # 检查历史记录文件是否存在
-        history_exists = config.HISTORY_FILE.exists()
-        
-        # 读取现有历史记录
-        if history_exists:
-            with open(config.HISTORY_FILE, 'r', encoding='utf-8') as f:
-                try:
-                    history = json.load(f)
-                except json.JSONDecodeError:
-                    history = []
-        else:
-            history = []
-            
-        # 检查是否已存在相同内容ID的记录
-        exists = False
-        for i, item in enumerate(history):
-            if item.get('contentID') == post_data['contentID']:
-                # 更新现有记录
-                history[i] = post_data
-                exists = True
-                break
-                
-        # 如果是新记录，添加到历史记录
-        if not exists:
-            history.append(post_data)
-            
-        # 保存更新后的历史记录
-        with open(config.HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
-            
+        storage.save_post_data(post_data)
         logger.info(f"保存帖子数据成功: {post_data['contentID']}")
         
     except Exception as e:
@@ -513,9 +658,17 @@ def cleanup_browser():
         _scraper.cleanup()
         _scraper = None
 
+def get_browser_stats():
+    """浏览器会话统计（轮数、重启次数、内存、各阶段耗时）"""
+    return get_scraper().session.stats()
+
 # 注册退出时的清理函数
 atexit.register(cleanup_browser)
 
+def probe_latest_post_id():
+    """低成本探测最新的非置顶帖子ID，失败返回None"""
+    return get_scraper().probe_latest_post_id()
+
 def scrape_latest_post(post_index=None):
     """
     抓取指定索引的帖子信息并处理（包括截图）
@@ -529,13 +682,9 @@ def scrape_latest_post(post_index=None):
     
     scraper = get_scraper()
     
-    # 获取页面和截图
-    soup, temp_screenshot_path = scraper.fetch_page_and_screenshot(post_index_to_fetch=post_index)
-    if not soup:
-        return None
-        
-    # 提取帖子信息
-    post_info = extract_post_info(soup, post_index_to_fetch=post_index)
+    with scraper.session.cycle() as timer:
+        # 获取帖子信息和截图
+        post_info, temp_screenshot_path = scraper.fetch_page_and_screenshot(post_index_to_fetch=post_index, timer=timer)
     if not post_info:
         # 如果提取失败，删除临时截图
         if temp_screenshot_path and os.path.exists(temp_screenshot_path):
@@ -546,6 +695,33 @@ def scrape_latest_post(post_index=None):
     result = process_post(post_info, temp_screenshot_path)
     return result
 
+def scrape_timeline(limit=20, since_id=None):
+    """
+    一次页面加载抓取多个新帖子并处理（下载媒体、保存）
+    
+    Args:
+        limit (int): 最多处理的帖子数
+        since_id (str, optional): 上次已处理的最新帖子ID，只返回比它更新的帖子
+    
+    Returns:
+        list: 处理后的帖子数据，按发布时间从旧到新排列
+    """
+    # 确保配置初始化
+    config.init()
+    
+    scraper = get_scraper()
+    
+    with scraper.session.cycle() as timer:
+        entries = scraper.fetch_timeline(limit=limit, since_id=since_id, timer=timer)
+    
+    results = []
+    for post_info, temp_screenshot_path in entries:
+        result = process_post(post_info, temp_screenshot_path)
+        if result:
+            results.append(result)
+    logger.info(f"时间线抓取完成: {len(results)}/{len(entries)} 个新帖子处理成功")
+    return results
+
 # 测试
 if __name__ == "__main__":
     config.init()
@@ -0,0 +1,204 @@
+# storage.py
+import json
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+
+import config
+
+# 获取logger
+logger = logging.getLogger(__name__)
+
+# 每个线程一个连接（sqlite3连接不能跨线程共享）
+_local = threading.local()
+
+# 已在当前进程中创建过的表结构
+_applied_schemas = set()
+_schema_lock = threading.RLock()
+
+POSTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    contentID TEXT PRIMARY KEY,
+    time TEXT,
+    data TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_posts_time ON posts(time);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+def get_connection():
+    """
+    获取当前线程的数据库连接（WAL模式）
+
+    首次连接时会创建帖子表，并把旧的 history.json 导入一次。
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        return conn
+
+    config.DATA_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(config.DATABASE_FILE), timeout=30)
+    conn.row_factory = sqlite3.Row
+    # WAL：读写互不阻塞，写入中途崩溃也不会损坏已有数据
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    _local.conn = conn
+
+    ensure_schema("posts", POSTS_SCHEMA)
+    import_history_json()
+    return conn
+
+def ensure_schema(name, schema_sql):
+    """
+    执行建表语句（每个进程只执行一次），供其他模块在同一个数据库中建表
+
+    Args:
+        name (str): 表结构名称
+        schema_sql (str): CREATE TABLE/INDEX IF NOT EXISTS 语句
+    """
+    if name in _applied_schemas:
+        return
+    with _schema_lock:
+        if name in _applied_schemas:
+            return
+        conn = get_connection()
+        with conn:
+            conn.executescript(schema_sql)
+        _applied_schemas.add(name)
+
+def close_connection():
+    """关闭当前线程的数据库连接"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+def get_meta(key, default=None):
+    row = get_connection().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row['value'] if row else default
+
+def set_meta(key, value):
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
+
+_UPSERT_POST_SQL = (
+    "INSERT INTO posts (contentID, time, data, updated_at) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(contentID) DO UPDATE SET "
+    "time = excluded.time, data = excluded.data, updated_at = excluded.updated_at"
+)
+
+def _post_row(post_data):
+    return (
+        str(post_data['contentID']),
+        post_data.get('time'),
+        json.dumps(post_data, ensure_ascii=False),
+        datetime.now().isoformat(),
+    )
+
+def save_post_data(post_data):
+    """
+    保存帖子数据，已存在相同contentID的记录会被更新
+
+    Args:
+        post_data (dict): 帖子数据，必须包含 contentID
+    """
+    conn = get_connection()
+    with conn:
+        conn.execute(_UPSERT_POST_SQL, _post_row(post_data))
+
+def get_post(content_id):
+    """按contentID获取帖子数据，不存在时返回None"""
+    row = get_connection().execute(
+        "SELECT data FROM posts WHERE contentID = ?", (str(content_id),)
+    ).fetchone()
+    return json.loads(row['data']) if row else None
+
+def get_latest_post():
+    """获取发布时间最新的帖子数据，没有记录时返回None"""
+    row = get_connection().execute(
+        "SELECT data FROM posts WHERE time IS NOT NULL AND time != '' ORDER BY time DESC LIMIT 1"
+    ).fetchone()
+    return json.loads(row['data']) if row else None
+
+def get_last_post_id():
+    """获取发布时间最新的帖子ID（走time索引），没有记录时返回None"""
+    row = get_connection().execute(
+        "SELECT contentID FROM posts WHERE time IS NOT NULL AND time != '' ORDER BY time DESC LIMIT 1"
+    ).fetchone()
+    return row['contentID'] if row else None
+
+def list_posts(limit=None, newest_first=True):
+    """
+    按发布时间列出帖子数据
+
+    Args:
+        limit (int, optional): 最多返回的条数
+        newest_first (bool): 是否按时间倒序
+    """
+    sql = f"SELECT data FROM posts ORDER BY time {'DESC' if newest_first else 'ASC'}"
+    params = ()
+    if limit:
+        sql += " LIMIT ?"
+        params = (int(limit),)
+    return [json.loads(row['data']) for row in get_connection().execute(sql, params)]
+
+def list_post_times(since):
+    """
+    列出发布时间不早于since的帖子时间（走time索引）
+
+    Args:
+        since (str): "%Y-%m-%d %H:%M:%S" 格式的时间
+
+    Returns:
+        list: 帖子发布时间字符串，按时间正序
+    """
+    rows = get_connection().execute(
+        "SELECT time FROM posts WHERE time >= ? ORDER BY time", (since,)
+    ).fetchall()
+    return [row['time'] for row in rows]
+
+def count_posts():
+    return get_connection().execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+def import_history_json(history_file=None):
+    """
+    一次性导入旧的 history.json，导入完成后在meta表中记录，不会重复导入
+
+    Returns:
+        int: 导入的帖子数量
+    """
+    history_file = history_file or config.HISTORY_FILE
+    if get_meta('history_json_imported') or not history_file.exists():
+        return 0
+
+    try:
+        with open(history_file, 'r', encoding='utf-8') as f:
+            history = json.load(f)
+    except Exception as e:
+        logger.error(f"读取 history.json 失败，跳过导入: {e}")
+        return 0
+
+    rows = [
+        _post_row(post_data)
+        for post_data in (history if isinstance(history, list) else [])
+        if isinstance(post_data, dict) and post_data.get('contentID')
+    ]
+    conn = get_connection()
+    with conn:
+        conn.executemany(_UPSERT_POST_SQL, rows)
+    imported = len(rows)
+
+    set_meta('history_json_imported', datetime.now().isoformat())
+    logger.info(f"已从 {history_file} 导入 {imported} 条帖子记录到 {config.DATABASE_FILE}")
+    return imported
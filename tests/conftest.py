@@ -0,0 +1,23 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import config
+import storage
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """把数据目录、SQLite数据库和追踪文件指向临时目录，每个测试使用独立的数据库"""
+    storage.close_connection()
+    monkeypatch.setattr(config, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(config, "DATABASE_FILE", tmp_path / "trump_social.db")
+    monkeypatch.setattr(config, "HISTORY_FILE", tmp_path / "history.json")
+    monkeypatch.setattr(config, "TRACE_FILE", tmp_path / "traces.jsonl")
+    monkeypatch.setattr(config, "TRACE_ENABLED", False)
+    monkeypatch.setattr(storage, "_applied_schemas", set())
+    yield tmp_path
+    storage.close_connection()
@@ -0,0 +1,98 @@
+# tests/test_downloader.py
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import config
+import downloader
+
+BLOB = bytes(range(256)) * 40
+
+class _MediaServer:
+    """支持 Range / If-Range 的本地文件服务器，记录每个请求的头"""
+
+    def __init__(self, body, etag='"v1"'):
+        self.body = body
+        self.etag = etag
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(dict(self.headers))
+                body = server.body
+                range_header = self.headers.get("Range")
+                if_range = self.headers.get("If-Range")
+                if range_header and (if_range is None or if_range == server.etag):
+                    start = int(range_header.split("=")[1].rstrip("-"))
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+                    body = body[start:]
+                else:
+                    self.send_response(200)
+                self.send_header("ETag", server.etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/media/a.jpg"
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+@pytest.fixture
+def media_server():
+    server = _MediaServer(BLOB)
+    yield server
+    server.close()
+    downloader.close_session()
+
+def _leave_partial_download(file_path, url, data, etag='"v1"'):
+    """模拟上次中断的下载：.part 中已有部分数据"""
+    with open(f"{file_path}.part", 'wb') as f:
+        f.write(data)
+    with open(f"{file_path}.part.json", 'w', encoding='utf-8') as f:
+        json.dump({'url': url, 'etag': etag, 'total': len(BLOB)}, f)
+
+def test_resumes_part_file_with_range_and_if_range(tmp_path, media_server):
+    file_path = tmp_path / "a.jpg"
+    _leave_partial_download(file_path, media_server.url, BLOB[:1000])
+
+    size, _ = downloader._fetch_to_file(media_server.url, file_path)
+
+    assert size == len(BLOB)
+    assert file_path.read_bytes() == BLOB
+    assert media_server.requests[0]["Range"] == "bytes=1000-"
+    assert media_server.requests[0]["If-Range"] == '"v1"'
+    assert not (tmp_path / "a.jpg.part").exists()
+    assert not (tmp_path / "a.jpg.part.json").exists()
+
+def test_changed_file_is_downloaded_again_from_start(tmp_path, media_server):
+    # 服务器上的文件已变化：If-Range 不匹配时返回200完整内容，不能拼接到旧数据后面
+    media_server.etag = '"v2"'
+    file_path = tmp_path / "a.jpg"
+    _leave_partial_download(file_path, media_server.url, b"x" * 1000)
+
+    downloader._fetch_to_file(media_server.url, file_path)
+
+    assert file_path.read_bytes() == BLOB
+
+def test_truncated_download_never_reaches_final_name(tmp_path, media_server, monkeypatch):
+    monkeypatch.setattr(config, "DOWNLOAD_MAX_RETRIES", 2)
+    monkeypatch.setattr(downloader.time, "sleep", lambda seconds: None)
+    # 服务器声明的长度比实际内容长
+    monkeypatch.setattr(downloader, "_parse_total_size", lambda response, offset: len(BLOB) + 10)
+    file_path = tmp_path / "a.jpg"
+
+    with pytest.raises(downloader.IncompleteDownloadError):
+        downloader._fetch_to_file(media_server.url, file_path)
+
+    assert not file_path.exists()
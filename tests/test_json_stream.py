@@ -0,0 +1,60 @@
+# tests/test_json_stream.py
+import json
+
+import pytest
+
+from models.json_stream import IncrementalJSONParser
+
+RESPONSE = {
+    "overall_score": 8,
+    "market_relevance": {"score": 7, "sectors": ["能源", "国防"]},
+    "summary": "关税 \"对等\" 措施\n将于下周生效",
+    "confident": True,
+    "note": None,
+}
+
+def _feed_in_chunks(text, size):
+    parser = IncrementalJSONParser()
+    completed = []
+    for i in range(0, len(text), size):
+        completed.extend(parser.feed(text[i:i + size]))
+    return parser, completed
+
+@pytest.mark.parametrize("size", [1, 3, 64])
+def test_fields_are_emitted_as_they_complete(size):
+    text = "```json\n" + json.dumps(RESPONSE, ensure_ascii=False, indent=2) + "\n```"
+    parser, completed = _feed_in_chunks(text, size)
+
+    assert parser.complete
+    assert parser.result() == RESPONSE
+    assert [key for key, _ in completed] == list(RESPONSE)
+    assert dict(completed) == RESPONSE
+
+def test_truncated_inside_string_keeps_text_so_far():
+    parser, _ = _feed_in_chunks('{"overall_score": 8, "summary": "关税措施将于', 5)
+
+    assert not parser.complete
+    assert parser.partial_result() == {"overall_score": 8, "summary": "关税措施将于"}
+
+def test_truncated_inside_escape_sequence():
+    parser, _ = _feed_in_chunks('{"a": 1, "summary": "line\\', 4)
+    assert parser.partial_result() == {"a": 1, "summary": "line"}
+
+    parser, _ = _feed_in_chunks('{"a": 1, "summary": "x\\u4e', 4)
+    assert parser.partial_result() == {"a": 1, "summary": "x"}
+
+def test_truncated_inside_nested_value_closes_brackets():
+    parser, _ = _feed_in_chunks('{"overall_score": 8, "market_relevance": {"score": 7, "sectors": ["能源", "国', 6)
+
+    assert parser.partial_result() == {
+        "overall_score": 8,
+        "market_relevance": {"score": 7, "sectors": ["能源", "国"]},
+    }
+
+def test_truncated_after_key_drops_the_key():
+    parser, _ = _feed_in_chunks('{"overall_score": 8, "summary": ', 4)
+    assert parser.partial_result() == {"overall_score": 8}
+
+def test_no_object_returns_none():
+    parser, _ = _feed_in_chunks("抱歉，我无法分析这条帖子。", 4)
+    assert parser.partial_result() is None
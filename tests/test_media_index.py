@@ -0,0 +1,55 @@
+# tests/test_media_index.py
+import os
+
+import downloader
+import media_index
+
+def _no_request(url):
+    raise AssertionError("已在索引中的媒体不应再请求服务器")
+
+def test_same_content_is_stored_once(data_dir):
+    first = data_dir / "1_image0.jpg"
+    second = data_dir / "2_image0.jpg"
+    first.write_bytes(b"same image")
+    second.write_bytes(b"same image")
+
+    media_index.record("http://cdn/a.jpg", first)
+    media_index.record("http://cdn/b.jpg", second)
+
+    # 内容相同的文件改为硬链接，共享同一份磁盘数据
+    assert os.path.samefile(first, second)
+    assert media_index.lookup("http://cdn/b.jpg")["sha256"] == media_index.lookup("http://cdn/a.jpg")["sha256"]
+
+def test_verify_detects_modified_file(data_dir):
+    path = data_dir / "1_image0.jpg"
+    path.write_bytes(b"original")
+    entry = media_index.record("http://cdn/a.jpg", path)
+    assert media_index.verify(entry)
+
+    path.write_bytes(b"tampered")
+    assert not media_index.verify(media_index.lookup("http://cdn/a.jpg"))
+
+def test_indexed_url_is_reused_without_download(data_dir, monkeypatch):
+    source = data_dir / "1_image0.jpg"
+    source.write_bytes(b"image")
+    media_index.record("http://cdn/a.jpg", source)
+    monkeypatch.setattr(downloader, "_remote_size", _no_request)
+
+    target = data_dir / "2_image0.jpg"
+    assert downloader._reuse_existing("http://cdn/a.jpg", target, "图片") == str(target)
+    assert os.path.samefile(source, target)
+
+def test_legacy_file_needs_matching_remote_size(data_dir, monkeypatch):
+    # 索引建立前下载的文件可能不完整：服务器大小未知或不一致时重新下载，不记入索引
+    path = data_dir / "1_image0.jpg"
+    path.write_bytes(b"x" * 10)
+
+    monkeypatch.setattr(downloader, "_remote_size", lambda url: None)
+    assert downloader._reuse_existing("http://cdn/a.jpg", path, "图片") is None
+    monkeypatch.setattr(downloader, "_remote_size", lambda url: 20)
+    assert downloader._reuse_existing("http://cdn/a.jpg", path, "图片") is None
+    assert media_index.lookup("http://cdn/a.jpg") is None
+
+    monkeypatch.setattr(downloader, "_remote_size", lambda url: 10)
+    assert downloader._reuse_existing("http://cdn/a.jpg", path, "图片") == str(path)
+    assert media_index.lookup("http://cdn/a.jpg")["size"] == 10
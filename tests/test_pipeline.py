@@ -0,0 +1,83 @@
+# tests/test_pipeline.py
+import pytest
+
+import config
+from pipeline import (Pipeline, StageDeferred, StageFailed, DONE, FAILED, record_checkpoint, get_checkpoints,
+                      get_job)
+
+@pytest.fixture
+def run_pipeline(data_dir, monkeypatch):
+    """按给定阶段运行一个任务直到结束，返回 (任务, 结束回调的结果)"""
+    monkeypatch.setattr(config, "PIPELINE_RETRY_DELAY", 0.01)
+
+    def run(stages, content_id="1", max_attempts=3):
+        finished = []
+        pipeline = Pipeline(stages, workers=1, max_attempts=max_attempts,
+                            on_finished=lambda cid, success: finished.append(success))
+        pipeline.start()
+        try:
+            pipeline.enqueue(content_id)
+            assert pipeline.wait_for([content_id], timeout=10)
+        finally:
+            pipeline.stop()
+        return get_job(content_id), finished
+    return run
+
+def _flaky(failures):
+    """前 failures 次调用返回False，之后成功"""
+    calls = []
+
+    def stage(content_id):
+        calls.append(content_id)
+        return len(calls) > failures
+    stage.calls = calls
+    return stage
+
+def test_failed_stage_is_retried(run_pipeline):
+    analyze = _flaky(1)
+    job, finished = run_pipeline([("analyze", analyze), ("publish", lambda cid: True)])
+    assert job["status"] == DONE and job["stage"] == "publish"
+    assert len(analyze.calls) == 2
+    assert finished == [True]
+
+def test_job_fails_after_max_attempts(run_pipeline):
+    analyze = _flaky(10)
+    job, finished = run_pipeline([("analyze", analyze)], max_attempts=2)
+    assert job["status"] == FAILED and job["attempts"] == 2
+    assert len(analyze.calls) == 2
+    assert finished == [False]
+
+def test_stage_failed_is_not_retried(run_pipeline):
+    calls = []
+
+    def publish(content_id):
+        calls.append(content_id)
+        raise StageFailed("审核不通过")
+    job, finished = run_pipeline([("publish", publish)])
+    assert job["status"] == FAILED and job["last_error"] == "审核不通过"
+    assert len(calls) == 1
+
+def test_deferred_stage_does_not_use_attempts(run_pipeline):
+    calls = []
+
+    def confirm(content_id):
+        calls.append(content_id)
+        if len(calls) < 3:
+            raise StageDeferred(0.01)
+        return True
+    job, finished = run_pipeline([("confirm", confirm)], max_attempts=1)
+    assert job["status"] == DONE
+    assert len(calls) == 3
+
+def test_restart_clears_checkpoints_except_scraped(data_dir):
+    pipeline = Pipeline([("analyze", lambda cid: True)])
+    pipeline.enqueue("1")
+    for name in ("scraped", "analyzed:qwen", "draft", "published"):
+        record_checkpoint("1", name, {})
+
+    assert not pipeline.enqueue("1")
+    assert set(get_checkpoints("1")) == {"scraped", "analyzed:qwen", "draft", "published"}
+
+    assert pipeline.enqueue("1", restart=True)
+    assert set(get_checkpoints("1")) == {"scraped"}
+    assert get_job("1")["stage"] == "analyze"
@@ -0,0 +1,111 @@
+# tests/test_wechat_api.py
+import pytest
+import requests
+
+import config
+import wechat_api
+from wechat_api import WechatClient, WechatAPIError
+
+# requests 的异常信息中带有完整URL（含 access_token）
+_URL_WITH_TOKEN = "https://api.weixin.qq.com/cgi-bin/draft/add?access_token=SECRET-TOKEN"
+
+class _Response:
+    def __init__(self, status_code=200, body=None):
+        self.status_code = status_code
+        self._body = body if body is not None else {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Server Error for url: {_URL_WITH_TOKEN}", response=self)
+
+    def json(self):
+        return self._body
+
+class _FakeSession:
+    """按顺序返回预设的结果（_Response 或要抛出的异常），记录每次请求的参数"""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append(kwargs.get("params"))
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+@pytest.fixture
+def session(monkeypatch):
+    monkeypatch.setattr(config, "TRACE_ENABLED", False)
+    monkeypatch.setattr(config, "WECHAT_API_MAX_RETRIES", 3)
+    monkeypatch.setattr(wechat_api.time, "sleep", lambda seconds: None)
+
+    def install(*outcomes):
+        fake = _FakeSession(outcomes)
+        monkeypatch.setattr(wechat_api, "get_session", lambda: fake)
+        return fake
+    return install
+
+def _network_error(cls=requests.ConnectionError):
+    return cls(f"Max retries exceeded with url: {_URL_WITH_TOKEN}")
+
+def test_idempotent_request_retries_network_errors_and_5xx(session):
+    fake = session(_network_error(), _Response(502), _network_error(requests.ReadTimeout), _Response(body={"url": "u"}))
+
+    assert wechat_api.request("media/uploadimg") == {"url": "u"}
+    assert len(fake.calls) == 4
+
+def test_non_idempotent_request_is_not_retried_after_it_was_sent(session):
+    for error in (_network_error(requests.ReadTimeout), _network_error(), _Response(502)):
+        fake = session(error, _Response(body={"media_id": "m"}))
+        with pytest.raises(WechatAPIError):
+            wechat_api.request("draft/add", idempotent=False)
+        assert len(fake.calls) == 1
+
+def test_non_idempotent_request_retries_connect_timeout(session):
+    fake = session(_network_error(requests.ConnectTimeout), _Response(body={"media_id": "m"}))
+
+    assert wechat_api.request("draft/add", idempotent=False) == {"media_id": "m"}
+    assert len(fake.calls) == 2
+
+def test_system_busy_is_retried_only_when_idempotent(session):
+    fake = session(_Response(body={"errcode": -1}), _Response(body={"publish_status": 0}))
+    assert wechat_api.request("freepublish/get") == {"publish_status": 0}
+    assert len(fake.calls) == 2
+
+    fake = session(_Response(body={"errcode": -1}))
+    assert wechat_api.request("freepublish/submit", idempotent=False) == {"errcode": -1}
+    assert len(fake.calls) == 1
+
+def test_gives_up_after_max_retries_without_leaking_the_url(session):
+    fake = session(*[_network_error() for _ in range(4)])
+
+    with pytest.raises(WechatAPIError) as excinfo:
+        wechat_api.request("draft/add")
+    assert len(fake.calls) == 4
+    assert "SECRET-TOKEN" not in str(excinfo.value)
+    assert excinfo.value.__cause__ is None and excinfo.value.__suppress_context__
+
+class _TokenManager:
+    def __init__(self):
+        self.token = "old"
+        self.invalidated = []
+
+    def get(self):
+        return self.token
+
+    def invalidate(self, token):
+        self.invalidated.append(token)
+        self.token = "new"
+        return self.token
+
+def test_client_refreshes_token_once_on_token_error(session):
+    fake = session(_Response(body={"errcode": 40001}), _Response(body={"errcode": 42001}))
+    manager = _TokenManager()
+
+    result = WechatClient(manager).call("freepublish/get", json_body={"publish_id": "p"})
+
+    assert result == {"errcode": 42001}
+    assert manager.invalidated == ["old"]
+    assert [params["access_token"] for params in fake.calls] == ["old", "new"]
@@ -0,0 +1,74 @@
+# tests/test_wechat_token.py
+import time
+import threading
+
+import pytest
+
+import config
+import wechat_token
+from wechat_token import TokenManager
+
+@pytest.fixture
+def token_api(data_dir, monkeypatch):
+    """替换 /token 接口：每次调用返回新的 token，记录调用次数"""
+    monkeypatch.setattr(config, "WECHAT_TOKEN_BACKGROUND_REFRESH", False)
+    calls = []
+    lock = threading.Lock()
+
+    def fake_request(endpoint, method="POST", params=None, **kwargs):
+        assert endpoint == "token"
+        time.sleep(0.05)  # 让并发的调用方有机会同时等待刷新
+        with lock:
+            calls.append(params)
+            return {"access_token": f"token-{len(calls)}", "expires_in": 7200}
+    monkeypatch.setattr(wechat_token, "request", fake_request)
+    return calls
+
+def _manager(data_dir):
+    return TokenManager("appid", "secret", data_dir / "wechat_token.json")
+
+def _in_threads(func, count=8):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(func())) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_concurrent_get_fetches_once(data_dir, token_api):
+    manager = _manager(data_dir)
+
+    assert _in_threads(manager.get) == ["token-1"] * 8
+    assert len(token_api) == 1
+    assert manager.get() == "token-1"
+    assert len(token_api) == 1
+
+def test_token_file_is_shared_between_managers(data_dir, token_api):
+    # 两个 TokenManager 代表两个进程，通过 token 文件共用同一个 token
+    assert _manager(data_dir).get() == "token-1"
+    assert _manager(data_dir).get() == "token-1"
+    assert len(token_api) == 1
+
+def test_concurrent_invalidate_refreshes_once(data_dir, token_api):
+    manager = _manager(data_dir)
+    stale = manager.get()
+
+    assert _in_threads(lambda: manager.invalidate(stale)) == ["token-2"] * 8
+    assert len(token_api) == 2
+    assert manager.get() == "token-2"
+
+def test_token_near_expiry_is_refreshed(data_dir, token_api, monkeypatch):
+    manager = _manager(data_dir)
+    manager.get()
+    # 距离过期不足 WECHAT_TOKEN_REFRESH_MARGIN 秒
+    monkeypatch.setattr(config, "WECHAT_TOKEN_REFRESH_MARGIN", 7300)
+
+    assert manager.get() == "token-2"
+    assert len(token_api) == 2
+
+def test_failed_fetch_returns_none(data_dir, monkeypatch):
+    monkeypatch.setattr(config, "WECHAT_TOKEN_BACKGROUND_REFRESH", False)
+    monkeypatch.setattr(wechat_token, "request", lambda endpoint, **kwargs: {"errcode": 40164, "errmsg": "invalid ip"})
+
+    assert _manager(data_dir).get() is None
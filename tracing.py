@@ -0,0 +1,294 @@
+# tracing.py
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+import functools
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import config
+
+# 获取logger
+logger = logging.getLogger(__name__)
+
+# 耗时直方图的分桶上限（秒），覆盖从单次接口调用到整轮分析
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# 当前正在执行的span（contextvars：跨线程时需要用 bind() 传递）
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    """
+    一段计时的操作
+
+    Attributes:
+        name (str): 操作名称，例如 stage.analyze、scrape.navigation、wechat.create_draft
+        content_id (str): 所属帖子ID，未指定时继承父span
+        attrs (dict): 附加信息（模型名、URL、字节数等）
+        status (str): "ok" 或 "error"
+    """
+
+    def __init__(self, name, content_id=None, parent=None, attrs=None):
+        self.name = name
+        self.parent = parent
+        self.content_id = content_id or (parent.content_id if parent else None)
+        self.span_id = uuid.uuid4().hex[:16]
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.attrs = dict(attrs or {})
+        self.status = "ok"
+        self.error = None
+        self.started_at = time.time()
+        self._start = time.monotonic()
+        self.duration = None
+
+    def set(self, **attrs):
+        """补充附加信息"""
+        self.attrs.update(attrs)
+
+    def fail(self, error):
+        """标记为失败（没有抛出异常的失败，例如阶段返回False）"""
+        self.status = "error"
+        self.error = str(error)
+
+    def to_dict(self):
+        record = {
+            "ts": datetime.fromtimestamp(self.started_at).isoformat(timespec="milliseconds"),
+            "name": self.name,
+            "content_id": self.content_id,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "duration_ms": round(self.duration * 1000, 1) if self.duration is not None else None,
+            "status": self.status,
+            "thread": threading.current_thread().name,
+        }
+        if self.error:
+            record["error"] = self.error
+        if self.attrs:
+            record["attrs"] = self.attrs
+        return record
+
+class Histogram:
+    """Prometheus 风格的累计分桶直方图（按 span 名称和状态分组）"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # {(名称, 状态): [各桶计数..., +Inf计数, 总和]}
+        self._lock = threading.Lock()
+
+    def observe(self, name, status, seconds):
+        with self._lock:
+            series = self._series.setdefault((name, status), [0] * (len(self.buckets) + 1) + [0.0])
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+            series[len(self.buckets)] += 1
+            series[-1] += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {key: list(values) for key, values in self._series.items()}
+
+class _TraceWriter:
+    """把结束的span逐行追加到 JSONL 文件，超过 TRACE_MAX_MB 时轮转为 .1"""
+
+    def __init__(self):
+        self._file = None
+        self._path = None
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            try:
+                if self._file is None or self._path != config.TRACE_FILE:
+                    self._open()
+                self._file.write(line)
+                self._file.flush()
+                if config.TRACE_MAX_MB > 0 and self._file.tell() > config.TRACE_MAX_MB * 1024 * 1024:
+                    self._rotate()
+            except OSError as e:
+                logger.warning(f"写入追踪文件失败: {e}")
+                self._file = None
+
+    def _open(self):
+        if self._file is not None:
+            self._file.close()
+        self._path = config.TRACE_FILE
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self._path, 'a', encoding='utf-8')
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        os.replace(self._path, self._path.with_name(self._path.name + ".1"))
+        self._open()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+_writer = _TraceWriter()
+_histogram = Histogram()
+
+def _finish(span_obj):
+    span_obj.duration = time.monotonic() - span_obj._start
+    _histogram.observe(span_obj.name, span_obj.status, span_obj.duration)
+    if config.TRACE_ENABLED:
+        _writer.write(span_obj.to_dict())
+
+@contextmanager
+def span(name, content_id=None, **attrs):
+    """
+    记录一段操作的耗时
+
+    span 可以嵌套，子span自动继承父span的帖子ID；结束时写入 TRACE_FILE，
+    并计入 /metrics 的耗时直方图。抛出异常时状态记为 error，异常照常向外抛出。
+
+    用法:
+        with tracing.span("stage.analyze", content_id, model="qwen-max") as s:
+            ...
+            s.set(tokens=123)
+
+    Yields:
+        Span: 当前span
+    """
+    current = Span(name, content_id=content_id, parent=_current_span.get(), attrs=attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current_span.reset(token)
+        _finish(current)
+
+def traced(name):
+    """装饰器：把整个函数调用记为一个span"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def bind(func):
+    """
+    绑定当前的span上下文，返回在其他线程中执行时仍属于当前span的函数
+
+    线程池和新线程不会继承 contextvars，提交任务前用 bind 包装。
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # 每次调用使用独立的副本，同一个包装函数可以在多个线程中同时执行
+        return context.copy().run(func, *args, **kwargs)
+    return wrapper
+
+def current_span():
+    """当前正在执行的span，没有时返回None"""
+    return _current_span.get()
+
+def escape_label(value):
+    """转义 Prometheus 标签值"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+_collectors = []
+
+def register_collector(collector):
+    """
+    注册额外的 /metrics 指标
+
+    Args:
+        collector (callable): 返回 Prometheus 文本格式行列表的函数，每次请求 /metrics 时调用
+    """
+    if collector not in _collectors:
+        _collectors.append(collector)
+
+def metrics_text():
+    """
+    Prometheus 文本格式的指标
+
+    Returns:
+        str: span_duration_seconds 直方图（标签 span、status），以及 register_collector 注册的指标
+    """
+    lines = [
+        "# HELP span_duration_seconds Duration of traced pipeline spans",
+        "# TYPE span_duration_seconds histogram",
+    ]
+    buckets = _histogram.buckets
+    for (name, status), series in sorted(_histogram.snapshot().items()):
+        labels = f'span="{escape_label(name)}",status="{status}"'
+        for i, bound in enumerate(buckets):
+            lines.append(f'span_duration_seconds_bucket{{{labels},le="{bound:g}"}} {series[i]}')
+        lines.append(f'span_duration_seconds_bucket{{{labels},le="+Inf"}} {series[len(buckets)]}')
+        lines.append(f'span_duration_seconds_sum{{{labels}}} {series[-1]:.6f}')
+        lines.append(f'span_duration_seconds_count{{{labels}}} {series[len(buckets)]}')
+    for collector in list(_collectors):
+        try:
+            lines.extend(collector())
+        except Exception as e:
+            logger.warning(f"生成指标失败: {e}")
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"/metrics 请求: {format % args}")
+
+_server = None
+
+def start_metrics_server(port=None, host=None):
+    """
+    在后台线程中启动 /metrics HTTP 服务
+
+    Args:
+        port (int, optional): 监听端口，默认 config.METRICS_PORT
+        host (str, optional): 监听地址，默认 config.METRICS_HOST
+
+    Returns:
+        ThreadingHTTPServer: 已启动的服务，启动失败时返回None
+    """
+    global _server
+    if _server is not None:
+        return _server
+    port = port if port is not None else config.METRICS_PORT
+    host = host or config.METRICS_HOST
+    try:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logger.error(f"启动指标服务失败 ({host}:{port}): {e}")
+        return None
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"指标服务已启动: http://{host}:{_server.server_address[1]}/metrics")
+    return _server
+
+def shutdown():
+    """停止指标服务并关闭追踪文件"""
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
+    _writer.close()
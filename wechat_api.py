@@ -0,0 +1,241 @@
+# wechat_api.py
+import json
+import time
+import random
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+import tracing
+
+# 获取logger
+logger = logging.getLogger(__name__)
+
+BASE_URL = "https://api.weixin.qq.com/cgi-bin"
+
+# 表示 access_token 无效或已过期的错误码，遇到后刷新 token 并重试
+TOKEN_ERROR_CODES = {40001, 40014, 42001}
+
+# 可以重试的错误码（-1：系统繁忙）
+RETRYABLE_ERRCODES = {-1}
+
+# 可以重试的网络错误（其他 requests 异常直接失败）
+RETRYABLE_EXCEPTIONS = (requests.ConnectionError, requests.Timeout, requests.HTTPError, ValueError)
+
+# 缺少 access_token 时返回的结果（与微信接口的错误码一致）
+MISSING_TOKEN_RESULT = {"errcode": 41001, "errmsg": "access_token missing"}
+
+# 全局HTTP会话：所有微信接口共享连接池（keep-alive）
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """获取共享的requests会话（线程安全的懒加载）"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.WECHAT_HTTP_POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+def close_session():
+    """关闭共享会话，释放连接"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+class _EndpointStats:
+    """各接口的调用次数、错误次数和耗时"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, endpoint, seconds, result, retried=False):
+        """
+        Args:
+            result (str): "ok"、"errcode"（接口返回错误码）或 "network"（网络错误、超时、5xx）
+        """
+        with self._lock:
+            entry = self._stats.setdefault(endpoint, {"requests": 0, "ok": 0, "errcode": 0, "network": 0,
+                                                      "retries": 0, "seconds": 0.0, "max_seconds": 0.0})
+            entry["requests"] += 1
+            entry[result] += 1
+            entry["retries"] += 1 if retried else 0
+            entry["seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: dict(entry) for endpoint, entry in self._stats.items()}
+
+_stats = _EndpointStats()
+
+def get_api_stats():
+    """
+    各接口的请求统计
+
+    Returns:
+        dict: {接口: {"requests", "errors", "retries", "avg_ms", "max_ms"}}
+    """
+    return {
+        endpoint: {
+            "requests": entry["requests"],
+            "errors": entry["errcode"] + entry["network"],
+            "retries": entry["retries"],
+            "avg_ms": round(entry["seconds"] / entry["requests"] * 1000),
+            "max_ms": round(entry["max_seconds"] * 1000),
+        }
+        for endpoint, entry in _stats.snapshot().items()
+    }
+
+def _metrics_lines():
+    lines = [
+        "# HELP wechat_api_requests_total WeChat API HTTP requests by endpoint and result",
+        "# TYPE wechat_api_requests_total counter",
+    ]
+    snapshot = _stats.snapshot()
+    for endpoint, entry in sorted(snapshot.items()):
+        label = tracing.escape_label(endpoint)
+        for result in ("ok", "errcode", "network"):
+            lines.append(f'wechat_api_requests_total{{endpoint="{label}",result="{result}"}} {entry[result]}')
+    lines += [
+        "# HELP wechat_api_retries_total WeChat API requests that were retries",
+        "# TYPE wechat_api_retries_total counter",
+    ]
+    for endpoint, entry in sorted(snapshot.items()):
+        lines.append(f'wechat_api_retries_total{{endpoint="{tracing.escape_label(endpoint)}"}} {entry["retries"]}')
+    return lines
+
+tracing.register_collector(_metrics_lines)
+
+def _retry_delay(attempt):
+    return min(config.WECHAT_API_RETRY_BACKOFF * 2 ** (attempt - 1), 30) * random.uniform(0.5, 1.5)
+
+class WechatAPIError(requests.RequestException):
+    """微信接口请求失败（网络错误、5xx或返回内容不是JSON），信息中不含URL"""
+
+def _describe_error(endpoint, error):
+    """
+    不含URL的错误描述
+
+    requests 的异常信息里带有完整的请求URL，查询参数中有 access_token 或 AppSecret，
+    日志、追踪和向外抛出的异常都只使用这里的描述。
+    """
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return f"{endpoint}: HTTP {error.response.status_code}"
+    return f"{endpoint}: {type(error).__name__}"
+
+def request(endpoint, method="POST", params=None, json_body=None, file_path=None, idempotent=True):
+    """
+    调用一次微信接口，网络错误和可重试的错误码按指数退避重试
+
+    连接超时（请求没有发出）总是重试；其他网络错误、读取超时、5xx、系统繁忙只在 idempotent 为True时重试，
+    避免重复提交发布任务这类不能重复执行的请求。
+
+    Args:
+        endpoint (str): 接口路径，例如 "draft/add"
+        method (str): "GET" 或 "POST"
+        params (dict, optional): 查询参数（包括 access_token）
+        json_body (dict, optional): JSON请求体（中文不转义）
+        file_path (str, optional): 以 media 字段上传的文件，每次重试重新打开
+        idempotent (bool): 重复执行是否安全
+
+    Returns:
+        dict: 接口返回的JSON（可能带 errcode）
+
+    Raises:
+        WechatAPIError: 重试用完后仍然失败（信息中只有接口路径和错误类型）
+    """
+    url = f"{BASE_URL}/{endpoint}"
+    read_timeout = config.WECHAT_UPLOAD_READ_TIMEOUT if file_path else config.WECHAT_READ_TIMEOUT
+    kwargs = {"params": params, "timeout": (config.WECHAT_CONNECT_TIMEOUT, read_timeout)}
+    if json_body is not None:
+        kwargs["data"] = json.dumps(json_body, ensure_ascii=False).encode('utf-8')
+        kwargs["headers"] = {'Content-Type': 'application/json; charset=utf-8'}
+
+    max_retries = max(config.WECHAT_API_MAX_RETRIES, 0)
+    attempt = 0
+    while True:
+        started = time.monotonic()
+        failure = None
+        with tracing.span(f"wechat.api.{endpoint}", attempt=attempt + 1) as current:
+            try:
+                if file_path:
+                    with open(file_path, 'rb') as f:
+                        response = get_session().request(method, url, files={'media': f}, **kwargs)
+                else:
+                    response = get_session().request(method, url, **kwargs)
+                if response.status_code >= 500:
+                    response.raise_for_status()
+                result = response.json()
+            except (requests.RequestException, ValueError) as e:
+                failure = e
+                error = _describe_error(endpoint, e)
+                current.fail(error)
+
+        if failure is not None:
+            _stats.record(endpoint, time.monotonic() - started, "network", retried=attempt > 0)
+            # 只有连接超时能确定请求没有发出，其他错误只在幂等请求时重试
+            if (attempt >= max_retries or not isinstance(failure, RETRYABLE_EXCEPTIONS)
+                    or (not idempotent and not isinstance(failure, requests.ConnectTimeout))):
+                raise WechatAPIError(error) from None
+        else:
+            errcode = result.get('errcode', 0) if isinstance(result, dict) else 0
+            _stats.record(endpoint, time.monotonic() - started, "errcode" if errcode else "ok", retried=attempt > 0)
+            retryable = errcode in RETRYABLE_ERRCODES and idempotent
+            if not retryable or attempt >= max_retries:
+                return result
+            error = f"errcode {errcode}: {result.get('errmsg')}"
+
+        attempt += 1
+        delay = _retry_delay(attempt)
+        logger.warning(f"微信接口 {endpoint} 出错 (第{attempt}/{max_retries}次重试，{delay:.1f} 秒后): {error}")
+        time.sleep(delay)
+
+class WechatClient:
+    """
+    带 access_token 管理的微信接口客户端
+
+    接口返回 token 无效或过期时，通过 TokenManager 刷新 token 后重试一次
+    （请求被拒绝时没有执行，重试是安全的）。
+
+    Args:
+        token_manager (TokenManager): 见 wechat_token.py
+    """
+
+    def __init__(self, token_manager):
+        self.token_manager = token_manager
+
+    def call(self, endpoint, access_token=None, params=None, **kwargs):
+        """
+        调用需要 access_token 的接口
+
+        Args:
+            endpoint (str): 接口路径
+            access_token (str, optional): 调用方已获取的 token，默认从 TokenManager 获取
+            params (dict, optional): 额外的查询参数
+            **kwargs: 传给 request()
+
+        Returns:
+            dict: 接口返回的JSON，无法获取 token 时返回 errcode 41001
+        """
+        token = access_token or self.token_manager.get()
+        for refreshed in (False, True):
+            if not token:
+                logger.error(f"无法获取access_token，未调用微信接口 {endpoint}")
+                return dict(MISSING_TOKEN_RESULT)
+            result = request(endpoint, params={**(params or {}), 'access_token': token}, **kwargs)
+            if refreshed or not isinstance(result, dict) or result.get('errcode') not in TOKEN_ERROR_CODES:
+                return result
+            logger.warning(f"微信接口 {endpoint} 返回 token 失效 ({result.get('errcode')})，刷新后重试")
+            token = self.token_manager.invalidate(token)
+        return result
@@ -3,93 +3,64 @@ import os
 import sys
 import json
 import time
-import requests
-from datetime import datetime, timedelta
+import logging
+import threading
+from datetime import datetime
 from pathlib import Path
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import config
+import storage
+import tracing
 from article_generator import ArticleGenerator
+from wechat_api import WechatClient, WechatAPIError, BASE_URL
+from wechat_token import get_token_manager
+
+# 获取logger
+logger = logging.getLogger(__name__)
+
+# 处理队列中的多个工作线程可能同时发布，发布记录文件的读写需要串行
+_records_lock = threading.Lock()
+
+# freepublish/get 返回的 publish_status
+PUBLISH_STATUS_TEXT = {
+    0: "发布成功",
+    1: "发布中",
+    2: "原创审核不通过",
+    3: "常规失败",
+    4: "平台审核不通过",
+    5: "成功后用户删除所有文章",
+    6: "成功后系统封禁所有文章",
+}
+
+# 可以重新提交发布的失败状态（常规失败）；审核不通过、删除、封禁时重新提交同一篇文章没有意义
+RESUBMITTABLE_PUBLISH_STATUS = {3}
+
+def publish_poll_delay(polls):
+    """第 polls 次查询发布状态后，到下一次查询的等待秒数（指数退避，不超过 PUBLISH_POLL_MAX_INTERVAL）"""
+    return min(config.PUBLISH_POLL_INTERVAL * 2 ** max(polls - 1, 0), config.PUBLISH_POLL_MAX_INTERVAL)
 
 class WechatPublisher:
     def __init__(self):
         self.appid = os.getenv('WECHAT_APPID')
         self.appsecret = os.getenv('WECHAT_APPSECRET')
         self.token_file = config.DATA_DIR / "wechat_token.json"
-        self.base_url = "https://api.weixin.qq.com/cgi-bin"
+        self.token_manager = get_token_manager(self.appid, self.appsecret, self.token_file)
+        self.client = WechatClient(self.token_manager)
+        self.records_file = config.DATA_DIR / "publish_records.json"
+        self.base_url = BASE_URL
         
+    @tracing.traced("wechat.get_access_token")
     def get_access_token(self):
-        """获取access_token，实现缓存机制"""
-        # 检查缓存的token是否有效
-        if self.token_file.exists():
-            with open(self.token_file, 'r', encoding='utf-8') as f:
-                token_data = json.load(f)
-            
-            # 检查是否过期（提前5分钟刷新）
-            expire_time = datetime.fromisoformat(token_data['expire_time'])
-            if datetime.now() < expire_time - timedelta(minutes=5):
-                print("使用缓存的access_token")
-                return token_data['access_token']
-        
-        # 获取新的token
-        print("获取新的access_token...")
-        url = f"{self.base_url}/token"
-        params = {
-            'grant_type': 'client_credential',
-            'appid': self.appid,
-            'secret': self.appsecret
-        }
-        
-        try:
-            response = requests.get(url, params=params)
-            data = response.json()
-            
-            if 'access_token' in data:
-                # 保存token和过期时间
-                expire_time = datetime.now() + timedelta(seconds=data['expires_in'])
-                token_data = {
-                    'access_token': data['access_token'],
-                    'expire_time': expire_time.isoformat(),
-                    'expires_in': data['expires_in']
-                }
-                
-                with open(self.token_file, 'w', encoding='utf-8') as f:
-                    json.dump(token_data, f, ensure_ascii=False, indent=2)
-                
-                print(f"获取access_token成功，有效期：{data['expires_in']}秒")
-                return data['access_token']
-            else:
-                error_msg = f"获取access_token失败: {data}"
-                print(error_msg)
-                
-                # 处理特定错误码
-                errcode = data.get('errcode')
-                if errcode == 40164:
-                    print("错误：IP地址不在白名单中，请在公众号后台添加服务器IP到白名单")
-                elif errcode == 40001:
-                    print("错误：AppSecret错误，请检查配置")
-                elif errcode == 89503:
-                    print("错误：此IP调用需要管理员确认")
-                
-                return None
-                
-        except Exception as e:
-            print(f"请求失败: {str(e)}")
-            return None
+        """获取access_token（进程内共享、自动刷新，见 wechat_token.TokenManager）"""
+        return self.token_manager.get()
     
+    @tracing.traced("wechat.upload_image")
     def upload_image(self, image_path, access_token):
         """上传图片到微信服务器（永久素材）"""
-        url = f"{self.base_url}/material/add_material"
-        params = {
-            'access_token': access_token,
-            'type': 'image'
-        }
-        
-        with open(image_path, 'rb') as f:
-            files = {'media': f}
-            response = requests.post(url, params=params, files=files)
-        
-        data = response.json()
+        # 重复上传会生成重复的永久素材（占用素材数量上限），只在确定请求没有发出时重试
+        data = self.client.call("material/add_material", access_token, params={'type': 'image'},
+                                file_path=image_path, idempotent=False)
         if 'media_id' in data:
             print(f"图片上传成功（永久素材），media_id: {data['media_id']}")
             return data['media_id']
@@ -97,16 +68,10 @@ class WechatPublisher:
             print(f"图片上传失败: {data}")
             return None
     
+    @tracing.traced("wechat.upload_news_image")
     def upload_news_image(self, image_path, access_token):
         """上传图文消息内的图片"""
-        url = f"{self.base_url}/media/uploadimg"
-        params = {'access_token': access_token}
-        
-        with open(image_path, 'rb') as f:
-            files = {'media': f}
-            response = requests.post(url, params=params, files=files)
-        
-        data = response.json()
+        data = self.client.call("media/uploadimg", access_token, file_path=image_path)
         if 'url' in data:
             print(f"图文内图片上传成功，URL: {data['url']}")
             return data['url']
@@ -114,11 +79,9 @@ class WechatPublisher:
             print(f"图文内图片上传失败: {data}")
             return None
     
+    @tracing.traced("wechat.create_draft")
     def create_draft(self, article_data, access_token):
         """新建草稿"""
-        url = f"{self.base_url}/draft/add"
-        params = {'access_token': access_token}
-        
         # 构建图文消息
         articles = [{
             "title": article_data['title'],
@@ -131,13 +94,8 @@ class WechatPublisher:
             "only_fans_can_comment": 0
         }]
         
-        data = {"articles": articles}
-        
-        response = requests.post(url, params=params, 
-                               data=json.dumps(data, ensure_ascii=False).encode('utf-8'),
-                               headers={'Content-Type': 'application/json; charset=utf-8'})
-        
-        result = response.json()
+        # 重复提交会生成重复的草稿，只在确定请求没有发出时重试
+        result = self.client.call("draft/add", access_token, json_body={"articles": articles}, idempotent=False)
         if 'media_id' in result:
             print(f"草稿创建成功，media_id: {result['media_id']}")
             return result['media_id']
@@ -145,18 +103,12 @@ class WechatPublisher:
             print(f"草稿创建失败: {result}")
             return None
     
+    @tracing.traced("wechat.publish_draft")
     def publish_draft(self, media_id, access_token):
         """发布草稿"""
-        url = f"{self.base_url}/freepublish/submit"
-        params = {'access_token': access_token}
-        
-        data = {"media_id": media_id}
-        
-        response = requests.post(url, params=params,
-                               data=json.dumps(data, ensure_ascii=False).encode('utf-8'),
-                               headers={'Content-Type': 'application/json; charset=utf-8'})
-        
-        result = response.json()
+        # 重复提交会重复发布，只在确定请求没有发出时重试
+        result = self.client.call("freepublish/submit", access_token, json_body={"media_id": media_id},
+                                  idempotent=False)
         if result.get('errcode', 0) == 0:
             print(f"发布任务提交成功，publish_id: {result.get('publish_id')}")
             return result.get('publish_id')
@@ -172,122 +124,206 @@ class WechatPublisher:
                 print("错误：请手动保存成功后再发表")
             return None
     
+    @tracing.traced("wechat.get_publish_status")
     def get_publish_status(self, publish_id, access_token):
         """轮询发布状态"""
-        url = f"{self.base_url}/freepublish/get"
-        params = {'access_token': access_token}
-        
-        data = {"publish_id": publish_id}
-        
-        response = requests.post(url, params=params,
-                               data=json.dumps(data, ensure_ascii=False).encode('utf-8'),
-                               headers={'Content-Type': 'application/json; charset=utf-8'})
-        
-        return response.json()
+        return self.client.call("freepublish/get", access_token, json_body={"publish_id": publish_id})
     
-    def wait_for_publish_complete(self, publish_id, access_token, max_wait_seconds=300):
-        """等待发布完成，最多等待max_wait_seconds秒"""
-        start_time = time.time()
-        check_interval = 5  # 每5秒检查一次
+    def _publish_status_of(self, result):
+        """
+        解析发布状态查询结果
+
+        Returns:
+            tuple: (状态, 说明)，状态为 "published"、"publishing" 或 "failed"
+        """
+        publish_status = (result or {}).get('publish_status', -1)
+        if publish_status == 0:
+            return "published", PUBLISH_STATUS_TEXT[0]
+        if publish_status in PUBLISH_STATUS_TEXT and publish_status != 1:
+            return "failed", PUBLISH_STATUS_TEXT[publish_status]
+        if publish_status != 1:
+            logger.warning(f"查询发布状态返回异常结果: {result}")
+        return "publishing", PUBLISH_STATUS_TEXT[1]
+    
+    def submit_publish(self, content_id, draft):
+        """
+        提交草稿的发布任务，不等待发布完成
+
+        提交后在发布记录中写入一条 status 为 "publishing" 的记录，
+        之后由 confirm_publish 查询结果并更新。
+
+        Args:
+            content_id (str): 帖子ID
+            draft (dict): create_article_draft 返回的草稿信息
+
+        Returns:
+            dict: 发布记录，提交失败返回None
+        """
+        access_token = self.get_access_token()
+        if not access_token:
+            print("获取access_token失败，无法继续")
+            return None
         
-        print(f"\n开始轮询发布状态...")
+        print("\n提交发布任务...")
+        publish_id = self.publish_draft(draft['media_id'], access_token)
+        if not publish_id:
+            print("发布任务提交失败")
+            return None
         
-        while time.time() - start_time < max_wait_seconds:
-            result = self.get_publish_status(publish_id, access_token)
-            
-            publish_status = result.get('publish_status', -1)
-            
-            if publish_status == 0:
-                # 发布成功
-                print(f"\n✓ 发布成功！")
-                article_id = result.get('article_id')
-                article_detail = result.get('article_detail', {})
-                
-                print(f"文章ID: {article_id}")
-                
-                # 打印文章链接
-                items = article_detail.get('item', [])
-                for item in items:
-                    print(f"文章链接: {item.get('article_url')}")
-                
-                return True, result
-                
-            elif publish_status == 1:
-                # 发布中
-                elapsed = int(time.time() - start_time)
-                print(f"\r发布中... 已等待 {elapsed} 秒", end='', flush=True)
-                
-            elif publish_status in [2, 3, 4]:
-                # 发布失败
-                print(f"\n✗ 发布失败！状态码: {publish_status}")
-                
-                status_msg = {
-                    2: "原创审核不通过",
-                    3: "常规失败",
-                    4: "平台审核不通过"
-                }
-                print(f"失败原因: {status_msg.get(publish_status, '未知')}")
-                
-                fail_idx = result.get('fail_idx', [])
-                if fail_idx:
-                    print(f"失败的文章序号: {fail_idx}")
-                
-                return False, result
-                
-            elif publish_status == 5:
-                print(f"\n✗ 成功后用户删除所有文章")
-                return False, result
-                
-            elif publish_status == 6:
-                print(f"\n✗ 成功后系统封禁所有文章")
-                return False, result
-            
-            time.sleep(check_interval)
+        record = {
+            'content_id': content_id,
+            'draft_media_id': draft['media_id'],
+            'publish_id': publish_id,
+            'title': draft['title'],
+            'create_time': datetime.now().isoformat(),
+            'status': 'publishing',
+            'polls': 0,
+            'publish_result': None
+        }
+        self._save_publish_record(record)
+        return record
+    
+    def confirm_publish(self, publish_id):
+        """
+        查询一次发布任务的状态，到达最终状态时更新发布记录
+
+        Args:
+            publish_id (str): submit_publish 返回的发布任务ID
+
+        Returns:
+            dict: 更新后的发布记录，status 为 "publishing"（仍在发布中）、"published" 或 "failed"
+        """
+        record = self.get_publish_record(publish_id) or {'publish_id': publish_id, 'status': 'publishing', 'polls': 0}
+        if record['status'] != 'publishing':
+            return record
         
-        print(f"\n✗ 发布超时（等待超过{max_wait_seconds}秒）")
+        access_token = self.get_access_token()
+        result = None
+        if access_token:
+            try:
+                result = self.get_publish_status(publish_id, access_token)
+            except WechatAPIError as e:
+                logger.warning(f"查询发布状态失败 (publish_id: {publish_id}): {e}")
+        
+        status, reason = self._publish_status_of(result)
+        record['polls'] = record.get('polls', 0) + 1
+        record['last_check_time'] = datetime.now().isoformat()
+        if status == 'publishing':
+            self._save_publish_record(record)
+            return record
+        
+        record['status'] = status
+        record['finish_time'] = record['last_check_time']
+        record['publish_result'] = result
+        record['reason'] = reason
+        if status == 'published':
+            items = (result.get('article_detail') or {}).get('item', [])
+            record['article_url'] = items[0].get('article_url') if items else None
+            logger.info(f"发布成功 (publish_id: {publish_id})，文章ID: {result.get('article_id')}，"
+                        f"链接: {record['article_url']}")
+        else:
+            logger.error(f"发布失败 (publish_id: {publish_id})：{reason}，状态码: {result.get('publish_status')}，"
+                         f"失败的文章序号: {result.get('fail_idx', [])}")
+        self._save_publish_record(record)
+        return record
+    
+    @tracing.traced("wechat.wait_for_publish_complete")
+    def wait_for_publish_complete(self, publish_id, access_token=None, max_wait_seconds=300):
+        """
+        阻塞等待发布完成，最多等待max_wait_seconds秒（查询间隔按指数退避增长）
+
+        处理队列不使用本方法，而是由 confirm 阶段在后台逐次调用 confirm_publish。
+        access_token 参数只为兼容旧的调用方式保留，每次查询前会重新获取（已缓存的）token。
+
+        Returns:
+            tuple: (是否发布成功, 发布状态查询结果)，超时返回 (False, None)
+        """
+        start_time = time.monotonic()
+        logger.info(f"开始轮询发布状态 (publish_id: {publish_id})")
+        while True:
+            record = self.confirm_publish(publish_id)
+            if record['status'] != 'publishing':
+                return record['status'] == 'published', record.get('publish_result')
+            elapsed = time.monotonic() - start_time
+            if elapsed >= max_wait_seconds:
+                break
+            delay = min(publish_poll_delay(record['polls']), max_wait_seconds - elapsed)
+            logger.info(f"发布中... 已等待 {elapsed:.0f} 秒，{delay:.0f} 秒后再次查询")
+            time.sleep(delay)
+        
+        logger.error(f"发布超时（等待超过{max_wait_seconds}秒）")
         return False, None
     
-    def publish_article(self, content_id):
-        """发布文章的主流程 - 创建草稿并自动发布"""
-        print("=== 开始微信公众号发布流程 ===")
-        
+    def get_publish_record(self, publish_id):
+        """按 publish_id 查找发布记录，不存在时返回None"""
+        with _records_lock:
+            for record in self._load_publish_records():
+                if record.get('publish_id') == publish_id:
+                    return record
+        return None
+    
+    def _load_publish_records(self):
+        if not self.records_file.exists():
+            return []
+        with open(self.records_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def _save_publish_record(self, record):
+        """按 publish_id 新增或更新一条发布记录"""
+        with _records_lock:
+            records = self._load_publish_records()
+            for i, existing in enumerate(records):
+                if existing.get('publish_id') == record['publish_id']:
+                    records[i] = record
+                    break
+            else:
+                records.append(record)
+            
+            temp_file = self.records_file.with_suffix('.tmp')
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(records, f, ensure_ascii=False, indent=2)
+            os.replace(temp_file, self.records_file)
+    
+    def create_article_draft(self, content_id, html_file, screenshot_path):
+        """
+        上传封面和文章内截图并创建草稿
+
+        Args:
+            content_id (str): 帖子ID
+            html_file (str): 已生成的文章HTML路径
+            screenshot_path (str): 帖子截图路径
+
+        Returns:
+            dict: 草稿信息 {'media_id', 'thumb_media_id', 'title'}，失败返回None
+        """
         # 1. 获取access_token
         access_token = self.get_access_token()
         if not access_token:
             print("获取access_token失败，无法继续")
-            return False
-        
-        # 2. 生成文章
-        print("\n生成文章...")
-        generator = ArticleGenerator()
-        try:
-            html_file, screenshot_path = generator.generate_article(content_id)
-        except Exception as e:
-            print(f"生成文章失败: {e}")
-            return False
+            return None
         
-        # 3. 上传封面图（永久素材）
+        # 2. 上传封面图（永久素材）
         print("\n上传封面图...")
         thumb_media_id = self.upload_image(screenshot_path, access_token)
         if not thumb_media_id:
             print("上传封面图失败")
-            return False
+            return None
         
-        # 4. 上传文章内的截图
+        # 3. 上传文章内的截图
         print("\n上传文章内图片...")
         screenshot_url = self.upload_news_image(screenshot_path, access_token)
         if not screenshot_url:
             print("上传文章内图片失败")
-            return False
+            return None
         
-        # 5. 读取并处理HTML内容
+        # 4. 读取并处理HTML内容
         with open(html_file, 'r', encoding='utf-8') as f:
             html_content = f.read()
         
         # 替换截图占位符为实际URL
         html_content = html_content.replace(f'cid:{content_id}.png', screenshot_url)
         
-        # 6. 准备文章数据
+        # 5. 准备文章数据
         # 读取帖子数据获取摘要
         summary_file = config.RESULT_DIR / f"{content_id}_all_ai_results.json"
         with open(summary_file, 'r', encoding='utf-8') as f:
@@ -303,48 +339,45 @@ class WechatPublisher:
             'author': 'AI投资分析师'
         }
         
-        # 7. 创建草稿
+        # 6. 创建草稿
         print("\n创建草稿...")
         draft_media_id = self.create_draft(article_data, access_token)
         if not draft_media_id:
             print("创建草稿失败")
-            return False
-        
-        # 8. 发布草稿
-        print("\n提交发布任务...")
-        publish_id = self.publish_draft(draft_media_id, access_token)
-        if not publish_id:
-            print("发布任务提交失败")
-            return False
-        
-        # 9. 等待发布完成
-        success, publish_result = self.wait_for_publish_complete(publish_id, access_token)
+            return None
         
-        # 10. 保存发布记录
-        publish_record = {
-            'content_id': content_id,
-            'draft_media_id': draft_media_id,
-            'publish_id': publish_id,
-            'title': article_data['title'],
-            'create_time': datetime.now().isoformat(),
-            'status': 'published' if success else 'failed',
-            'publish_result': publish_result
+        return {
+            'media_id': draft_media_id,
+            'thumb_media_id': thumb_media_id,
+            'title': article_data['title']
         }
+    
+    def publish_created_draft(self, content_id, draft):
+        """
+        发布已创建的草稿并阻塞等待发布完成
+
+        处理队列中分为 submit_publish 和后台的 confirm_publish 两步，不使用本方法。
+        发布失败时草稿仍然保留，重试只需再调用一次本方法，
+        不必重新生成文章和上传图片。
+
+        Args:
+            content_id (str): 帖子ID
+            draft (dict): create_article_draft 返回的草稿信息
+
+        Returns:
+            bool: 是否发布成功
+        """
+        # 1. 提交发布任务
+        record = self.submit_publish(content_id, draft)
+        if not record:
+            return False
         
-        records_file = config.DATA_DIR / "publish_records.json"
-        records = []
-        if records_file.exists():
-            with open(records_file, 'r', encoding='utf-8') as f:
-                records = json.load(f)
-        
-        records.append(publish_record)
-        
-        with open(records_file, 'w', encoding='utf-8') as f:
-            json.dump(records, f, ensure_ascii=False, indent=2)
+        # 2. 等待发布完成（发布记录由 confirm_publish 更新）
+        success, publish_result = self.wait_for_publish_complete(record['publish_id'])
         
         if success:
             print(f"\n=== 发布成功！ ===")
-            print(f"文章标题: {article_data['title']}")
+            print(f"文章标题: {draft['title']}")
             print(f"发布时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
             if publish_result and 'article_detail' in publish_result:
                 items = publish_result['article_detail'].get('item', [])
@@ -355,6 +388,25 @@ class WechatPublisher:
             print("请检查草稿内容或在公众号后台查看详细错误信息")
         
         return success
+    
+    def publish_article(self, content_id):
+        """发布文章的主流程 - 生成文章、创建草稿并自动发布"""
+        print("=== 开始微信公众号发布流程 ===")
+        
+        # 生成文章
+        print("\n生成文章...")
+        generator = ArticleGenerator()
+        try:
+            html_file, screenshot_path = generator.generate_article(content_id)
+        except Exception as e:
+            print(f"生成文章失败: {e}")
+            return False
+        
+        draft = self.create_article_draft(content_id, html_file, screenshot_path)
+        if not draft:
+            return False
+        
+        return self.publish_created_draft(content_id, draft)
 
 if __name__ == "__main__":
     # 加载环境变量
@@ -365,11 +417,9 @@ if __name__ == "__main__":
     publisher = WechatPublisher()
     
     # 获取最新的content_id
-    with open(config.HISTORY_FILE, 'r', encoding='utf-8') as f:
-        history = json.load(f)
+    content_id = storage.get_last_post_id()
     
-    if history:
-        content_id = history[-1]['contentID']
+    if content_id:
         publisher.publish_article(content_id)
     else:
         print("没有可发布的内容")
\ No newline at end of file
@@ -0,0 +1,246 @@
+# wechat_token.py
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import config
+import tracing
+from wechat_api import request, WechatAPIError
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# 获取logger
+logger = logging.getLogger(__name__)
+
+# 获取 access_token 失败时的提示
+TOKEN_ERROR_HINTS = {
+    40164: "IP地址不在白名单中，请在公众号后台添加服务器IP到白名单",
+    40001: "AppSecret错误，请检查配置",
+    89503: "此IP调用需要管理员确认",
+}
+
+@contextmanager
+def _file_lock(lock_path):
+    """跨进程的排他文件锁（阻塞等待）"""
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, 'a+') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK 重试约10秒后仍未拿到锁
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+class TokenManager:
+    """
+    进程内共享的微信 access_token
+
+    微信同一时间只有一个有效的 access_token，重新获取会让之前的 token 在5分钟后失效，
+    所以所有发布器、所有进程都通过 token 文件共享同一个 token：
+      - token 缓存在内存中，token 文件被其他进程更新后（按修改时间判断）重新读取
+      - 需要刷新时只有一个线程调用 /token，其他线程等待并复用结果；
+        跨进程用文件锁串行，拿到锁后先看文件里是否已经是别的进程刚刷新的 token
+      - 后台线程在过期前 2×WECHAT_TOKEN_REFRESH_MARGIN 秒主动刷新，调用方不需要等待 /token
+
+    Args:
+        appid (str): 公众号 AppID
+        appsecret (str): 公众号 AppSecret
+        token_file (Path): token 文件，默认 data/wechat_token.json
+    """
+
+    def __init__(self, appid, appsecret, token_file=None):
+        self.appid = appid
+        self.appsecret = appsecret
+        self.token_file = token_file or config.DATA_DIR / "wechat_token.json"
+        self.lock_file = self.token_file.with_name(self.token_file.name + ".lock")
+        self._token = None
+        self._expires_at = 0.0  # time.time() 时间戳
+        self._file_mtime = None
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._stop = threading.Event()
+        self.refresh_count = 0  # 本进程调用 /token 的次数
+
+    def _is_fresh(self, expires_at, margin=None):
+        """距离过期是否还有 margin 秒以上（默认 WECHAT_TOKEN_REFRESH_MARGIN）"""
+        margin = config.WECHAT_TOKEN_REFRESH_MARGIN if margin is None else margin
+        return time.time() < expires_at - margin
+
+    def _read_file(self):
+        """读取 token 文件，返回 (token, 过期时间戳)，文件不存在或损坏时返回 (None, 0)"""
+        try:
+            mtime = os.stat(self.token_file).st_mtime
+            with open(self.token_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._file_mtime = mtime
+            return data['access_token'], datetime.fromisoformat(data['expire_time']).timestamp()
+        except FileNotFoundError:
+            return None, 0.0
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"读取access_token文件失败: {e}")
+            return None, 0.0
+
+    def _write_file(self, token, expires_in):
+        expire_time = datetime.now() + timedelta(seconds=expires_in)
+        token_data = {
+            'access_token': token,
+            'expire_time': expire_time.isoformat(),
+            'expires_in': expires_in
+        }
+        temp_file = self.token_file.with_suffix('.tmp')
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(token_data, f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, self.token_file)
+        self._file_mtime = os.stat(self.token_file).st_mtime
+        return expire_time.timestamp()
+
+    @tracing.traced("wechat.token")
+    def _fetch(self):
+        """调用 /token 获取新的 access_token，返回 (token, 有效秒数)，失败时返回 (None, 0)"""
+        if not self.appid or not self.appsecret:
+            logger.error("未配置 WECHAT_APPID / WECHAT_APPSECRET，无法获取access_token")
+            return None, 0
+        logger.info("获取新的access_token...")
+        params = {'grant_type': 'client_credential', 'appid': self.appid, 'secret': self.appsecret}
+        try:
+            data = request("token", method="GET", params=params)
+        except WechatAPIError as e:
+            # 异常信息中只有接口路径和错误类型，不含 AppSecret
+            logger.error(f"获取access_token请求失败: {e}")
+            return None, 0
+        if 'access_token' not in data:
+            hint = TOKEN_ERROR_HINTS.get(data.get('errcode'))
+            logger.error(f"获取access_token失败: {data}" + (f"（{hint}）" if hint else ""))
+            return None, 0
+        self.refresh_count += 1
+        logger.info(f"获取access_token成功，有效期：{data['expires_in']}秒")
+        return data['access_token'], data['expires_in']
+
+    def _refresh_locked(self, stale_token=None, margin=None):
+        """
+        在持有 self._lock 时刷新：先看 token 文件，仍然不可用才调用 /token
+
+        Args:
+            stale_token (str, optional): 已知失效的 token，文件中是同一个时也要重新获取
+            margin (float, optional): 文件中的 token 距离过期不足 margin 秒时重新获取
+        """
+        with _file_lock(self.lock_file):
+            token, expires_at = self._read_file()
+            if token and token != stale_token and self._is_fresh(expires_at, margin):
+                if token != self._token:
+                    logger.info("使用其他进程刚获取的access_token")
+                self._token, self._expires_at = token, expires_at
+                return token
+
+            token, expires_in = self._fetch()
+            if not token:
+                return None
+            self._expires_at = self._write_file(token, expires_in)
+            self._token = token
+            return token
+
+    def get(self):
+        """
+        获取有效的 access_token
+
+        Returns:
+            str: access_token，获取失败时返回None
+        """
+        token, expires_at = self._token, self._expires_at
+        if token and self._is_fresh(expires_at) and self._file_unchanged():
+            return token
+
+        with self._lock:
+            # 等锁期间可能已经被其他线程刷新
+            token, expires_at = self._read_file()
+            if token and self._is_fresh(expires_at):
+                self._token, self._expires_at = token, expires_at
+            else:
+                token = self._refresh_locked()
+        if token and config.WECHAT_TOKEN_BACKGROUND_REFRESH:
+            self._start_refresher()
+        return token
+
+    def invalidate(self, token):
+        """
+        接口返回 token 无效或过期时调用，下次 get() 会重新获取
+
+        多个线程同时报告同一个失效 token 时只刷新一次。
+
+        Returns:
+            str: 新的 access_token，获取失败时返回None
+        """
+        with self._lock:
+            if token != self._token and self._token and self._is_fresh(self._expires_at):
+                return self._token
+            logger.warning("access_token已失效，重新获取")
+            return self._refresh_locked(stale_token=token)
+
+    def _file_unchanged(self):
+        try:
+            return os.stat(self.token_file).st_mtime == self._file_mtime
+        except OSError:
+            return False
+
+    def _start_refresher(self):
+        if self._refresher is not None and self._refresher.is_alive():
+            return
+        with self._lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._stop.clear()
+            self._refresher = threading.Thread(target=self._refresh_loop, name="wechat-token-refresh", daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        """
+        在距离过期 2×WECHAT_TOKEN_REFRESH_MARGIN 秒时主动刷新，早于调用方按需刷新的时间，
+        发布时不需要等待 /token（失败时1分钟后重试）
+        """
+        margin = 2 * config.WECHAT_TOKEN_REFRESH_MARGIN
+        while not self._stop.is_set():
+            wait = self._expires_at - margin - time.time()
+            if wait > 0:
+                if self._stop.wait(wait):
+                    return
+                continue
+            with self._lock:
+                # 其他进程已经刷新过时直接采用文件中的 token
+                token = self._refresh_locked(margin=margin)
+            if not token and self._stop.wait(60):
+                return
+
+    def stop(self):
+        """停止后台刷新"""
+        self._stop.set()
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+def get_token_manager(appid, appsecret, token_file=None):
+    """获取公众号的 TokenManager（每个 AppID 在进程内只有一个）"""
+    with _managers_lock:
+        manager = _managers.get(appid)
+        if manager is None:
+            manager = _managers[appid] = TokenManager(appid, appsecret, token_file)
+        return manager